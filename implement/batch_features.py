@@ -0,0 +1,145 @@
+'''
+Batch feature engine: recomputes the feature columns of existing datasets straight from their raw
+path, headers and body columns, with column-wide string operations instead of a Python loop per row.
+Each raw column is factorized first: decoding (URL, HTML entities, header reprs), counts and pattern
+flags run once per distinct value, column-wide, and are broadcast back to the rows with numpy take. Results match analyze_request_har in
+log_parser_for_har4.py row for row (check with --verify).
+
+Usage:
+    python implement/batch_features.py csv_files/all_req.csv csv_files/sql_attack.csv --out-dir data/recomputed
+'''
+import argparse
+import ast
+import csv
+import os
+import re
+import sys
+
+import numpy as np
+import pandas as pd
+
+here = os.path.dirname(os.path.abspath(__file__))
+sys.path.append(os.path.join(here, '..', 'log_parsers'))
+import log_parser_for_har4 as har_parser
+from header_features import HEADER_FEATURE_COLUMNS, header_features
+from normalize import CanonicalRequest, CanonicalText
+from char_histogram import CHAR_CLASSES, CharHistogram
+from diagnostics import PROFILE_MODES, enable_profiling, stage
+
+try:
+    import pyarrow  # noqa: F401 -- the Arrow string dtype runs the column operations natively
+    STRING_DTYPE = 'string[pyarrow]'
+except ImportError:
+    STRING_DTYPE = object
+
+# All count features (characters per class) in one pass over the distinct bodies
+char_histogram = CharHistogram(CHAR_CLASSES)
+
+sql_keyword_pattern = '|'.join(re.escape(keyword.lower()) for keyword in har_parser.sql_keywords)
+# The views are already lowercased, so the patterns are too and no case-insensitive matching is needed
+xss_pattern = '|'.join(har_parser.xss_patterns).lower()
+csrf_pattern = r'\b(?:csrf_token|anti_csrf_token|xsrf_token)\b'
+
+def parse_headers(headers_repr):
+    '''
+    Turns the str(dict) repr stored in the headers column back into a dict.
+    '''
+    try:
+        headers = ast.literal_eval(headers_repr)
+    except (ValueError, SyntaxError):
+        return {}
+    return headers if isinstance(headers, dict) else {}
+
+def factorize(column, func=None):
+    '''
+    Splits a column into row codes and its distinct values, optionally mapped through func.
+    Features are computed over the distinct values and broadcast back with take(), so a payload
+    repeated across thousands of rows is decoded and matched once.
+    '''
+    codes, uniques = pd.factorize(column)
+    if func is not None:
+        uniques = [func(value) for value in uniques]
+    return codes, pd.Series(uniques, dtype=STRING_DTYPE)
+
+def take(unique_values, codes):
+    return np.asarray(unique_values, dtype=np.int64)[codes]
+
+def recompute_features(data):
+    '''
+    Returns a copy of the dataset with every feature column recomputed from path, headers and body.
+    '''
+    data = data.copy()
+    body_codes, body = factorize(data['body'].fillna('').astype(str))
+    path_codes, url_lower = factorize(data['path'].fillna('').astype(str), lambda value: CanonicalText(value).lower)
+
+    # Character counts, every class at once over the distinct bodies
+    data['body_length'] = take(body.str.len(), body_codes)
+    for feature, counts in char_histogram.count_frame(body).items():
+        data[feature] = counts[body_codes]
+
+    # SQL keywords in the decoded body
+    body_lower = pd.Series([CanonicalText(value).lower for value in body], dtype=STRING_DTYPE)
+    data['has_sql_keywords'] = take(body_lower.str.contains(sql_keyword_pattern, regex=True), body_codes)
+
+    # XSS patterns in the decoded URL and headers, CSRF token names in the headers
+    has_xss = take(url_lower.str.contains(xss_pattern, regex=True), path_codes)
+    if 'headers' in data:
+        header_codes, header_reprs = factorize(data['headers'].fillna('{}').astype(str))
+        header_dicts = [parse_headers(value) for value in header_reprs]
+        header_lower = pd.Series([CanonicalRequest('', '', headers).header_text.lower for headers in header_dicts], dtype=STRING_DTYPE)
+        has_xss |= take(header_lower.str.contains(xss_pattern, regex=True), header_codes)
+        data['has_csrf_token'] = take(header_lower.str.contains(csrf_pattern, regex=True), header_codes)
+
+        # Hashed header features, computed per distinct header set
+        unique_features = pd.DataFrame([header_features(headers) for headers in header_dicts], columns=HEADER_FEATURE_COLUMNS)
+        data[HEADER_FEATURE_COLUMNS] = unique_features.to_numpy()[header_codes]
+    data['has_xss_payload'] = has_xss
+
+    return data
+
+def verify(original, recomputed, sample_size=200, seed=0):
+    '''
+    Recomputes a random sample of rows with the per-row extractor and returns the rows that differ.
+    '''
+    mismatches = []
+    columns = ['body_length', 'has_sql_keywords', 'has_xss_payload', 'has_csrf_token'] + list(CHAR_CLASSES)
+    sample = original.sample(min(sample_size, len(original)), random_state=seed)
+    for index, row in sample.iterrows():
+        body = '' if pd.isna(row['body']) else str(row['body'])
+        body_params = [{'name': 'uid', 'value': body}] if body else []
+        headers = parse_headers(str(row.get('headers', '{}')))
+        expected = har_parser.analyze_request_har(row['method'], '' if pd.isna(row['path']) else str(row['path']), headers,
+                                                  body_params, 0, 0, har_parser.sql_keywords)
+        for column in columns:
+            if int(recomputed.at[index, column]) != int(expected[column]):
+                mismatches.append((index, column, recomputed.at[index, column], expected[column]))
+    return mismatches
+
+def main():
+    parser = argparse.ArgumentParser(description='Recompute the feature columns of existing CSV datasets.')
+    parser.add_argument('csv_files', nargs='+', help='Datasets with path, headers and body columns')
+    parser.add_argument('--out-dir', default='recomputed', help='Directory for the recomputed datasets')
+    parser.add_argument('--verify', type=int, default=0, metavar='N', help='Cross-check N random rows per file against the per-row extractor')
+    parser.add_argument('--profile', choices=PROFILE_MODES, help='Write per-stage cpu, sample or memory profiles to profiles/')
+    opts = parser.parse_args()
+    enable_profiling(opts.profile)
+
+    os.makedirs(opts.out_dir, exist_ok=True)
+    for csv_file in opts.csv_files:
+        with stage('read'):
+            data = pd.read_csv(csv_file)
+        with stage('recompute'):
+            recomputed = recompute_features(data)
+        out_file = os.path.join(opts.out_dir, os.path.basename(csv_file))
+        with stage('write'):
+            recomputed.to_csv(out_file, index=False, quoting=csv.QUOTE_NONNUMERIC)
+        print(f"[+] {csv_file}: {len(recomputed)} rows -> {out_file}")
+        if opts.verify:
+            with stage('verify'):
+                mismatches = verify(data, recomputed, opts.verify)
+            for index, column, got, expected in mismatches[:10]:
+                print(f"    mismatch row {index} {column}: batch={got} per-row={expected}")
+            print(f"    verified {min(opts.verify, len(data))} rows, {len(mismatches)} mismatches")
+
+if __name__ == '__main__':
+    main()
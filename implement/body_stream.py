@@ -0,0 +1,94 @@
+import codecs
+import os
+from normalize import CanonicalText
+
+# Bodies above this size (or without a Content-Length) are streamed instead of buffered
+STREAM_THRESHOLD = 65536
+# Bytes of a streamed body run through the detectors; the rest is passed on uninspected
+STREAM_INSPECT_LIMIT = 1048576
+# Text carried over between chunks so patterns split across a chunk boundary still match
+STREAM_WINDOW_OVERLAP = 64
+# Bytes kept from the start of a streamed body for the regular feature extraction
+STREAM_KEEP_BYTES = 65536
+
+STREAM_FEATURE_COLUMNS = ['body_stream_hits', 'body_stream_truncated']
+
+TEXT_CONTENT_TYPES = ('text/', 'application/x-www-form-urlencoded', 'multipart/form-data',
+                      'json', 'xml', 'javascript')
+
+def is_text_content(content_type):
+    '''
+    Checks whether a body of this content type is worth decoding. Bodies without a content type count as text.
+    '''
+    content_type = (content_type or '').lower()
+    return not content_type or any(text_type in content_type for text_type in TEXT_CONTENT_TYPES)
+
+def should_stream(headers):
+    '''
+    Decides from the request headers whether the body should be streamed rather than buffered.
+    '''
+    length = headers.get('content-length')
+    if length is None:
+        return 'chunked' in headers.get('transfer-encoding', '').lower()
+    return length.isdigit() and int(length) > STREAM_THRESHOLD
+
+class StreamInspector:
+    '''
+    Runs the detector pattern over a streamed body chunk by chunk, on a sliding window with overlap.
+    Memory per flow is bounded by STREAM_KEEP_BYTES plus one window, whatever the body size.
+    Instances are callables, so they can be assigned to flow.request.stream directly.
+    '''
+
+    def __init__(self, pattern, content_type=''):
+        self.pattern = pattern
+        self.is_text = is_text_content(content_type)
+        self.hits = 0
+        self.inspected = 0
+        self.truncated = False
+        self.head = bytearray()
+        self._tail = ''
+        self._seen = ''
+        self._decoder = codecs.getincrementaldecoder('utf-8')('replace')
+
+    def __call__(self, chunk):
+        self.feed(chunk)
+        return chunk
+
+    def count(self, text):
+        return sum(1 for _ in self.pattern.finditer(CanonicalText(text).collapsed))
+
+    def feed(self, chunk):
+        '''
+        Inspects one chunk of the body. Chunks past STREAM_INSPECT_LIMIT, or of a non-text body, are skipped.
+        '''
+        if not self.is_text or not chunk:
+            return
+        if len(chunk) > STREAM_INSPECT_LIMIT - self.inspected:
+            # Whatever does not fit in the limit, including a cut in the middle of this chunk, is passed on uninspected
+            self.truncated = True
+            chunk = chunk[:STREAM_INSPECT_LIMIT - self.inspected]
+            if not chunk:
+                return
+        self.inspected += len(chunk)
+        if len(self.head) < STREAM_KEEP_BYTES:
+            self.head += chunk[:STREAM_KEEP_BYTES - len(self.head)]
+
+        # Matches ending in the carried-over tail were counted with the previous chunk, only those ending past
+        # it are new. The boundary is where the canonical window stops agreeing with the canonical tail, so an
+        # escape split across the chunks counts as new text once it decodes
+        window = self._tail + self._decoder.decode(chunk)
+        collapsed = CanonicalText(window).collapsed
+        seen = len(os.path.commonprefix([self._seen, collapsed]))
+        self.hits += sum(1 for match in self.pattern.finditer(collapsed) if match.end() > seen)
+        self._tail = window[-STREAM_WINDOW_OVERLAP:]
+        self._seen = CanonicalText(self._tail).collapsed
+
+    @property
+    def text(self):
+        return self.head.decode('utf-8', 'replace') if self.is_text else ''
+
+    def features(self):
+        return {
+            'body_stream_hits': self.hits,
+            'body_stream_truncated': int(self.truncated),
+        }
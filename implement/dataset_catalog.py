@@ -0,0 +1,247 @@
+'''
+Dataset catalog: the feature CSVs in csv_files/ ingested once into a unified schema.
+
+Layout of the catalog directory:
+    catalog.json   columns, labels, sources (with their hash and duplicates) and the row blocks
+    features.f32   one float32 matrix, rows x FEATURE_COLUMNS, read back as a read-only memmap
+    labels.npy     label code per row
+    sources.npy    source code per row
+    text.csv       method, path and body per row, only read when asked for
+
+Identical files (same sha256, e.g. x.csv and http_log_with_security_analysis.csv) are ingested once.
+Columns a source lacks (response_status, response_time in the older captures) are NaN. Rows are stored
+sorted by label, then source, so every label and every (label, source) pair is one contiguous block:
+selecting such a block is a view on the memmap, nothing is copied or parsed.
+
+Build (or refresh, sources are only re-read when a file changed) the catalog with:
+    python implement/dataset_catalog.py csv_files/*.csv --out data/catalog
+'''
+import argparse
+import csv
+import hashlib
+import json
+import os
+
+import numpy as np
+import pandas as pd
+
+# Unified schema of the feature matrix
+FEATURE_COLUMNS = ['body_length', 'num_commas', 'num_hyphens', 'num_brackets', 'num_quotes', 'num_double_quotes',
+                   'num_slashes', 'num_braces', 'num_spaces', 'has_sql_keywords', 'has_xss_payload', 'has_csrf_token',
+                   'response_status', 'response_time']
+TEXT_COLUMNS = ['method', 'path', 'body']
+
+# Label of the sources without a 'nature' column, by file name
+SOURCE_LABELS = {
+    'sql_attack.csv': 'sqli',
+    'xss_attack.csv': 'xss',
+    'safe_req2.csv': 'crawl_req',
+    'safe_req3.csv': 'crawl_req',
+    'secure_req.csv': 'crawl_req',
+}
+UNLABELED = 'unlabeled'
+
+# Storage order of the labels; the attack labels sit next to each other so attacks are one block too
+LABEL_ORDER = ['crawl_req', 'sqli', 'xss']
+
+def file_hash(path):
+    sha = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for block in iter(lambda: f.read(1 << 20), b''):
+            sha.update(block)
+    return sha.hexdigest()
+
+def label_order(labels):
+    return sorted(labels, key=lambda label: (LABEL_ORDER.index(label) if label in LABEL_ORDER else len(LABEL_ORDER), label == UNLABELED, label))
+
+def read_source(path, label=None):
+    '''
+    Reads one feature CSV into the unified schema: a float32 matrix, the text columns and a label per row.
+    '''
+    data = pd.read_csv(path, low_memory=False)
+    features = data.reindex(columns=FEATURE_COLUMNS).apply(pd.to_numeric, errors='coerce').to_numpy(dtype=np.float32)
+    text = data.reindex(columns=TEXT_COLUMNS)
+    if 'nature' in data:
+        labels = data['nature'].fillna(UNLABELED).astype(str).to_numpy()
+    else:
+        labels = np.full(len(data), label or SOURCE_LABELS.get(os.path.basename(path), UNLABELED), dtype=object)
+    return features, text, labels
+
+def ingest(paths, out_dir, source_labels=None):
+    '''
+    Builds the catalog in out_dir from the feature CSVs in paths, unless it already holds exactly these files.
+    source_labels maps a file name to the label of its rows, for sources without a 'nature' column.
+    Returns the opened DatasetCatalog.
+    '''
+    source_labels = dict(SOURCE_LABELS, **(source_labels or {}))
+    manifest_path = os.path.join(out_dir, 'catalog.json')
+
+    # Deduplicating the sources by content hash
+    sources, by_hash = [], {}
+    for path in sorted(paths):
+        digest = file_hash(path)
+        name = os.path.basename(path)
+        if digest in by_hash:
+            by_hash[digest]['duplicates'].append(name)
+            continue
+        by_hash[digest] = {'name': name, 'path': path, 'sha256': digest, 'duplicates': []}
+        sources.append(by_hash[digest])
+
+    if os.path.exists(manifest_path):
+        with open(manifest_path) as f:
+            manifest = json.load(f)
+        ingested = [(source['name'], source['sha256'], source['duplicates']) for source in manifest['sources']]
+        if ingested == [(source['name'], source['sha256'], source['duplicates']) for source in sources] and \
+                manifest['columns'] == FEATURE_COLUMNS and manifest.get('source_labels') == source_labels:
+            return DatasetCatalog(out_dir)
+
+    matrices, texts, labels, source_codes = [], [], [], []
+    for code, source in enumerate(sources):
+        features, text, source_rows = read_source(source['path'], source_labels.get(source['name']))
+        source['rows'] = len(features)
+        del source['path']
+        matrices.append(features)
+        texts.append(text)
+        labels.append(source_rows)
+        source_codes.append(np.full(len(features), code, dtype=np.uint16))
+
+    features = np.concatenate(matrices) if matrices else np.empty((0, len(FEATURE_COLUMNS)), dtype=np.float32)
+    text = pd.concat(texts, ignore_index=True) if texts else pd.DataFrame(columns=TEXT_COLUMNS)
+    label_names = label_order(set(np.concatenate(labels))) if labels else []
+    label_codes = np.array([label_names.index(label) for label in np.concatenate(labels)], dtype=np.uint8) if labels else np.empty(0, dtype=np.uint8)
+    source_codes = np.concatenate(source_codes) if source_codes else np.empty(0, dtype=np.uint16)
+
+    # Sorting by label, then source, so both selections are contiguous row ranges
+    order = np.lexsort((np.arange(len(label_codes)), source_codes, label_codes))
+    features, label_codes, source_codes = features[order], label_codes[order], source_codes[order]
+    text = text.iloc[order]
+
+    blocks = []
+    for start in range(len(order)):
+        key = (int(label_codes[start]), int(source_codes[start]))
+        if blocks and (blocks[-1][0], blocks[-1][1]) == key:
+            blocks[-1][3] = start + 1
+        else:
+            blocks.append([key[0], key[1], start, start + 1])
+
+    os.makedirs(out_dir, exist_ok=True)
+    write_atomic(os.path.join(out_dir, 'features.f32'), features.tofile)
+    write_atomic(os.path.join(out_dir, 'labels.npy'), lambda path: np.save(path, label_codes))
+    write_atomic(os.path.join(out_dir, 'sources.npy'), lambda path: np.save(path, source_codes))
+    write_atomic(os.path.join(out_dir, 'text.csv'), lambda path: text.to_csv(path, index=False, quoting=csv.QUOTE_NONNUMERIC))
+    manifest = {
+        'columns': FEATURE_COLUMNS,
+        'rows': len(features),
+        'labels': label_names,
+        'sources': sources,
+        'source_labels': source_labels,
+        'blocks': [{'label': label_names[label], 'source': sources[source]['name'], 'start': start, 'stop': stop}
+                   for label, source, start, stop in blocks],
+    }
+    # The manifest goes last: a catalog is only complete once it is there
+    write_atomic(manifest_path, lambda path: write_json(path, manifest))
+    return DatasetCatalog(out_dir)
+
+def write_json(path, data):
+    with open(path, 'w') as f:
+        json.dump(data, f, indent=2)
+
+def write_atomic(path, write):
+    # np.save appends .npy to names without it, so the temporary name keeps the extension
+    root, extension = os.path.splitext(path)
+    tmp_path = root + '.tmp' + extension
+    write(tmp_path)
+    os.replace(tmp_path, path)
+
+class DatasetCatalog:
+    '''
+    Read-only view of a catalog directory built by ingest().
+    '''
+
+    def __init__(self, path):
+        self.path = path
+        with open(os.path.join(path, 'catalog.json')) as f:
+            self.manifest = json.load(f)
+        self.columns = self.manifest['columns']
+        self.label_names = self.manifest['labels']
+        self.source_names = [source['name'] for source in self.manifest['sources']]
+        self.blocks = self.manifest['blocks']
+        rows = self.manifest['rows']
+        if rows:
+            self.features = np.memmap(os.path.join(path, 'features.f32'), dtype=np.float32, mode='r', shape=(rows, len(self.columns)))
+        else:
+            self.features = np.empty((0, len(self.columns)), dtype=np.float32)
+        self.labels = np.load(os.path.join(path, 'labels.npy'), mmap_mode='r')
+        self.sources = np.load(os.path.join(path, 'sources.npy'), mmap_mode='r')
+
+    def __len__(self):
+        return len(self.features)
+
+    def ranges(self, labels=None, sources=None):
+        '''
+        Row ranges (start, stop) of the blocks with one of the labels and sources (None = all), adjacent ones merged.
+        '''
+        labels = [labels] if isinstance(labels, str) else labels
+        sources = [sources] if isinstance(sources, str) else sources
+        ranges = []
+        for block in self.blocks:
+            if (labels is None or block['label'] in labels) and (sources is None or block['source'] in sources):
+                if ranges and ranges[-1][1] == block['start']:
+                    ranges[-1][1] = block['stop']
+                else:
+                    ranges.append([block['start'], block['stop']])
+        return [tuple(rows) for rows in ranges]
+
+    def select(self, labels=None, sources=None):
+        '''
+        Feature matrix of the selected rows. A view on the memmap when they form one contiguous range
+        (a single label, a single (label, source) pair, sqli + xss, ...), a copy otherwise.
+        '''
+        ranges = self.ranges(labels, sources)
+        if not ranges:
+            return self.features[:0]
+        if len(ranges) == 1:
+            return self.features[ranges[0][0]:ranges[0][1]]
+        return np.concatenate([self.features[start:stop] for start, stop in ranges])
+
+    def frame(self, labels=None, sources=None, columns=None):
+        '''
+        The selection as a DataFrame with a 'nature' column, e.g. for setup(data=...) in the notebook.
+        '''
+        ranges = self.ranges(labels, sources)
+        data = pd.DataFrame(self.select(labels, sources), columns=self.columns, copy=False)
+        if columns is not None:
+            data = data[columns]
+        codes = np.concatenate([self.labels[start:stop] for start, stop in ranges]) if ranges else np.empty(0, dtype=np.uint8)
+        data['nature'] = np.array(self.label_names, dtype=object)[codes] if len(codes) else []
+        return data
+
+    def text(self, labels=None, sources=None):
+        '''
+        Method, path and body of the selected rows (parsed from text.csv on every call).
+        '''
+        text = pd.read_csv(os.path.join(self.path, 'text.csv'), dtype=str, keep_default_na=False)
+        rows = np.concatenate([np.arange(start, stop) for start, stop in self.ranges(labels, sources)] or [np.empty(0, dtype=int)])
+        return text.iloc[rows].reset_index(drop=True)
+
+    def summary(self):
+        counts = {}
+        for block in self.blocks:
+            counts.setdefault(block['label'], {})[block['source']] = block['stop'] - block['start']
+        return counts
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Ingest feature CSVs into the memory-mapped dataset catalog')
+    parser.add_argument('csv_files', nargs='+', help='Feature CSVs, e.g. csv_files/*.csv')
+    parser.add_argument('--out', default='data/catalog', help='Catalog directory')
+    parser.add_argument('--label', action='append', default=[], metavar='FILE=LABEL',
+                        help='Label of the rows of a file without a nature column (repeatable)')
+    args = parser.parse_args()
+
+    catalog = ingest(args.csv_files, args.out, dict(item.split('=', 1) for item in args.label))
+    for source in catalog.manifest['sources']:
+        duplicates = ' (also {})'.format(', '.join(source['duplicates'])) if source['duplicates'] else ''
+        print('{:<40} {:>7} rows{}'.format(source['name'], source['rows'], duplicates))
+    for label, sources in catalog.summary().items():
+        print('{:<12} {:>7} rows'.format(label, sum(sources.values())))
+    print('{} rows x {} features in {}'.format(len(catalog), len(catalog.columns), args.out))
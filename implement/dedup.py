@@ -0,0 +1,89 @@
+'''
+Near-duplicate elimination for training datasets with MinHash signatures and LSH banding.
+Spider and fuzzer captures repeat the same request with only the payload changed; each group of
+near-duplicates is reduced to one representative row carrying the group size in a weight column.
+Work is linear in the number of tokens: one signature per row, one bucket insert per band.
+'''
+import re
+import zlib
+
+import numpy as np
+import pandas as pd
+
+NUM_PERM = 64            # MinHash permutations per signature
+LSH_BANDS = 16           # NUM_PERM must be LSH_BANDS * rows per band
+SIMILARITY = 0.8         # Estimated Jaccard similarity for two rows to count as near-duplicates
+SHINGLE_SIZE = 3         # Tokens per shingle
+
+MERSENNE_PRIME = (1 << 61) - 1
+token_pattern = re.compile(r'\w+|[^\w\s]')
+
+rng = np.random.RandomState(1)
+perm_a = rng.randint(1, 1 << 30, size=NUM_PERM).astype(np.uint64)
+perm_b = rng.randint(0, 1 << 30, size=NUM_PERM).astype(np.uint64)
+
+def shingles(text):
+    '''
+    Splits text into overlapping SHINGLE_SIZE-token shingles.
+    '''
+    tokens = token_pattern.findall(text.lower())
+    if len(tokens) <= SHINGLE_SIZE:
+        return {' '.join(tokens)}
+    return {' '.join(tokens[i:i + SHINGLE_SIZE]) for i in range(len(tokens) - SHINGLE_SIZE + 1)}
+
+def minhash(text):
+    '''
+    MinHash signature of the shingle set of text, one minimum per permutation.
+    '''
+    hashes = np.fromiter((zlib.crc32(shingle.encode('utf-8', 'replace')) for shingle in shingles(text)), dtype=np.uint64)
+    # (a * x + b) mod p for every permutation and shingle at once; the operands stay below 2**62
+    permuted = (perm_a[:, None] * hashes[None, :] + perm_b[:, None]) % MERSENNE_PRIME
+    return permuted.min(axis=1)
+
+def find(parent, i):
+    while parent[i] != i:
+        parent[i] = parent[parent[i]]
+        i = parent[i]
+    return i
+
+def near_duplicate_groups(texts):
+    '''
+    Returns a group id per text; texts whose signatures collide in an LSH band and agree on at least
+    SIMILARITY of their permutations share a group.
+    '''
+    signatures = np.array([minhash(text) for text in texts]) if len(texts) else np.empty((0, NUM_PERM), dtype=np.uint64)
+    rows_per_band = NUM_PERM // LSH_BANDS
+    parent = list(range(len(texts)))
+
+    for band in range(LSH_BANDS):
+        buckets = {}
+        band_slice = signatures[:, band * rows_per_band:(band + 1) * rows_per_band]
+        for i, key in enumerate(map(bytes, band_slice)):
+            first = buckets.setdefault(key, i)
+            if first == i:
+                continue
+            root_i, root_first = find(parent, i), find(parent, first)
+            if root_i != root_first and (signatures[i] == signatures[first]).mean() >= SIMILARITY:
+                parent[root_i] = root_first
+
+    return np.array([find(parent, i) for i in range(len(texts))], dtype=np.int64)
+
+def deduplicate(data, label_column='nature'):
+    '''
+    Keeps one representative row (the first) per near-duplicate group of path + body, within each label,
+    and records the group size in a 'weight' column.
+    '''
+    texts = (data['path'].fillna('').astype(str) + ' ' + data['body'].fillna('').astype(str)).tolist()
+    groups = near_duplicate_groups(texts)
+    if label_column in data:
+        # Rows with different labels never merge
+        keys = pd.Series(data[label_column].astype(str).values + ':' + groups.astype(str))
+    else:
+        keys = pd.Series(groups)
+    keys.index = data.index
+
+    weights = keys.map(keys.value_counts())
+    representatives = ~keys.duplicated()
+    deduped = data[representatives.values].copy()
+    deduped['weight'] = weights[representatives.values].values
+    return deduped.reset_index(drop=True)
@@ -0,0 +1,311 @@
+'''
+Shared diagnostics for the parsers, the interceptor and burpy: leveled, rate-limited logging and
+switchable per-stage profiling.
+
+Logging
+    log = get_logger(__name__), then log.debug('Analyzing request: %s %s', method, url).
+    The level comes from WAF_LOG_LEVEL (DEBUG, INFO, WARNING, ERROR; default INFO). Debug messages are
+    formatted only when enabled, and each call site is limited to DEBUG_BURST messages per
+    DEBUG_INTERVAL seconds; the number of suppressed messages is reported when the next window opens.
+
+Profiling
+    Code is split into named stages with `with stage('featurize'):` or the @profiled('featurize') decorator.
+    WAF_PROFILE (or enable_profiling(), e.g. from a --profile flag) selects a mode:
+        cpu     one cProfile per stage: <dir>/cpu-<stage>.prof plus cpu-report.txt
+        sample  low-overhead stack sampling every SAMPLE_INTERVAL seconds: <dir>/sample-<stage>.folded
+                (flamegraph input) plus sample-report.txt
+        memory  tracemalloc: bytes allocated per stage in memory-report.txt, plus the top allocation sites
+    Reports go to WAF_PROFILE_DIR (default 'profiles') at exit, or when write_reports() is called.
+    Without a mode, a stage costs one attribute check.
+
+Kept Python 2 compatible for burpy (the memory mode needs Python 3).
+'''
+import atexit
+import cProfile
+import logging
+import os
+import pstats
+import sys
+import threading
+import time
+
+try:
+    import tracemalloc
+except ImportError:
+    tracemalloc = None
+
+DEBUG_BURST = 20         # Debug messages per call site and window
+DEBUG_INTERVAL = 10.0    # Seconds per window
+SAMPLE_INTERVAL = 0.005  # Seconds between stack samples in sample mode
+SAMPLE_DEPTH = 40        # Frames kept per sampled stack
+REPORT_TOP = 25          # Entries per stage in the text reports
+
+PROFILE_MODES = ('cpu', 'sample', 'memory')
+
+class RateLimitFilter(logging.Filter):
+    '''
+    Lets at most DEBUG_BURST debug records per call site through per DEBUG_INTERVAL seconds.
+    '''
+
+    def __init__(self):
+        logging.Filter.__init__(self)
+        self.windows = {}
+
+    def filter(self, record):
+        if record.levelno > logging.DEBUG:
+            return True
+        site = (record.pathname, record.lineno)
+        now = time.time()
+        start, count, suppressed = self.windows.get(site, (now, 0, 0))
+        if now - start >= DEBUG_INTERVAL:
+            if suppressed:
+                record.msg = '({} similar debug messages suppressed) {}'.format(suppressed, record.msg)
+            start, count, suppressed = now, 0, 0
+        if count < DEBUG_BURST:
+            self.windows[site] = (start, count + 1, suppressed)
+            return True
+        self.windows[site] = (start, count, suppressed + 1)
+        return False
+
+handler = logging.StreamHandler(sys.stdout)
+handler.setFormatter(logging.Formatter('%(message)s'))
+handler.addFilter(RateLimitFilter())
+root_logger = logging.getLogger('waf')
+root_logger.addHandler(handler)
+root_logger.setLevel(os.environ.get('WAF_LOG_LEVEL', 'INFO').upper())
+root_logger.propagate = False
+
+def get_logger(name):
+    '''
+    Returns a logger below the shared 'waf' logger, e.g. get_logger(__name__).
+    '''
+    return root_logger.getChild(name.rpartition('.')[2])
+
+def set_level(level):
+    root_logger.setLevel(level.upper() if isinstance(level, str) else level)
+
+log = get_logger('diagnostics')
+
+class Profiler(object):
+    '''
+    Base of the profiling modes. Keeps the stack of active stages of every thread.
+    '''
+
+    def __init__(self, out_dir):
+        self.out_dir = out_dir
+        self.local = threading.local()
+        self.active = {}  # thread id -> stage stack, read by the sampler thread
+
+    def stack(self):
+        stack = getattr(self.local, 'stack', None)
+        if stack is None:
+            stack = self.local.stack = []
+            self.active[threading.current_thread().ident] = stack
+        return stack
+
+    def enter(self, name):
+        self.stack().append(name)
+
+    def exit(self, name):
+        self.stack().pop()
+
+    def path(self, filename):
+        return os.path.join(self.out_dir, filename)
+
+class CpuProfiler(Profiler):
+    '''
+    One cProfile.Profile per stage; a nested stage pauses the profile of the stage around it.
+    Only one profile can run at a time, stage runs that overlap a running one in another thread are skipped.
+    '''
+
+    def __init__(self, out_dir):
+        Profiler.__init__(self, out_dir)
+        self.profiles = {}
+        self.skipped = 0
+
+    def enter(self, name):
+        stack = self.stack()
+        if stack and stack[-1][1]:
+            stack[-1][1].disable()
+        profile = self.profiles.setdefault(name, cProfile.Profile())
+        try:
+            profile.enable()
+        except ValueError:
+            # Another profile is running in another thread
+            profile = None
+            self.skipped += 1
+        stack.append((name, profile))
+
+    def exit(self, name):
+        stack = self.stack()
+        _, profile = stack.pop()
+        if profile:
+            profile.disable()
+        if stack and stack[-1][1]:
+            try:
+                stack[-1][1].enable()
+            except ValueError:
+                stack[-1] = (stack[-1][0], None)
+
+    def report(self):
+        with open(self.path('cpu-report.txt'), 'w') as f:
+            f.write('Stage runs skipped while another stage was profiled: {}\n'.format(self.skipped))
+            for name, profile in sorted(self.profiles.items()):
+                profile.dump_stats(self.path('cpu-{}.prof'.format(name)))
+                f.write('\n==== stage {} ====\n'.format(name))
+                stats = pstats.Stats(profile, stream=f)
+                stats.sort_stats('cumulative').print_stats(REPORT_TOP)
+
+class SamplingProfiler(Profiler):
+    '''
+    Samples the stack of every thread inside a stage every SAMPLE_INTERVAL seconds from a background thread.
+    Costs nothing in the profiled code besides the stage bookkeeping.
+    '''
+
+    def __init__(self, out_dir):
+        Profiler.__init__(self, out_dir)
+        self.samples = {}  # stage -> {folded stack: count}
+        self.running = True
+        thread = threading.Thread(target=self.run, name='diagnostics-sampler')
+        thread.daemon = True
+        thread.start()
+
+    def run(self):
+        own = threading.current_thread().ident
+        while self.running:
+            time.sleep(SAMPLE_INTERVAL)
+            for thread_id, frame in sys._current_frames().items():
+                stack = self.active.get(thread_id)
+                if thread_id == own or not stack:
+                    continue
+                try:
+                    current = stack[-1]
+                except IndexError:
+                    # The stage ended since the check
+                    continue
+                names = []
+                while frame is not None and len(names) < SAMPLE_DEPTH:
+                    code = frame.f_code
+                    names.append('{}:{}'.format(os.path.basename(code.co_filename), code.co_name))
+                    frame = frame.f_back
+                folded = ';'.join(reversed(names))
+                counts = self.samples.setdefault(current, {})
+                counts[folded] = counts.get(folded, 0) + 1
+
+    def report(self):
+        self.running = False
+        with open(self.path('sample-report.txt'), 'w') as f:
+            for name, counts in sorted(list(self.samples.items())):
+                total = sum(counts.values())
+                with open(self.path('sample-{}.folded'.format(name)), 'w') as folded:
+                    for stack, count in counts.items():
+                        folded.write('{} {}\n'.format(stack, count))
+                # Self time per function: the leaf of every sampled stack
+                leaves = {}
+                for stack, count in counts.items():
+                    leaf = stack.rpartition(';')[2]
+                    leaves[leaf] = leaves.get(leaf, 0) + count
+                f.write('\n==== stage {} ({} samples, ~{:.1f} s) ====\n'.format(name, total, total * SAMPLE_INTERVAL))
+                for leaf, count in sorted(leaves.items(), key=lambda item: -item[1])[:REPORT_TOP]:
+                    f.write('{:6.1f}%  {}\n'.format(100.0 * count / total, leaf))
+
+class MemoryProfiler(Profiler):
+    '''
+    Attributes the traced memory growth (tracemalloc) to the stage that was running, and reports the
+    top allocation sites of a final snapshot.
+    '''
+
+    def __init__(self, out_dir):
+        Profiler.__init__(self, out_dir)
+        if tracemalloc is None:
+            raise RuntimeError('The memory profiling mode needs Python 3 (tracemalloc)')
+        tracemalloc.start(SAMPLE_DEPTH)
+        self.allocated = {}  # stage -> [runs, net bytes, largest peak above the start]
+        self.lock = threading.Lock()
+
+    def enter(self, name):
+        current, _ = tracemalloc.get_traced_memory()
+        self.stack().append((name, current))
+
+    def exit(self, name):
+        _, start = self.stack().pop()
+        current, peak = tracemalloc.get_traced_memory()
+        with self.lock:
+            totals = self.allocated.setdefault(name, [0, 0, 0])
+            totals[0] += 1
+            totals[1] += current - start
+            totals[2] = max(totals[2], peak - start)
+
+    def report(self):
+        snapshot = tracemalloc.take_snapshot()
+        with open(self.path('memory-report.txt'), 'w') as f:
+            f.write('{:<20} {:>10} {:>16} {:>16}\n'.format('stage', 'runs', 'net bytes', 'max peak bytes'))
+            for name, (runs, net, peak) in sorted(self.allocated.items()):
+                f.write('{:<20} {:>10} {:>16} {:>16}\n'.format(name, runs, net, peak))
+            f.write('\n==== top allocation sites ====\n')
+            for statistic in snapshot.statistics('lineno')[:REPORT_TOP]:
+                f.write('{}\n'.format(statistic))
+        snapshot.dump(self.path('memory.snapshot'))
+
+profiler = None
+
+def enable_profiling(mode, out_dir=None):
+    '''
+    Switches profiling on for the rest of the process (mode: cpu, sample or memory).
+    '''
+    global profiler
+    if not mode:
+        return
+    if mode not in PROFILE_MODES:
+        raise ValueError('Unknown profiling mode {!r}, expected one of {}'.format(mode, ', '.join(PROFILE_MODES)))
+    if profiler is not None:
+        return
+    out_dir = out_dir or os.environ.get('WAF_PROFILE_DIR', 'profiles')
+    if not os.path.isdir(out_dir):
+        os.makedirs(out_dir)
+    profiler = {'cpu': CpuProfiler, 'sample': SamplingProfiler, 'memory': MemoryProfiler}[mode](out_dir)
+    atexit.register(write_reports)
+    log.info('[diagnostics] %s profiling enabled, reports go to %s', mode, out_dir)
+
+def write_reports():
+    '''
+    Writes the report of the active profiling mode (also run at exit).
+    '''
+    if profiler is not None:
+        profiler.report()
+        log.info('[diagnostics] profile reports written to %s', profiler.out_dir)
+
+class stage(object):
+    '''
+    Context manager marking a named stage for the profilers.
+    '''
+
+    def __init__(self, name):
+        self.name = name
+
+    def __enter__(self):
+        if profiler is not None:
+            profiler.enter(self.name)
+        return self
+
+    def __exit__(self, *exc_info):
+        if profiler is not None:
+            profiler.exit(self.name)
+        return False
+
+def profiled(name):
+    '''
+    Decorator running every call of the function as the stage name.
+    '''
+    def decorate(func):
+        def wrapper(*args, **kwargs):
+            if profiler is None:
+                return func(*args, **kwargs)
+            with stage(name):
+                return func(*args, **kwargs)
+        wrapper.__name__ = func.__name__
+        wrapper.__doc__ = func.__doc__
+        return wrapper
+    return decorate
+
+enable_profiling(os.environ.get('WAF_PROFILE'))
@@ -0,0 +1,242 @@
+'''
+Per-endpoint baselines of normal traffic, keyed by host + method + path template.
+
+Each profile keeps a few fixed-size running statistics over the parameter values seen on the endpoint:
+a log2 histogram of value lengths (for percentiles), a histogram of the character classes the values
+contain, and the set of parameter names. A request is scored against the profile of its own endpoint
+with one dict lookup, so /doLogin is judged by what logins look like and /search.jsp by what searches look like.
+Profiles are built from the raw requests of the captures, keyed and parametrized exactly as the interceptor
+does it on live flows (query string plus form, JSON or multipart body, see param_scanner.py).
+
+Build the index from captures of normal traffic (HAR or Burp XML) with:
+    python implement/endpoint_profiles.py request_logs/safe_req2.har request_logs/safe_req3.har --out models/endpoint_profiles.json
+'''
+import argparse
+import json
+import os
+import re
+import urllib.parse
+
+from param_scanner import extract_params
+from score_logs import read_log
+
+MAX_ENDPOINTS = 10000      # Profiles kept; requests to new endpoints past this are scored as unknown
+MAX_PARAM_NAMES = 256      # Parameter names remembered per endpoint; past this, unseen names are not scored
+MIN_SAMPLES = 20           # Parameter values an endpoint needs before its profile is used for scoring
+LENGTH_BINS = 17           # log2 length bins: 0, 1, 2-3, 4-7, ..., 32768+
+LONG_PERCENTILE = 0.99     # Values in a length bin above this percentile of the endpoint count as long
+RARE_CLASS_SHARE = 0.01    # Character classes found in fewer values than this share count as rare
+
+# Character classes; a value scores one point per class that is rare on its endpoint
+CHAR_CLASSES = [
+    ('lower', 'abcdefghijklmnopqrstuvwxyz'),
+    ('upper', 'ABCDEFGHIJKLMNOPQRSTUVWXYZ'),
+    ('digit', '0123456789'),
+    ('space', ' \t\r\n\x0b\x0c'),
+    ('quote', '\'"`'),
+    ('angle', '<>'),
+    ('bracket', '()[]{}'),
+    ('sql', ';-#*='),
+    ('slash', '/\\'),
+    ('encoding', '%&+'),
+    ('punct', '!$,.:?@^_|~'),
+]
+NON_ASCII = len(CHAR_CLASSES)
+NUM_CLASSES = NON_ASCII + 2  # The ASCII classes above, non-ASCII, and control characters
+
+# str.translate table mapping every ASCII character to a one-character class code (control characters
+# fall in the last class); non-ASCII characters are left as they are and end up in NON_ASCII
+class_codes = {ord(char): chr(0xE000 + i) for i, (_, chars) in enumerate(CHAR_CLASSES) for char in chars}
+class_table = {code: class_codes.get(code, chr(0xE000 + NUM_CLASSES - 1)) for code in range(128)}
+class_index = {chr(0xE000 + i): i for i in range(NUM_CLASSES)}
+
+PROFILE_FEATURE_COLUMNS = ['profile_known', 'profile_score', 'profile_unseen_params']
+
+# Path segments replaced by a placeholder, so /item/17 and /item/42 share one profile
+segment_patterns = [
+    (re.compile(r'^\d+$'), '{int}'),
+    (re.compile(r'^[0-9a-fA-F]{8}-[0-9a-fA-F]{4}-[0-9a-fA-F]{4}-[0-9a-fA-F]{4}-[0-9a-fA-F]{12}$'), '{uuid}'),
+    (re.compile(r'^[0-9a-fA-F]{16,}$'), '{hex}'),
+    (re.compile(r'^(?=.*\d)[\w-]{24,}$'), '{token}'),
+]
+
+def path_template(path):
+    '''
+    Strips the query string and replaces id-like path segments with placeholders.
+    '''
+    path = path.partition('?')[0].partition('#')[0] or '/'
+    segments = path.split('/')
+    for i, segment in enumerate(segments):
+        for pattern, placeholder in segment_patterns:
+            if pattern.match(segment):
+                segments[i] = placeholder
+                break
+    return '/'.join(segments)
+
+def endpoint_key(host, method, path):
+    '''
+    Endpoint key of a request; host is the hostname the client asked for, without the port: mitmproxy's
+    request.pretty_host (the Host header's) in the interceptor, the URL's hostname for captured requests.
+    '''
+    return '{} {}{}'.format(method.upper(), host.lower(), path_template(path))
+
+def url_endpoint_key(method, url):
+    '''
+    Endpoint key of a full URL, the same key as the interceptor's for the request.
+    '''
+    parts = urllib.parse.urlsplit(url)
+    return endpoint_key(parts.hostname or '', method, parts.path)
+
+def length_bin(length):
+    return min(length.bit_length(), LENGTH_BINS - 1)
+
+def char_classes(value):
+    '''
+    Returns the set of character class indexes present in the value.
+    '''
+    return {class_index.get(code, NON_ASCII) for code in set(value.translate(class_table))}
+
+class EndpointProfile:
+    '''
+    Running statistics of one endpoint. Every field has a fixed size (names are capped), and all counts
+    are weights, so sampled traffic can be folded in with the weight of the traffic it stands for.
+    '''
+
+    def __init__(self, samples=0.0, lengths=None, classes=None, names=None, names_full=False):
+        self.samples = samples
+        self.lengths = lengths or [0.0] * LENGTH_BINS
+        self.classes = classes or [0.0] * NUM_CLASSES
+        self.names = set(names or ())
+        self.names_full = names_full
+
+    def update(self, params, weight=1.0):
+        for name, value in params:
+            self.samples += weight
+            self.lengths[length_bin(len(value))] += weight
+            for char_class in char_classes(value):
+                self.classes[char_class] += weight
+            if name not in self.names:
+                if len(self.names) < MAX_PARAM_NAMES:
+                    self.names.add(name)
+                else:
+                    self.names_full = True
+
+    def length_percentile(self, q):
+        '''
+        Returns the length bin holding the q-th percentile of the value lengths.
+        '''
+        threshold = q * self.samples
+        cumulative = 0.0
+        for i, count in enumerate(self.lengths):
+            cumulative += count
+            if cumulative >= threshold:
+                return i
+        return LENGTH_BINS - 1
+
+    def score(self, params):
+        '''
+        Scores the parameters against the profile: per value, one point for a length above LONG_PERCENTILE,
+        one per rare character class and one for an unseen parameter name. Returns the worst value's score
+        and the number of unseen names.
+        '''
+        long_bin = self.length_percentile(LONG_PERCENTILE)
+        rare = {i for i, count in enumerate(self.classes) if count < RARE_CLASS_SHARE * self.samples}
+        worst = 0
+        unseen = 0
+        for name, value in params:
+            score = int(length_bin(len(value)) > long_bin) + len(char_classes(value) & rare)
+            if not self.names_full and name not in self.names:
+                unseen += 1
+                score += 1
+            worst = max(worst, score)
+        return worst, unseen
+
+    def to_dict(self):
+        return {'samples': self.samples, 'lengths': self.lengths, 'classes': self.classes,
+                'names': sorted(self.names), 'names_full': self.names_full}
+
+class ProfileIndex:
+    '''
+    Hash index of endpoint profiles. Lookup, scoring and update cost one dict access plus the work on
+    the request's own parameters, independent of how much traffic has been seen.
+    '''
+
+    def __init__(self, profiles=None, checkpoint_path=None, checkpoint_every=1000):
+        self.profiles = profiles or {}
+        self.checkpoint_path = checkpoint_path
+        self.checkpoint_every = checkpoint_every
+        self.n_updates = 0
+
+    @classmethod
+    def load(cls, path, **kwargs):
+        with open(path, encoding='utf-8') as f:
+            data = json.load(f)
+        return cls({key: EndpointProfile(**profile) for key, profile in data.items()}, **kwargs)
+
+    def save(self, path=None):
+        '''
+        Writes the index atomically, so a crash mid-write never leaves a truncated file behind.
+        '''
+        path = path or self.checkpoint_path
+        tmp_path = path + '.tmp'
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump({key: profile.to_dict() for key, profile in self.profiles.items()}, f)
+        os.replace(tmp_path, path)
+
+    def __len__(self):
+        return len(self.profiles)
+
+    def score(self, key, params):
+        '''
+        Returns the profile features of a request (see PROFILE_FEATURE_COLUMNS). Requests to endpoints
+        without a usable profile get profile_known = 0 and a score of 0.
+        '''
+        profile = self.profiles.get(key)
+        if profile is None or profile.samples < MIN_SAMPLES:
+            return {'profile_known': 0, 'profile_score': 0, 'profile_unseen_params': 0}
+        score, unseen = profile.score(params)
+        return {'profile_known': 1, 'profile_score': score, 'profile_unseen_params': unseen}
+
+    def update(self, key, params, weight=1.0):
+        '''
+        Folds the parameters of a request judged normal into the profile of its endpoint.
+        '''
+        profile = self.profiles.get(key)
+        if profile is None:
+            if len(self.profiles) >= MAX_ENDPOINTS:
+                return
+            profile = self.profiles[key] = EndpointProfile()
+        profile.update(params, weight)
+
+        self.n_updates += 1
+        if self.checkpoint_path and self.n_updates % self.checkpoint_every == 0:
+            self.save()
+
+def request_params(url, body, content_type=''):
+    '''
+    Parameters of a raw request, as the interceptor extracts them: query string, then the body.
+    '''
+    return list(extract_params(url.partition('?')[2].partition('#')[0], body, content_type))
+
+def build_index(logs):
+    '''
+    Builds the index from the requests of captures of normal traffic (HAR or Burp XML, see score_logs.py).
+    '''
+    index = ProfileIndex()
+    for path in logs:
+        for method, url, headers, body, content_type, status, time in read_log(path):
+            index.update(url_endpoint_key(method, url), request_params(url, body, content_type))
+    return index
+
+def main():
+    parser = argparse.ArgumentParser(description='Build the per-endpoint profile index from captures of normal traffic.')
+    parser.add_argument('logs', nargs='+', help='HAR captures and Burp XML exports of normal traffic (no attack captures)')
+    parser.add_argument('--out', default='models/endpoint_profiles.json', help='Output index path')
+    opts = parser.parse_args()
+
+    index = build_index(opts.logs)
+    index.save(opts.out)
+    print(f"[+] {len(index)} endpoint profiles written to {opts.out}")
+
+if __name__ == '__main__':
+    main()
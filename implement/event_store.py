@@ -0,0 +1,182 @@
+'''
+Embedded event store for flows, verdicts and scanner findings, backed by SQLite in WAL mode.
+
+record() only puts the event on a bounded queue; a background thread writes the queue out in batches,
+one transaction per batch, and applies the retention limits. The caller never waits on the disk, and
+the cost of an insert does not grow with the history kept. Readers (the CLI below, sqlite3, pandas)
+can query the database while the writer is running.
+
+Query recent incidents with:
+    python implement/event_store.py data/events.db --verdict intrusion --since 24
+
+Kept Python 2 compatible, so burpy can record its findings in the same store.
+'''
+import json
+import optparse
+import sqlite3
+import threading
+import time
+
+try:
+    import queue
+except ImportError:
+    import Queue as queue
+
+SCHEMA = '''
+CREATE TABLE IF NOT EXISTS events (
+    id INTEGER PRIMARY KEY,
+    ts REAL NOT NULL,
+    source TEXT,
+    host TEXT,
+    method TEXT,
+    path TEXT,
+    verdict TEXT,
+    cluster TEXT,
+    score REAL,
+    duration_ms REAL,
+    features TEXT,
+    timings TEXT,
+    detail TEXT
+);
+CREATE INDEX IF NOT EXISTS events_ts ON events (ts);
+CREATE INDEX IF NOT EXISTS events_host ON events (host, ts);
+CREATE INDEX IF NOT EXISTS events_cluster ON events (cluster, ts);
+'''
+
+COLUMNS = ['ts', 'source', 'host', 'method', 'path', 'verdict', 'cluster', 'score', 'duration_ms', 'features', 'timings', 'detail']
+JSON_COLUMNS = ('features', 'timings')
+INSERT = 'INSERT INTO events ({}) VALUES ({})'.format(', '.join(COLUMNS), ', '.join('?' * len(COLUMNS)))
+
+class EventStore(object):
+    '''
+    Batched, non-blocking writer for the events table.
+    Events beyond max_queue waiting events are dropped (and counted) rather than slowing the caller down.
+    Retention: rows older than max_age seconds, and the oldest rows beyond max_rows, are deleted
+    every retention_every batches.
+    '''
+
+    def __init__(self, path, batch_size=256, flush_interval=1.0, max_queue=10000,
+                 max_rows=None, max_age=None, retention_every=100):
+        self.path = path
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.max_rows = max_rows
+        self.max_age = max_age
+        self.retention_every = retention_every
+        self.written = 0
+        self.dropped = 0
+        self.n_batches = 0
+        self._queue = queue.Queue(max_queue)
+        self._stop = object()
+
+        # Creating the schema up front, so a bad path fails at start-up and not in the writer thread
+        connection = self.connect()
+        connection.executescript(SCHEMA)
+        connection.close()
+
+        self._thread = threading.Thread(target=self._run, name='event-store-writer')
+        self._thread.daemon = True
+        self._thread.start()
+
+    def connect(self):
+        connection = sqlite3.connect(self.path, timeout=30)
+        connection.execute('PRAGMA journal_mode=WAL')
+        connection.execute('PRAGMA synchronous=NORMAL')
+        return connection
+
+    def record(self, **event):
+        '''
+        Queues one event (keyword arguments named after COLUMNS). Never blocks.
+        '''
+        event.setdefault('ts', time.time())
+        try:
+            self._queue.put_nowait(event)
+        except queue.Full:
+            self.dropped += 1
+
+    def pending(self):
+        return self._queue.qsize()
+
+    def close(self, timeout=10):
+        '''
+        Writes out everything still queued and stops the writer thread.
+        '''
+        self._queue.put(self._stop)
+        self._thread.join(timeout)
+
+    def _run(self):
+        connection = self.connect()
+        stopping = False
+        while not stopping:
+            batch = []
+            deadline = time.time() + self.flush_interval
+            while len(batch) < self.batch_size:
+                try:
+                    event = self._queue.get(timeout=max(0.0, deadline - time.time()))
+                except queue.Empty:
+                    break
+                if event is self._stop:
+                    stopping = True
+                    break
+                batch.append(event)
+            if batch:
+                self._write(connection, batch)
+        connection.close()
+
+    def _write(self, connection, batch):
+        rows = []
+        for event in batch:
+            for column in JSON_COLUMNS:
+                if event.get(column) is not None and not isinstance(event[column], str):
+                    event[column] = json.dumps(event[column], default=str)
+            rows.append(tuple(event.get(column) for column in COLUMNS))
+        with connection:
+            connection.executemany(INSERT, rows)
+        self.written += len(rows)
+
+        self.n_batches += 1
+        if self.n_batches % self.retention_every == 0:
+            self.apply_retention(connection)
+
+    def apply_retention(self, connection):
+        with connection:
+            if self.max_age:
+                connection.execute('DELETE FROM events WHERE ts < ?', (time.time() - self.max_age,))
+            if self.max_rows:
+                connection.execute('DELETE FROM events WHERE id <= (SELECT MAX(id) FROM events) - ?', (self.max_rows,))
+
+def query(path, verdict=None, host=None, cluster=None, since=None, limit=50):
+    '''
+    Returns the most recent events matching the filters, as dicts. since is in hours.
+    '''
+    clauses, params = [], []
+    for column, value in (('verdict', verdict), ('host', host), ('cluster', cluster)):
+        if value is not None:
+            clauses.append('{} = ?'.format(column))
+            params.append(value)
+    if since is not None:
+        clauses.append('ts >= ?')
+        params.append(time.time() - since * 3600)
+    sql = 'SELECT * FROM events{} ORDER BY ts DESC LIMIT ?'.format(' WHERE ' + ' AND '.join(clauses) if clauses else '')
+    connection = sqlite3.connect(path)
+    connection.row_factory = sqlite3.Row
+    try:
+        return [dict(row) for row in connection.execute(sql, params + [limit])]
+    finally:
+        connection.close()
+
+if __name__ == '__main__':
+    parser = optparse.OptionParser(usage='python event_store.py <events.db> [options]')
+    parser.add_option('--verdict', help='Only events with this verdict (intrusion, anomaly, normal, clean, finding)')
+    parser.add_option('--host', help='Only events for this host')
+    parser.add_option('--cluster', help='Only events assigned to this cluster, e.g. "Cluster 3"')
+    parser.add_option('--since', type='float', help='Only events from the last SINCE hours')
+    parser.add_option('--limit', type='int', default=50, help='Number of events shown')
+    (opts, args) = parser.parse_args()
+    if len(args) != 1:
+        parser.print_help()
+        exit(1)
+    for event in query(args[0], opts.verdict, opts.host, opts.cluster, opts.since, opts.limit):
+        print('{} {:<16} {:<10} {:<10} {} {} {}'.format(
+            time.strftime('%Y-%m-%d %H:%M:%S', time.localtime(event['ts'])), event['source'] or '',
+            event['verdict'] or '', event['cluster'] or '', event['method'] or '', event['host'] or '', event['path'] or ''))
@@ -0,0 +1,46 @@
+import zlib
+
+# Number of hashed buckets for header names and selected header values
+HEADER_HASH_BUCKETS = 32
+
+# Headers whose values are hashed together with their name (lowercase)
+HASHED_VALUE_HEADERS = ('content-type', 'accept', 'accept-encoding', 'x-requested-with', 'origin')
+
+HEADER_FEATURE_COLUMNS = ['header_count', 'header_total_length', 'header_max_value_length', 'cookie_count'] + \
+    ['header_hash_{}'.format(i) for i in range(HEADER_HASH_BUCKETS)]
+
+def hash_bucket(token):
+    '''
+    Maps a string to a hash bucket. crc32 is used instead of hash() so buckets are stable across processes.
+    '''
+    return zlib.crc32(token.encode('utf-8', 'replace')) % HEADER_HASH_BUCKETS
+
+def header_features(request_headers):
+    '''
+    Turns a dict of request headers into a fixed-width numeric feature dict (see HEADER_FEATURE_COLUMNS).
+    '''
+    buckets = [0] * HEADER_HASH_BUCKETS
+    total_length = 0
+    max_value_length = 0
+    cookie_count = 0
+
+    for name, value in request_headers.items():
+        name = name.lower()
+        value = str(value)
+        total_length += len(name) + len(value)
+        max_value_length = max(max_value_length, len(value))
+        buckets[hash_bucket(name)] += 1
+        if name in HASHED_VALUE_HEADERS:
+            buckets[hash_bucket(name + '=' + value.lower())] += 1
+        if name == 'cookie':
+            cookie_count = value.count(';') + 1 if value else 0
+
+    features = {
+        'header_count': len(request_headers),
+        'header_total_length': total_length,
+        'header_max_value_length': max_value_length,
+        'cookie_count': cookie_count,
+    }
+    for i, count in enumerate(buckets):
+        features['header_hash_{}'.format(i)] = count
+    return features
@@ -0,0 +1,79 @@
+from collections.abc import Mapping
+
+class StringTable:
+    '''
+    Shared string table of the log loaders: every distinct header name and value is stored once and
+    referred to by its index. Across a capture the same few names and values (Host, User-Agent,
+    Accept, ...) repeat in every request, so the table stays small while the requests only hold indexes.
+    '''
+
+    def __init__(self):
+        self.strings = []
+        self.index = {}
+
+    def add(self, string):
+        '''
+        Returns the index of string, adding it on first sight.
+        '''
+        i = self.index.get(string)
+        if i is None:
+            i = self.index[string] = len(self.strings)
+            self.strings.append(string)
+        return i
+
+    def __getitem__(self, i):
+        return self.strings[i]
+
+    def __len__(self):
+        return len(self.strings)
+
+class Headers(Mapping):
+    '''
+    Headers of one request as a flat tuple of (name, value) indexes into a StringTable. Reads like the
+    dict it replaces (lookup, iteration, items(), and str() gives the same text as str() of that dict),
+    but the dict is only built when iterated over or printed, and then kept.
+    '''
+    __slots__ = ('table', 'pairs', '_dict')
+
+    def __init__(self, table, items=()):
+        self.table = table
+        add = table.add
+        self.pairs = tuple(i for name, value in items for i in (add(name), add(value)))
+        self._dict = None
+
+    @classmethod
+    def from_har(cls, table, har_headers):
+        '''
+        Builds the headers from the [{'name': ..., 'value': ...}] list of a HAR entry.
+        '''
+        return cls(table, ((header['name'], header['value']) for header in har_headers))
+
+    def __getitem__(self, name):
+        strings = self.table.strings
+        # Scanning from the end, a repeated header keeps its last value like in a dict
+        for i in range(len(self.pairs) - 2, -1, -2):
+            if strings[self.pairs[i]] == name:
+                return strings[self.pairs[i + 1]]
+        raise KeyError(name)
+
+    def __iter__(self):
+        return iter(self.as_dict())
+
+    def __len__(self):
+        # Names are interned, so distinct name indexes are distinct names (a repeated header counts once)
+        return len(set(self.pairs[::2]))
+
+    def items(self):
+        return self.as_dict().items()
+
+    def as_dict(self):
+        if self._dict is None:
+            strings = self.table.strings
+            pairs = self.pairs
+            self._dict = {strings[pairs[i]]: strings[pairs[i + 1]] for i in range(0, len(pairs), 2)}
+        return self._dict
+
+    def __repr__(self):
+        return repr(self.as_dict())
+
+    __str__ = __repr__
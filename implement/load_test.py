@@ -0,0 +1,352 @@
+'''
+End-to-end load test of the interceptor as a real proxy, offline on one Linux box: a local stub upstream,
+mitmdump -s proxy_interceptor.py in front of it (reverse proxy mode, the original Host headers are kept),
+and keep-alive clients replaying the safe and attack requests of request_logs/ at a target rate.
+
+Every rate step is run against the stub directly and through the proxy. The difference of the latency
+percentiles is the latency the proxy adds. Latencies are counted from the time a request was due,
+not from when it was sent, so a proxy that falls behind cannot hide its backlog. A step is saturated when
+the achieved throughput falls below 95% of the target, the proxied p99 exceeds --max-p99-ms or more than 1%
+of the requests fail. CPU and RSS of mitmdump are sampled from /proc. Every request carries its capture label
+in the interceptor's replay header (REPLAY_LABEL_HEADER, stripped before featurization), and the verdicts are
+counted per label from the interceptor's event store. The output of mitmdump goes to load_test_mitmdump.log.
+
+Usage (from the directory holding the interceptor's models/ and data/):
+    python implement/load_test.py --logs request_logs --rates 25,50,100,200 --duration 20 --out data/load_test.json
+'''
+import argparse
+import http.client
+import http.server
+import json
+import multiprocessing
+import os
+import random
+import signal
+import socket
+import sqlite3
+import subprocess
+import threading
+import time
+import urllib.parse
+from collections import Counter, defaultdict
+
+import numpy as np
+
+here = os.path.dirname(os.path.abspath(__file__))
+from score_logs import read_log
+from train_pipeline import LOG_NATURE, DEFAULT_NATURE
+
+# Must match REPLAY_LABEL_HEADER of proxy_interceptor.py
+REPLAY_LABEL_HEADER = 'X-Replay-Label'
+
+SATURATION_THROUGHPUT = 0.95  # Achieved / target rate below which a step counts as saturated
+SATURATION_ERRORS = 0.01  # Share of failed requests above which a step counts as saturated
+SAMPLE_EVERY = 0.5  # Seconds between CPU/RSS samples of mitmdump
+PERCENTILES = (50, 90, 95, 99)
+
+# Headers set per connection by the client, or meaningless when replayed (HTTP/2 pseudo headers)
+SKIP_HEADERS = {'content-length', 'connection', 'keep-alive', 'transfer-encoding', 'proxy-connection', 'upgrade', 'te'}
+
+def free_port():
+    with socket.socket() as s:
+        s.bind(('127.0.0.1', 0))
+        return s.getsockname()[1]
+
+def load_requests(paths):
+    '''
+    Returns the replayable requests of the captures as (nature, method, target, headers, body) tuples;
+    the headers carry the nature as the replay label.
+    '''
+    requests = []
+    for path in paths:
+        nature = LOG_NATURE.get(os.path.basename(path), DEFAULT_NATURE)
+        for method, url, headers, body, content_type, status, elapsed in read_log(path):
+            parts = urllib.parse.urlsplit(url)
+            target = (parts.path or '/') + ('?' + parts.query if parts.query else '')
+            headers = {name: value for name, value in headers.items() if not name.startswith(':') and name.lower() not in SKIP_HEADERS}
+            if not any(name.lower() == 'host' for name in headers):
+                headers['Host'] = parts.netloc
+            headers[REPLAY_LABEL_HEADER] = nature
+            requests.append((nature, method, target, headers, body.encode('utf-8') if body else b''))
+    return requests
+
+class StubHandler(http.server.BaseHTTPRequestHandler):
+    '''
+    Answers every request with a small fixed page, over keep-alive connections.
+    '''
+    protocol_version = 'HTTP/1.1'
+    page = b'<html><body>ok</body></html>'
+
+    def handle_one_request(self):
+        try:
+            super().handle_one_request()
+        except ConnectionError:
+            self.close_connection = True
+
+    def __getattr__(self, name):
+        # do_GET, do_POST, ... for any method the captures use
+        if name.startswith('do_'):
+            return self.answer
+        raise AttributeError(name)
+
+    def answer(self):
+        length = int(self.headers.get('Content-Length') or 0)
+        if length:
+            self.rfile.read(length)
+        self.send_response(200)
+        self.send_header('Content-Type', 'text/html')
+        self.send_header('Content-Length', str(len(self.page)))
+        self.end_headers()
+        self.wfile.write(self.page)
+
+    def log_message(self, *args):
+        pass
+
+def run_stub(port):
+    server = http.server.ThreadingHTTPServer(('127.0.0.1', port), StubHandler)
+    server.daemon_threads = True
+    server.serve_forever()
+
+def wait_for_port(port, timeout, process=None):
+    deadline = time.time() + timeout
+    while time.time() < deadline:
+        if process is not None and process.poll() is not None:
+            raise RuntimeError(f"mitmdump exited with code {process.returncode}, see its log")
+        try:
+            socket.create_connection(('127.0.0.1', port), 0.5).close()
+            return
+        except OSError:
+            time.sleep(0.2)
+    raise RuntimeError(f"Nothing listening on port {port} after {timeout} seconds")
+
+class ProcessSampler:
+    '''
+    Samples the CPU time and RSS of a process from /proc every SAMPLE_EVERY seconds.
+    '''
+
+    def __init__(self, pid):
+        self.pid = pid
+        self.ticks = os.sysconf('SC_CLK_TCK')
+        self.peak_rss = 0
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, name='process-sampler', daemon=True)
+        self._thread.start()
+
+    def cpu_seconds(self):
+        with open(f'/proc/{self.pid}/stat') as f:
+            # Fields after the command name, which may itself contain spaces; utime and stime are the 14th and 15th
+            fields = f.read().rpartition(')')[2].split()
+        return (int(fields[11]) + int(fields[12])) / self.ticks
+
+    def rss(self):
+        with open(f'/proc/{self.pid}/status') as f:
+            for line in f:
+                if line.startswith('VmRSS:'):
+                    return int(line.split()[1]) * 1024
+        return 0
+
+    def reset_peak(self):
+        self.peak_rss = self.rss()
+
+    def _run(self):
+        while not self._stop.wait(SAMPLE_EVERY):
+            try:
+                self.peak_rss = max(self.peak_rss, self.rss())
+            except OSError:
+                return
+
+    def stop(self):
+        self._stop.set()
+
+def replay(port, requests, rate, duration, clients):
+    '''
+    Sends requests round-robin at rate per second for duration seconds over clients keep-alive connections.
+    Returns the latencies (seconds, from the time each request was due), the status counts, the error count and
+    the wall time the step took.
+    '''
+    total = max(1, int(rate * duration))
+    latencies = [None] * total
+    statuses = Counter()
+    errors = [0]
+    lock = threading.Lock()
+    started = time.perf_counter() + 0.1
+
+    def client(first):
+        connection = http.client.HTTPConnection('127.0.0.1', port, timeout=30)
+        for k in range(first, total, clients):
+            due = started + k / rate
+            delay = due - time.perf_counter()
+            if delay > 0:
+                time.sleep(delay)
+            nature, method, target, headers, body = requests[k % len(requests)]
+            try:
+                connection.request(method, target, body=body or None, headers=headers)
+                response = connection.getresponse()
+                response.read()
+                status = response.status
+            except (OSError, http.client.HTTPException):
+                connection.close()
+                connection = http.client.HTTPConnection('127.0.0.1', port, timeout=30)
+                with lock:
+                    errors[0] += 1
+                continue
+            latencies[k] = time.perf_counter() - due
+            with lock:
+                statuses[status] += 1
+        connection.close()
+
+    threads = [threading.Thread(target=client, args=(i,), daemon=True) for i in range(min(clients, total))]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    wall = time.perf_counter() - started
+    return np.array([latency for latency in latencies if latency is not None]), statuses, errors[0], wall
+
+def percentiles_ms(latencies):
+    if not len(latencies):
+        return {f'p{p}': None for p in PERCENTILES}
+    values = np.percentile(latencies, PERCENTILES) * 1000
+    return {f'p{p}': round(float(value), 2) for p, value in zip(PERCENTILES, values)}
+
+def replay_label(detail):
+    '''
+    Returns the replay label recorded in an event's detail column, 'unknown' without one.
+    '''
+    for token in (detail or '').split():
+        if token.startswith('label='):
+            return token[len('label='):]
+    return 'unknown'
+
+def verdict_counts(events_path, windows):
+    '''
+    Counts the interceptor's verdicts per step (ts windows) and replay label.
+    '''
+    counts = [defaultdict(Counter) for _ in windows]
+    if not os.path.exists(events_path):
+        return counts
+    connection = sqlite3.connect(events_path)
+    try:
+        rows = connection.execute("SELECT ts, detail, verdict FROM events WHERE source = 'proxy_interceptor' AND ts >= ?",
+                                  (windows[0][0],)).fetchall()
+    finally:
+        connection.close()
+    for ts, detail, verdict in rows:
+        for i, (start, end) in enumerate(windows):
+            if start <= ts < end:
+                counts[i][replay_label(detail)][verdict] += 1
+                break
+    return counts
+
+def run_step(port, requests, rate, opts):
+    latencies, statuses, errors, wall = replay(port, requests, rate, opts.duration, opts.clients)
+    sent = len(latencies) + errors
+    return {
+        'sent': sent,
+        'throughput': round(len(latencies) / wall, 2),
+        'errors': errors,
+        'blocked': statuses.get(403, 0),
+        'latency_ms': percentiles_ms(latencies),
+    }
+
+def print_step(step):
+    proxied, direct = step['proxied'], step.get('direct')
+    latency = proxied['latency_ms']
+    added = step.get('added_latency_ms') or {}
+    print(f"[+] {step['rate']:>7.1f} req/s target: {proxied['throughput']:>7.1f} req/s achieved, "
+          f"{proxied['errors']} errors, {proxied['blocked']} blocked | latency p50 {latency['p50']} p99 {latency['p99']} ms"
+          + (f", added p50 {added.get('p50')} p99 {added.get('p99')} ms" if direct else '')
+          + f" | mitmdump cpu {step['cpu_percent']}% rss {step['peak_rss_mb']} MB" + (' | SATURATED' if step['saturated'] else ''))
+    for nature, verdicts in sorted(step['verdicts'].items()):
+        print(f"      {nature}: " + ', '.join(f'{verdict}={count}' for verdict, count in sorted(verdicts.items())))
+
+def main():
+    parser = argparse.ArgumentParser(description='Load-test mitmdump with the interceptor against a local stub upstream.')
+    parser.add_argument('--logs', default='request_logs', help='Directory holding the HAR captures (and Burp XML exports) to replay')
+    parser.add_argument('--rates', default='25,50,100,200', help='Comma-separated target rates (requests per second), run in order')
+    parser.add_argument('--duration', type=float, default=20, help='Seconds per rate step')
+    parser.add_argument('--warmup', type=float, default=3, help='Seconds of traffic at the first rate before measuring')
+    parser.add_argument('--clients', type=int, default=16, help='Concurrent keep-alive client connections')
+    parser.add_argument('--max-p99-ms', type=float, default=500, help='Proxied p99 latency above which a step counts as saturated')
+    parser.add_argument('--no-baseline', action='store_true', help='Skip the direct runs against the stub (no added latency)')
+    parser.add_argument('--mitmdump', default='mitmdump', help='mitmdump executable')
+    parser.add_argument('--script', default=os.path.join(here, 'proxy_interceptor.py'), help='Interceptor script')
+    parser.add_argument('--events', default='data/events.db', help="The interceptor's event store (EVENT_STORE_PATH), for the verdicts")
+    parser.add_argument('--seed', type=int, default=0, help='Seed of the replay order')
+    parser.add_argument('--out', help='Write the results as JSON to this file')
+    opts = parser.parse_args()
+
+    logs = sorted(os.path.join(opts.logs, name) for name in os.listdir(opts.logs) if name.endswith(('.har', '.log')))
+    requests = load_requests(logs)
+    random.Random(opts.seed).shuffle(requests)
+    mix = Counter(nature for nature, *_ in requests)
+    print(f"[+] Replaying {len(requests)} requests from {len(logs)} captures: " + ', '.join(f'{n}={c}' for n, c in sorted(mix.items())))
+    rates = [float(rate) for rate in opts.rates.split(',')]
+
+    upstream_port, proxy_port = free_port(), free_port()
+    stub = multiprocessing.Process(target=run_stub, args=(upstream_port,), daemon=True)
+    stub.start()
+    log_path = 'load_test_mitmdump.log'
+    log_file = open(log_path, 'w')
+    proxy = subprocess.Popen([opts.mitmdump, '-q', '-s', opts.script, '--mode', f'reverse:http://127.0.0.1:{upstream_port}',
+                              '--listen-host', '127.0.0.1', '--listen-port', str(proxy_port), '--set', 'keep_host_header=true'],
+                             stdout=log_file, stderr=subprocess.STDOUT)
+    steps = []
+    windows = []
+    try:
+        wait_for_port(upstream_port, 10)
+        wait_for_port(proxy_port, 60, proxy)
+        sampler = ProcessSampler(proxy.pid)
+        if opts.warmup:
+            replay(proxy_port, requests, rates[0], opts.warmup, opts.clients)
+
+        for rate in rates:
+            step = {'rate': rate}
+            if not opts.no_baseline:
+                step['direct'] = run_step(upstream_port, requests, rate, opts)
+            sampler.reset_peak()
+            cpu_before, window_start = sampler.cpu_seconds(), time.time()
+            step['proxied'] = proxied = run_step(proxy_port, requests, rate, opts)
+            step['cpu_percent'] = round((sampler.cpu_seconds() - cpu_before) / (time.time() - window_start) * 100, 1)
+            step['peak_rss_mb'] = round(max(sampler.peak_rss, sampler.rss()) / 2 ** 20, 1)
+            windows.append((window_start, time.time()))
+            if 'direct' in step:
+                step['added_latency_ms'] = {p: round(value - step['direct']['latency_ms'][p], 2) if value is not None and step['direct']['latency_ms'][p] is not None else None
+                                            for p, value in proxied['latency_ms'].items()}
+            p99 = proxied['latency_ms']['p99']
+            step['saturated'] = bool(proxied['throughput'] < SATURATION_THROUGHPUT * rate or p99 is None or p99 > opts.max_p99_ms
+                                     or proxied['errors'] > SATURATION_ERRORS * max(1, proxied['sent']))
+            steps.append(step)
+            print(f"[+] {rate} req/s done")
+        sampler.stop()
+    finally:
+        # SIGINT runs the interceptor's done() hook, which writes out the queued events
+        proxy.send_signal(signal.SIGINT)
+        try:
+            proxy.wait(30)
+        except subprocess.TimeoutExpired:
+            proxy.kill()
+        log_file.close()
+        stub.terminate()
+
+    # Verdicts of flows still being classified when the next step started count for the step they were sent in
+    windows = [(start, windows[i + 1][0] if i + 1 < len(windows) else float('inf')) for i, (start, end) in enumerate(windows)]
+    for step, counts in zip(steps, verdict_counts(opts.events, windows) if windows else []):
+        step['verdicts'] = {nature: dict(verdicts) for nature, verdicts in counts.items()}
+    for step in steps:
+        print_step(step)
+
+    sustained = [step['rate'] for step in steps if not step['saturated']]
+    saturated = next((step['rate'] for step in steps if step['saturated']), None)
+    print(f"[+] Highest sustained rate: " + (f'{max(sustained)} req/s' if sustained else 'none') + ", saturation at: "
+          + (f'{saturated} req/s' if saturated is not None else f'not reached up to {rates[-1]} req/s'))
+    if opts.out:
+        tmp_path = opts.out + '.tmp'
+        with open(tmp_path, 'w') as f:
+            json.dump({'requests': dict(mix), 'clients': opts.clients, 'duration': opts.duration, 'steps': steps,
+                       'highest_sustained_rate': max(sustained) if sustained else None, 'saturation_rate': saturated}, f, indent=2)
+        os.replace(tmp_path, opts.out)
+        print(f"[+] Results written to {opts.out}")
+
+if __name__ == '__main__':
+    main()
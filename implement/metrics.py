@@ -0,0 +1,61 @@
+import json
+import os
+import threading
+import time
+from diagnostics import get_logger
+
+log = get_logger(__name__)
+
+class Metrics:
+    '''
+    Counters and gauges of the running interceptor. A summary is printed, and optionally dumped as
+    JSON for scraping, every report_every flows. Safe to update from the classifier thread.
+    '''
+
+    def __init__(self, report_every=1000, path=None):
+        self.counters = {}
+        self.gauges = {}
+        self.report_every = report_every
+        self.path = path
+        self.started = time.time()
+        self._flows = 0
+        self._lock = threading.Lock()
+
+    def incr(self, name, value=1):
+        with self._lock:
+            self.counters[name] = self.counters.get(name, 0) + value
+
+    def set(self, name, value):
+        self.gauges[name] = value
+
+    def ratio(self, name, part, total):
+        '''
+        Sets gauge name to counters[part] / counters[total] (0 while total is still 0).
+        '''
+        denominator = self.counters.get(total, 0)
+        self.gauges[name] = self.counters.get(part, 0) / denominator if denominator else 0.0
+
+    def snapshot(self):
+        with self._lock:
+            return {'uptime': round(time.time() - self.started, 1), 'counters': dict(self.counters), 'gauges': dict(self.gauges)}
+
+    def flow_done(self):
+        '''
+        Counts one finished flow and reports when report_every flows have passed.
+        '''
+        with self._lock:
+            self._flows += 1
+            due = self.report_every and self._flows % self.report_every == 0
+        if due:
+            self.report()
+
+    def report(self):
+        snapshot = self.snapshot()
+        summary = ', '.join('{}={}'.format(k, v) for k, v in sorted(snapshot['counters'].items()))
+        gauges = ', '.join('{}={:.4g}'.format(k, v) if isinstance(v, float) else '{}={}'.format(k, v) for k, v in sorted(snapshot['gauges'].items()))
+        log.info(f"[metrics] {summary}" + (f" | {gauges}" if gauges else ''))
+        if self.path:
+            tmp_path = self.path + '.tmp'
+            with open(tmp_path, 'w') as f:
+                json.dump(snapshot, f, indent=2)
+            os.replace(tmp_path, self.path)
@@ -0,0 +1,151 @@
+'''
+Compact model artifact for the interceptor: only what inference needs (feature order, imputer fill
+values, scaler parameters, the K-Means centroids and training cluster sizes) in a small versioned binary file.
+The file is memory-mapped on load, so it opens in milliseconds and every worker process shares the
+same pages; a SHA-256 of the payload guards against truncated or corrupted copies.
+
+Layout (little-endian):
+    magic  b'WAFKM\\0'  | version u16 | n_features u32 | n_clusters u32 | names_length u32 | sha256 32 bytes
+    feature names (UTF-8 JSON list, padded to 8 bytes)
+    float64 fill[n_features], mean[n_features], scale[n_features], centroids[n_clusters * n_features], weights[n_clusters]
+
+Export a trained pycaret/sklearn pipeline with:
+    python implement/model_artifact.py models/kmeans_model.pkl models/kmeans_model.wafm
+'''
+import hashlib
+import json
+import mmap
+import os
+import struct
+import sys
+
+import numpy as np
+
+MAGIC = b'WAFKM\0'
+FORMAT_VERSION = 1
+header_struct = struct.Struct('<6sHIII32s')
+
+# Attribute set by fit() on the exportable steps
+FITTED_ATTRIBUTES = {'SimpleImputer': 'statistics_', 'StandardScaler': 'mean_'}
+
+class ArtifactError(Exception):
+    pass
+
+def unwrap(step):
+    # pycaret wraps every sklearn transformer in a TransformerWrapper holding it as .transformer
+    return getattr(step, 'transformer', step)
+
+def step_columns(transformer, default):
+    names = getattr(transformer, 'feature_names_in_', None)
+    return list(names) if names is not None else list(default)
+
+def applies_to_no_columns(step):
+    # pycaret keeps steps with no columns to work on (a categorical imputer without categorical features) unfitted
+    include = getattr(step, '_include', None)
+    return include is not None and len(include) == 0
+
+def export_pipeline(pipeline, path, sample_weight=None):
+    '''
+    Extracts the inference parameters from a fitted imputer/scaler/KMeans pipeline and writes the artifact.
+    The cluster sizes are the training rows per cluster, summed by sample_weight if the fit was weighted.
+    '''
+    feature_names = [str(name) for name in pipeline.feature_names_in_]
+    index = {name: i for i, name in enumerate(feature_names)}
+    n_features = len(feature_names)
+    fill = np.full(n_features, np.nan)
+    mean = np.zeros(n_features)
+    scale = np.ones(n_features)
+
+    for name, step in pipeline.steps[:-1]:
+        if applies_to_no_columns(step):
+            continue
+        transformer = unwrap(step)
+        kind = type(transformer).__name__
+        if kind in FITTED_ATTRIBUTES and not hasattr(transformer, FITTED_ATTRIBUTES[kind]):
+            raise ArtifactError('Pipeline step {} ({}) is not fitted'.format(name, kind))
+        if kind == 'SimpleImputer':
+            for column, value in zip(step_columns(transformer, feature_names), transformer.statistics_):
+                if column in index:
+                    fill[index[column]] = value
+        elif kind == 'StandardScaler':
+            columns = step_columns(transformer, feature_names)
+            for column, m, s in zip(columns, transformer.mean_, transformer.scale_):
+                mean[index[column]] = m
+                scale[index[column]] = s
+        else:
+            raise ArtifactError('Unsupported pipeline step {} ({}), only imputers and StandardScaler can be exported'.format(name, kind))
+
+    estimator = unwrap(pipeline.steps[-1][1])
+    centroids = np.asarray(estimator.cluster_centers_, dtype=np.float64)
+    weights = np.bincount(estimator.labels_, weights=None if sample_weight is None else np.asarray(sample_weight, dtype=np.float64),
+                          minlength=len(centroids))
+    write_artifact(path, feature_names, fill, mean, scale, centroids, weights)
+
+def write_artifact(path, feature_names, fill, mean, scale, centroids, weights):
+    names = json.dumps(feature_names).encode('utf-8')
+    names += b' ' * (-len(names) % 8)
+    payload = names + b''.join(np.ascontiguousarray(a, dtype='<f8').tobytes() for a in (fill, mean, scale, centroids, weights))
+    header = header_struct.pack(MAGIC, FORMAT_VERSION, len(feature_names), len(centroids), len(names),
+                                hashlib.sha256(payload).digest())
+    # Written next to the target and renamed, so readers never map a half-written file
+    tmp_path = path + '.tmp'
+    with open(tmp_path, 'wb') as f:
+        f.write(header + b'\0' * (-header_struct.size % 8) + payload)
+    os.replace(tmp_path, path)
+
+class CompactModel:
+    '''
+    Memory-mapped K-Means model. transform() reproduces the pipeline preprocessing, predict() the cluster assignment.
+    '''
+
+    def __init__(self, path, verify=True):
+        with open(path, 'rb') as f:
+            self._map = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        magic, version, n_features, n_clusters, names_length, checksum = header_struct.unpack_from(self._map)
+        if magic != MAGIC:
+            raise ArtifactError('{} is not a WAF model artifact'.format(path))
+        if version != FORMAT_VERSION:
+            raise ArtifactError('{} has format version {}, expected {}'.format(path, version, FORMAT_VERSION))
+
+        offset = header_struct.size + (-header_struct.size % 8)
+        expected_size = offset + names_length + 8 * (3 * n_features + n_clusters * n_features + n_clusters)
+        if len(self._map) != expected_size:
+            raise ArtifactError('{} is truncated or has trailing data'.format(path))
+        if verify and hashlib.sha256(self._map[offset:]).digest() != checksum:
+            raise ArtifactError('{} failed the checksum'.format(path))
+
+        self.version = checksum.hex()[:12]
+        self.feature_names = json.loads(self._map[offset:offset + names_length].decode('utf-8'))
+        arrays = np.frombuffer(self._map, dtype='<f8', offset=offset + names_length)
+        self.fill = arrays[:n_features]
+        self.mean = arrays[n_features:2 * n_features]
+        self.scale = arrays[2 * n_features:3 * n_features]
+        self.centroids = arrays[3 * n_features:(3 + n_clusters) * n_features].reshape(n_clusters, n_features)
+        self.weights = arrays[(3 + n_clusters) * n_features:]
+
+    def transform(self, data):
+        '''
+        Imputes and scales rows of features (a DataFrame, or a list of feature dicts) into model space.
+        '''
+        if isinstance(data, list):
+            X = np.array([[row.get(name, np.nan) for name in self.feature_names] for row in data], dtype=np.float64)
+        else:
+            X = data[self.feature_names].to_numpy(dtype=np.float64)
+        X = np.where(np.isnan(X), self.fill, X)
+        return (X - self.mean) / self.scale
+
+    def predict(self, X):
+        '''
+        Returns the index of the nearest centroid for every row of transformed features.
+        '''
+        distances = ((X[:, None, :] - self.centroids[None, :, :]) ** 2).sum(axis=2)
+        return distances.argmin(axis=1)
+
+if __name__ == '__main__':
+    if len(sys.argv) != 3:
+        print('Usage: python model_artifact.py <pipeline.pkl> <artifact.wafm>')
+        sys.exit(1)
+    import joblib
+    export_pipeline(joblib.load(sys.argv[1]), sys.argv[2])
+    model = CompactModel(sys.argv[2])
+    print(f"[+] Exported {len(model.feature_names)} features, {len(model.centroids)} clusters to {sys.argv[2]} (version {model.version})")
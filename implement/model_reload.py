@@ -0,0 +1,102 @@
+import os
+import threading
+import time
+from diagnostics import get_logger
+
+log = get_logger(__name__)
+
+class ReloadDeferred(Exception):
+    '''
+    Raised by validate() when a candidate cannot be judged yet; the reload is tried again on the next check.
+    '''
+
+def file_stat(path):
+    '''
+    Identity of the file at path: changes when it is rewritten or replaced (None while it does not exist).
+    '''
+    try:
+        stat = os.stat(path)
+    except OSError:
+        return None
+    return (stat.st_ino, stat.st_size, stat.st_mtime_ns)
+
+class ModelReloader:
+    '''
+    Watches a model artifact from a background thread and hot-swaps new versions. A change of the file
+    (or request(), e.g. from a SIGHUP handler) triggers a reload: load(path) builds the candidate off the
+    traffic path, validate(candidate) raises if it must not go live, swap(candidate) installs it.
+    A rejected version stays rejected until the file changes again; the running model is kept meanwhile.
+    A deferred one (validate raised ReloadDeferred) is retried every check_every seconds.
+    report(ok, elapsed_ms, error), if given, is called after every attempt.
+    '''
+
+    def __init__(self, path, load, validate, swap, check_every=5.0, report=None):
+        self.path = path
+        self.load = load
+        self.validate = validate
+        self.swap = swap
+        self.report = report
+        self.check_every = check_every
+        self.reloads = 0
+        self.failures = 0
+        self.last_error = None
+        self.last_reload_ms = None
+        self._stat = file_stat(path)
+        self._deferred = False
+        self._wake = threading.Event()
+        self._running = True
+        self._thread = threading.Thread(target=self._run, name='model-reloader')
+        self._thread.daemon = True
+        self._thread.start()
+
+    def request(self):
+        '''
+        Reloads at once, whether or not the file changed. Safe to call from a signal handler.
+        '''
+        self._wake.set()
+
+    def stop(self):
+        self._running = False
+        self._wake.set()
+        self._thread.join(5)
+
+    def _run(self):
+        while self._running:
+            forced = self._wake.wait(self.check_every)
+            self._wake.clear()
+            if not self._running:
+                break
+            stat = file_stat(self.path)
+            if stat is not None and (forced or self._deferred or stat != self._stat):
+                self.reload(stat)
+
+    def reload(self, stat=None):
+        '''
+        Loads, validates and swaps in the artifact. Returns True if the new version went live.
+        '''
+        started = time.perf_counter()
+        try:
+            candidate = self.load(self.path)
+            self.validate(candidate)
+        except ReloadDeferred as e:
+            if not self._deferred:
+                log.warning(f"[model] Reload of {self.path} deferred, keeping the running model: {e}")
+            self._deferred = True
+            return False
+        except Exception as e:
+            self._deferred = False
+            self.failures += 1
+            self.last_error = str(e)
+            log.warning(f"[model] Reload of {self.path} rejected, keeping the running model: {e}")
+            if self.report:
+                self.report(False, (time.perf_counter() - started) * 1000, self.last_error)
+            return False
+        finally:
+            self._stat = stat or file_stat(self.path)
+        self._deferred = False
+        self.swap(candidate)
+        self.reloads += 1
+        self.last_reload_ms = (time.perf_counter() - started) * 1000
+        if self.report:
+            self.report(True, self.last_reload_ms, None)
+        return True
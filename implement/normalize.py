@@ -0,0 +1,71 @@
+import html
+import re
+import urllib.parse
+from functools import cached_property
+
+# Upper bound on percent-decoding rounds, enough for double and triple encoded payloads
+MAX_DECODE_ROUNDS = 4
+
+whitespace_pattern = re.compile(r'\s+')
+
+def url_decode(text):
+    '''
+    Percent-decodes the text repeatedly until it stops changing (or MAX_DECODE_ROUNDS is reached).
+    '''
+    for _ in range(MAX_DECODE_ROUNDS):
+        decoded = urllib.parse.unquote(text)
+        if decoded == text:
+            break
+        text = decoded
+    return text
+
+class CanonicalText:
+    '''
+    Canonical views of one piece of request text. Each view is computed on first access and then cached,
+    so every detector reading it shares the same string object instead of decoding again.
+    '''
+
+    def __init__(self, raw):
+        self.raw = raw or ''
+
+    @cached_property
+    def decoded(self):
+        # URL-decoded, then HTML-entity decoded
+        return html.unescape(url_decode(self.raw))
+
+    @cached_property
+    def lower(self):
+        return self.decoded.lower()
+
+    @cached_property
+    def collapsed(self):
+        # Lowercased with every run of whitespace squeezed into a single space
+        return whitespace_pattern.sub(' ', self.lower).strip()
+
+class CanonicalRequest:
+    '''
+    Normalization stage built once per request. Holds the canonical views of the URL, body and headers
+    that all feature extractors read from.
+    '''
+
+    def __init__(self, url, body='', headers=None):
+        self.headers = headers or {}
+        self.texts = {}
+        self.url = self.text(url)
+        self.body = self.text(body)
+        self.header_text = CanonicalText('\n'.join('{}: {}'.format(k, v) for k, v in self.headers.items()))
+
+    def text(self, raw):
+        '''
+        Canonical views of a piece of this request (a parameter value), shared with any equal text
+        already canonicalized for it, so each distinct string is decoded once per request.
+        '''
+        raw = raw or ''
+        text = self.texts.get(raw)
+        if text is None:
+            text = self.texts[raw] = CanonicalText(raw)
+        return text
+
+    @cached_property
+    def header_names(self):
+        return [k.lower() for k in self.headers]
@@ -0,0 +1,103 @@
+import os
+import numpy as np
+
+
+class OnlineKMeans:
+    '''
+    Mini-batch K-Means that keeps the cluster centroids and cluster weights current from live traffic.
+    Scored requests are buffered and folded into the centroids once a batch is full. Cluster weights
+    decay on every batch so old traffic fades out and the model follows drift. Memory and work per
+    request stay constant: k centroids, k weights and one batch buffer.
+    base_version is the version of the model artifact the centroids were seeded from; it is saved with
+    the checkpoint, so a checkpoint learned on another model (other features or scaling) can be told apart.
+    '''
+
+    def __init__(self, centroids, weights=None, decay=0.999, batch_size=32, checkpoint_path=None, checkpoint_every=100,
+                 base_version=None):
+        self.centroids = np.array(centroids, dtype=np.float64)
+        n_clusters, n_features = self.centroids.shape
+        if weights is None:
+            weights = np.ones(n_clusters)
+        self.weights = np.array(weights, dtype=np.float64)
+        self.decay = decay
+        self.batch_size = batch_size
+        self.checkpoint_path = checkpoint_path
+        self.checkpoint_every = checkpoint_every
+        self.base_version = base_version
+        self.n_batches = 0
+        self._buffer = np.empty((batch_size, n_features))
+        self._buffer_weights = np.empty(batch_size)
+        self._buffered = 0
+
+    @classmethod
+    def from_estimator(cls, estimator, **kwargs):
+        '''
+        Builds the online model from a fitted sklearn KMeans, seeding the weights with its training cluster sizes.
+        '''
+        centroids = estimator.cluster_centers_
+        weights = np.bincount(estimator.labels_, minlength=len(centroids))
+        return cls(centroids, weights, **kwargs)
+
+    @classmethod
+    def load(cls, path, **kwargs):
+        '''
+        Restores the centroids and weights from a checkpoint written by save(). Checkpoints written before
+        base_version was saved load with base_version None.
+        '''
+        with np.load(path) as checkpoint:
+            base_version = str(checkpoint['base_version']) if 'base_version' in checkpoint.files else None
+            model = cls(checkpoint['centroids'], checkpoint['weights'], base_version=base_version or None, **kwargs)
+            model.n_batches = int(checkpoint['n_batches'])
+        return model
+
+    def save(self, path=None):
+        '''
+        Writes a checkpoint atomically, so a crash mid-write never leaves a truncated file behind.
+        '''
+        path = path or self.checkpoint_path
+        tmp_path = path + '.tmp'
+        with open(tmp_path, 'wb') as f:
+            np.savez(f, centroids=self.centroids, weights=self.weights, n_batches=self.n_batches,
+                     base_version=self.base_version or '')
+        os.replace(tmp_path, path)
+
+    def predict(self, x):
+        '''
+        Returns the index of the centroid nearest to the feature vector x.
+        '''
+        distances = ((self.centroids - x) ** 2).sum(axis=1)
+        return int(distances.argmin())
+
+    def partial_fit(self, x, weight=1.0):
+        '''
+        Queues one feature vector and updates the model once a full batch has been collected.
+        A sampled request stands in for 1/sample_rate requests and is passed with that weight.
+        '''
+        self._buffer[self._buffered] = x
+        self._buffer_weights[self._buffered] = weight
+        self._buffered += 1
+        if self._buffered == self.batch_size:
+            self._update(self._buffer, self._buffer_weights)
+            self._buffered = 0
+
+    def is_minority(self, cluster):
+        '''
+        Checks whether the cluster carries less weight than the dominant (normal traffic) cluster.
+        '''
+        return self.weights[cluster] < self.weights.max()
+
+    def _update(self, batch, batch_weights):
+        # Assigning the whole batch against the centroids as they were before this update
+        distances = ((batch[:, None, :] - self.centroids[None, :, :]) ** 2).sum(axis=2)
+        labels = distances.argmin(axis=1)
+
+        # Fading out the history, then moving each centroid towards its new points with a per-cluster learning rate
+        self.weights *= self.decay
+        for x, weight, label in zip(batch, batch_weights, labels):
+            self.weights[label] += weight
+            eta = weight / self.weights[label]
+            self.centroids[label] += eta * (x - self.centroids[label])
+
+        self.n_batches += 1
+        if self.checkpoint_path and self.n_batches % self.checkpoint_every == 0:
+            self.save()
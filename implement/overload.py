@@ -0,0 +1,89 @@
+import threading
+import time
+
+# Degradation levels, from full analysis down to the prefilter alone
+LEVELS = ['normal', 'sample_benign', 'skip_persistence', 'prefilter_only']
+NORMAL, SAMPLE_BENIGN, SKIP_PERSISTENCE, PREFILTER_ONLY = range(len(LEVELS))
+
+class OverloadController:
+    '''
+    Watches the classifier backlog (flows handed to the classifier and not finished yet) and the stage
+    latency (moving average of the tier-2 time per flow), and moves one degradation level at a time:
+    up while either signal is over its limit, down once both have stayed under half their limit
+    for recover_after seconds. At most one step is taken every step_after seconds, so a short burst
+    does not throw the interceptor straight into prefilter-only mode. The latency average is dropped once
+    nothing has been classified for recover_after seconds (in prefilter-only mode), so it cannot hold the
+    interceptor there.
+    '''
+
+    def __init__(self, queue_limit=16, latency_limit_ms=100.0, step_after=2.0, recover_after=10.0,
+                 smoothing=0.2, max_level=PREFILTER_ONLY, clock=time.monotonic):
+        self.queue_limit = queue_limit
+        self.latency_limit_ms = latency_limit_ms
+        self.step_after = step_after
+        self.recover_after = recover_after
+        self.smoothing = smoothing
+        self.max_level = max_level
+        self.clock = clock
+        self.level = NORMAL
+        self.queue_depth = 0
+        self.latency_ms = 0.0
+        self._changed = clock()
+        self._observed = clock()
+        self._calm_since = None
+        self._lock = threading.Lock()
+
+    @property
+    def name(self):
+        return LEVELS[self.level]
+
+    def enter(self):
+        '''
+        Counts a flow handed to the classifier.
+        '''
+        with self._lock:
+            self.queue_depth += 1
+
+    def leave(self, latency_ms):
+        '''
+        Counts a flow done by the classifier, with the time it spent there.
+        '''
+        with self._lock:
+            self.queue_depth -= 1
+            self.latency_ms += self.smoothing * (latency_ms - self.latency_ms)
+            self._observed = self.clock()
+
+    def pressure(self):
+        '''
+        The larger of backlog and stage latency, relative to their limits (1.0 = at the limit).
+        '''
+        return max(self.queue_depth / self.queue_limit, self.latency_ms / self.latency_limit_ms)
+
+    def update(self):
+        '''
+        Re-evaluates the level; returns the level change (+1, -1 or 0).
+        '''
+        now = self.clock()
+        with self._lock:
+            if now - self._observed >= self.recover_after:
+                self.latency_ms = 0.0
+            pressure = self.pressure()
+            if pressure >= 1.0:
+                self._calm_since = None
+                if self.level < self.max_level and now - self._changed >= self.step_after:
+                    return self._step(+1, now)
+            elif pressure < 0.5:
+                if self._calm_since is None:
+                    self._calm_since = now
+                if self.level > NORMAL and now - self._calm_since >= self.recover_after and now - self._changed >= self.step_after:
+                    # Each recovery step needs its own calm period
+                    self._calm_since = now
+                    return self._step(-1, now)
+            else:
+                self._calm_since = None
+        return 0
+
+    def _step(self, direction, now):
+        self.level += direction
+        self._changed = now
+        return direction
@@ -0,0 +1,128 @@
+import json
+import re
+import urllib.parse
+from normalize import CanonicalText
+
+# Hard caps on the work done per request, whatever the request looks like
+MAX_PARAMS = 64            # Parameters scored per request
+MAX_SCAN_BYTES = 16384     # Parameter bytes scored per request
+MAX_BODY_BYTES = 65536     # Body bytes handed to the form/JSON/multipart parsers
+MAX_JSON_DEPTH = 32        # Nesting levels of a JSON body flattened into parameters; deeper bodies are scored raw
+
+PARAM_FEATURE_COLUMNS = ['param_count', 'param_max_score', 'param_sum_score', 'param_worst_index', 'param_truncated']
+
+# Characters and sequences that break out of a quoted SQL or HTML context
+special_tokens = [r"'", r'"', r'--', r';', r'/\*', r'#', r'<', r'>']
+# The same without the bare quotes, for whole streamed bodies where every JSON document is full of them
+stream_tokens = [token for token in special_tokens if token not in (r"'", r'"')]
+
+def iter_json_params(value, name='', depth=0):
+    '''
+    Flattens a decoded JSON document into (dotted.name, value) pairs for its leaf values.
+    Raises ValueError for documents nested deeper than MAX_JSON_DEPTH.
+    '''
+    if isinstance(value, (dict, list)) and depth >= MAX_JSON_DEPTH:
+        raise ValueError('JSON nested deeper than {} levels'.format(MAX_JSON_DEPTH))
+    if isinstance(value, dict):
+        for key, item in value.items():
+            yield from iter_json_params(item, '{}.{}'.format(name, key) if name else str(key), depth + 1)
+    elif isinstance(value, list):
+        for i, item in enumerate(value):
+            yield from iter_json_params(item, '{}[{}]'.format(name, i), depth + 1)
+    elif value is not None:
+        yield name, str(value)
+
+def iter_multipart_params(body, content_type):
+    '''
+    Splits a multipart/form-data body into (name, value) pairs, one per part.
+    '''
+    match = re.search(r'boundary="?([^";]+)"?', content_type, re.IGNORECASE)
+    if not match:
+        yield '', body
+        return
+    for part in body.split('--' + match.group(1)):
+        head, sep, value = part.partition('\r\n\r\n')
+        if not sep:
+            head, sep, value = part.partition('\n\n')
+        if not sep:
+            continue
+        name = re.search(r'name="([^"]*)"', head)
+        yield (name.group(1) if name else ''), value.rstrip('\r\n')
+
+def iter_body_params(body, content_type=''):
+    '''
+    Parses a request body into (name, value) pairs according to its content type.
+    Bodies that cannot be parsed are returned as a single unnamed parameter.
+    '''
+    if not body:
+        return
+    body = body[:MAX_BODY_BYTES]
+    content_type = content_type or ''
+    mime_type = content_type.lower()
+    if 'json' in mime_type:
+        try:
+            # Flattened up front, so a body that turns out too deep yields nothing before the raw fallback
+            params = list(iter_json_params(json.loads(body)))
+        except (ValueError, RecursionError):
+            # Invalid or deeply nested JSON (json.loads recurses per level) is scored as one raw value
+            pass
+        else:
+            yield from params
+            return
+    elif 'multipart/form-data' in mime_type:
+        yield from iter_multipart_params(body, content_type)
+        return
+    elif '=' in body:
+        yield from urllib.parse.parse_qsl(body, keep_blank_values=True)
+        return
+    yield '', body
+
+def extract_params(query_string, body, content_type=''):
+    '''
+    Yields the parameters of a raw request: query string first, then the body.
+    '''
+    yield from urllib.parse.parse_qsl(query_string or '', keep_blank_values=True)
+    yield from iter_body_params(body, content_type)
+
+class ParamScanner:
+    '''
+    Scores every parameter of a request with one compiled pattern, in a single pass per value,
+    and aggregates the scores into fixed features (see PARAM_FEATURE_COLUMNS).
+    '''
+
+    def __init__(self, sql_keywords, xss_patterns, tokens=special_tokens):
+        keywords = r'\b(?:{})\b'.format('|'.join(keyword.replace(' ', r'\s+') for keyword in sql_keywords))
+        self.pattern = re.compile('|'.join([keywords] + list(xss_patterns) + list(tokens)), re.IGNORECASE)
+
+    def score(self, text):
+        '''
+        Counts the suspicious tokens in the canonical views (a CanonicalText) of one parameter value.
+        '''
+        return sum(1 for _ in self.pattern.finditer(text.collapsed))
+
+    def scan(self, params, canonical=None):
+        '''
+        Scores the (name, value) pairs until the parameter or byte budget is spent. With the request's
+        CanonicalRequest, values are decoded through it and share the views already built for the request.
+        '''
+        text = canonical.text if canonical is not None else CanonicalText
+        features = dict.fromkeys(PARAM_FEATURE_COLUMNS, 0)
+        features['param_worst_index'] = -1
+        budget = MAX_SCAN_BYTES
+
+        for index, (name, value) in enumerate(params):
+            if index == MAX_PARAMS or budget <= 0:
+                features['param_truncated'] = 1
+                break
+            if len(value) > budget:
+                features['param_truncated'] = 1
+                value = value[:budget]
+            budget -= len(value)
+            score = self.score(text(value))
+            features['param_count'] += 1
+            features['param_sum_score'] += score
+            if score > features['param_max_score']:
+                features['param_max_score'] = score
+                features['param_worst_index'] = index
+
+        return features
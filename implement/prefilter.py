@@ -0,0 +1,56 @@
+import re
+from normalize import CanonicalText
+
+# Characters that break out of a quoted SQL, HTML or JavaScript context
+suspicious_chars = [b"'", b'"', b'`', b'<', b'>', b'(', b')', b'{', b'}', b';', b'\\', b'--', b'/*', b'&#']
+
+# Percent-encoded forms of the characters above, plus %25 (double encoding) and encoded entities
+encoded_chars = rb'%(?:2[25789d]|3[bce]|5c|60|7[bd])|%26(?:%23|#)'
+
+# The subset that stays meaningful in header values: the rest ((), ;, ", --, /*) is part of ordinary
+# User-Agent, Accept, Cookie and sec-ch-ua values
+header_chars = [b"'", b'`', b'<', b'>', b'&#']
+encoded_header_chars = rb'%(?:27|3c|3e|60)|%26(?:%23|#)'
+
+# Percent escapes and HTML entities that may hide a keyword or literal from the raw scan (documen%74.cookie, &ltscript&gt)
+escapes = re.compile(rb'%[0-9a-f]{2}|&[#a-z]', re.IGNORECASE)
+
+def literal(pattern):
+    '''
+    Turns one of the (escape-only) XSS regex patterns back into the literal text it matches.
+    '''
+    return re.sub(r'\\(.)', r'\1', pattern).encode('utf-8')
+
+class Prefilter:
+    '''
+    First detection tier: a single case-insensitive byte-level scan of the URL and body for the suspicious
+    characters, the SQL keywords and the XSS literals, and of the header values for the XSS literals and
+    header_chars (SQL keywords like LIKE or AND are common words there). Text holding percent escapes or HTML entities is
+    scanned again in its canonical (decoded) form, the form tier 2 matches against, so encoding a payload
+    does not get it past the prefilter. Requests without any hit skip featurization and the model.
+    '''
+
+    def __init__(self, sql_keywords, xss_patterns):
+        keywords = [rb'\b' + re.escape(keyword.encode('utf-8')).replace(b' ', rb'[\s+]+') + rb'\b' for keyword in sql_keywords]
+        literals = [re.escape(literal(pattern)) for pattern in xss_patterns]
+        chars = [re.escape(char) for char in suspicious_chars]
+        self.pattern = re.compile(b'|'.join(keywords + literals + chars + [encoded_chars]), re.IGNORECASE)
+        header_escaped = [re.escape(char) for char in header_chars]
+        self.header_pattern = re.compile(b'|'.join(literals + header_escaped + [encoded_header_chars]), re.IGNORECASE)
+
+    def is_suspicious(self, url, body=b'', header_values=()):
+        '''
+        Checks the raw URL (path and query), body and header value bytes. Returns True when the request has
+        to be escalated.
+        '''
+        return self.scan(url) or bool(body and self.scan(body)) or \
+            any(self.scan(value, self.header_pattern) for value in header_values)
+
+    def scan(self, raw, pattern=None):
+        pattern = pattern or self.pattern
+        if pattern.search(raw):
+            return True
+        if not escapes.search(raw):
+            return False
+        decoded = CanonicalText(raw.decode('utf-8', 'replace')).decoded
+        return bool(pattern.search(decoded.encode('utf-8')))
@@ -1,98 +1,496 @@
+import asyncio
 import json
-import re
-import urllib.parse
+import os
+import random
+import signal
+import threading
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
 from mitmproxy import http
+import numpy as np
 import pandas as pd
-from pycaret.clustering import load_model, predict_model
-
-# Defining SQL keywords and XSS patterns globally
-sql_keywords = [
-    'SELECT', 'INSERT', 'UPDATE', 'DELETE', 'DROP', 'CREATE', 'ALTER', 'TRUNCATE',
-    'UNION', 'FROM', 'WHERE', 'AND', 'OR', 'LIKE', 'BETWEEN', 'IN', 'JOIN', 'ON', 'GROUP BY', 'ORDER BY', 'HAVING', 'LIMIT'
-]
-
-xss_patterns = [
-    r'<script', r'alert\(', r'\(alert\(', r'</script>', r'document\.cookie',
-    r'eval\(', r'window\.location', r'setTimeout\(', r'setInterval\(',
-    r'execCommand', r'innerHTML', r'outerHTML', r'document\.write',
-    r'XMLHttpRequest\.open', r'FormData\.append', r'document\.getElementById',
-    r'document\.createElement', r'document\.execCommand', r'window\.open',
-    r'window\.eval', r'window\.setTimeout', r'window\.setInterval',
-    r'document\.URL', r'location\.href', r'location\.search',
-    r'document\.referrer', r'navigator\.sendBeacon', r'importScripts', r'`'
-]
+from model_artifact import ArtifactError, CompactModel
+from model_reload import ModelReloader, ReloadDeferred
+from online_kmeans import OnlineKMeans
+from request_features import FEATURE_COLUMNS, sql_keywords, xss_patterns, stream_pattern, extract_features
+from body_stream import STREAM_FEATURE_COLUMNS, StreamInspector, is_text_content, should_stream
+from prefilter import Prefilter
+from endpoint_profiles import PROFILE_FEATURE_COLUMNS, ProfileIndex, endpoint_key
+from metrics import Metrics
+from event_store import EventStore
+from overload import OverloadController, NORMAL, SAMPLE_BENIGN, SKIP_PERSISTENCE, PREFILTER_ONLY
+from diagnostics import get_logger, profiled, stage
+
+# Alerts go through the shared diagnostics logger (WAF_LOG_LEVEL); WAF_PROFILE=cpu|sample|memory writes per-stage profiles
+log = get_logger(__name__)
+
+# Tiered detection: flows without a single suspicious literal in the URL or body skip the model
+PREFILTER = True
+PREFILTER_SHADOW_SAMPLE = 0.02  # Fraction of clean flows still run through the model to count prefilter misses (1.0 = full shadow mode)
+prefilter = Prefilter(sql_keywords, xss_patterns)
+
+# Counters are printed (and written to METRICS_PATH) every METRICS_REPORT_EVERY flows
+METRICS_REPORT_EVERY = 1000
+METRICS_PATH = 'data/metrics.json'
+metrics = Metrics(METRICS_REPORT_EVERY, METRICS_PATH)
+
+# Every flow, its features, verdict and stage timings are written to a SQLite event store by a background thread
+EVENT_STORE = True
+EVENT_STORE_PATH = 'data/events.db'
+EVENT_STORE_MAX_ROWS = 1000000  # Oldest events beyond this are deleted
+EVENT_STORE_MAX_AGE = 30 * 24 * 3600  # Events older than this (seconds) are deleted
+store = EventStore(EVENT_STORE_PATH, max_rows=EVENT_STORE_MAX_ROWS, max_age=EVENT_STORE_MAX_AGE) if EVENT_STORE else None
+
+# Latency budget: featurization and classification get LATENCY_BUDGET_MS per flow, counted from the response hook.
+# Past the deadline the flow is answered by LATENCY_FALLBACK while the classification finishes in the background:
+# 'allow' lets it through, 'block' answers 403, 'prefilter' blocks it only if the prefilter flagged it. 0 disables the budget.
+LATENCY_BUDGET_MS = 200
+LATENCY_FALLBACK = 'prefilter'
+# A single worker thread, the online model and the profiles are updated by one flow at a time
+classifier = ThreadPoolExecutor(max_workers=1, thread_name_prefix='classifier')
+
+# Overload control: as the classifier backlog or the stage latency grows past its limit, the interceptor degrades
+# one level at a time (sample_benign -> skip_persistence -> prefilter_only) and recovers once the load is gone.
+# While degraded, flows are scored without updating the online model, the offline counts or the profiles
+OVERLOAD_CONTROL = True
+OVERLOAD_QUEUE_LIMIT = 16  # Flows waiting for or in the classifier
+OVERLOAD_LATENCY_MS = 100  # Moving average of the classification time per flow
+OVERLOAD_BENIGN_SAMPLE = 0.002  # Fraction of prefilter-clean flows still classified from sample_benign on
+OVERLOAD_SHED_BLOCK = False  # prefilter_only: flagged flows are only logged; True handles them by LATENCY_FALLBACK (the literals also match benign text)
+overload = OverloadController(OVERLOAD_QUEUE_LIMIT, OVERLOAD_LATENCY_MS) if OVERLOAD_CONTROL else None
+
+# Header the load test (load_test.py) labels replayed requests with; stripped before featurization and recorded
+# in the event's detail, so verdicts can be counted per capture. None disables it
+REPLAY_LABEL_HEADER = 'X-Replay-Label'
+
+# Set to True to keep the raw request headers as an audit column in the clustered CSV
+KEEP_RAW_HEADERS = False
+
+# Online learning: scored flows update the centroids and cluster weights instead of the cluster counts of the CSV
+ONLINE_LEARNING = True
+ONLINE_DECAY = 0.999  # Weight kept by the history on every mini-batch
+ONLINE_BATCH_SIZE = 32
+ONLINE_CHECKPOINT = 'models/kmeans_online.npz'
+ONLINE_CHECKPOINT_EVERY = 100  # Mini-batches between checkpoints
+
+# Per-endpoint baselines (see endpoint_profiles.py): requests are also scored against the normal traffic of their
+# own host + method + path template, and normal requests are folded back into the profile
+PROFILES = True
+PROFILE_PATH = 'models/endpoint_profiles.json'
+PROFILE_THRESHOLD = 3  # Profile score (deviations of the worst parameter) reported as an endpoint anomaly
+PROFILE_CHECKPOINT_EVERY = 1000  # Profile updates between checkpoints
+
+# Compact K-Means artifact exported from the trained pipeline (see model_artifact.py)
+MODEL_PATH = 'models/kmeans_model.wafm'
+# Clustered training data, the cluster counts of the offline mode are taken from it
+CLUSTERED_PATH = 'data/clustered_results_with_features.csv'
+
+# Hot reload: a new artifact at MODEL_PATH (or a SIGHUP) is loaded in the background, checked against the
+# recent normal flows and swapped in between two classifications; flows being classified finish on the old model
+MODEL_RELOAD = True
+MODEL_RELOAD_CHECK = 5.0  # Seconds between checks of the artifact
+MODEL_CANARY_SIZE = 256  # Recent normal flows a new model is validated on
+MODEL_CANARY_MIN = 32  # Normal flows needed before a new model is judged; until then the swap is deferred
+MODEL_CANARY_MAX_FLAGGED = 0.2  # A new model flagging more than this fraction of them as intrusions is rejected
 
 # Loading the K-Means model
-model = load_model('models/kmeans_model')
+model = CompactModel(MODEL_PATH)
+metrics.set('model_version', model.version)
+
+def load_online_model():
+    '''
+    Resumes the online model from its checkpoint if it was learned on the loaded artifact, otherwise
+    (after a retrain: other features, scaling or clusters) starts over from the artifact's centroids.
+    '''
+    if not os.path.exists(ONLINE_CHECKPOINT):
+        return OnlineKMeans(model.centroids, model.weights, base_version=model.version, **online_options)
+    online_model = OnlineKMeans.load(ONLINE_CHECKPOINT, **online_options)
+    if online_model.base_version == model.version and online_model.centroids.shape == model.centroids.shape:
+        return online_model
+    log.warning(f"[model] Online checkpoint {ONLINE_CHECKPOINT} was learned on model {online_model.base_version} "
+                f"({online_model.centroids.shape[1]} features), not {model.version}; starting over from the model.")
+    # Replacing the stale checkpoint right away, like a model swap does
+    online_model = OnlineKMeans(model.centroids, model.weights, base_version=model.version, **online_options)
+    online_model.save()
+    return online_model
+
+online_model = None
+if ONLINE_LEARNING:
+    online_options = dict(decay=ONLINE_DECAY, batch_size=ONLINE_BATCH_SIZE,
+                          checkpoint_path=ONLINE_CHECKPOINT, checkpoint_every=ONLINE_CHECKPOINT_EVERY)
+    online_model = load_online_model()
+
+cluster_counts = None
+
+# Held while a flow is classified and while a new model is swapped in
+model_lock = threading.Lock()
+# Features of recent normal flows, the canary batch for new models
+canary = deque(maxlen=MODEL_CANARY_SIZE)
 
+profiles = None
+if PROFILES:
+    profile_options = dict(checkpoint_path=PROFILE_PATH, checkpoint_every=PROFILE_CHECKPOINT_EVERY)
+    if os.path.exists(PROFILE_PATH):
+        profiles = ProfileIndex.load(PROFILE_PATH, **profile_options)
+    else:
+        profiles = ProfileIndex(**profile_options)
+
+def requestheaders(flow: http.HTTPFlow):
+    if REPLAY_LABEL_HEADER and REPLAY_LABEL_HEADER in flow.request.headers:
+        flow.metadata['replay_label'] = flow.request.headers.pop(REPLAY_LABEL_HEADER)
+    # Streaming large or chunked bodies through the inspector instead of buffering them whole
+    if should_stream(flow.request.headers):
+        inspector = StreamInspector(stream_pattern, flow.request.headers.get('content-type', ''))
+        flow.request.stream = inspector
+        flow.metadata['body_inspector'] = inspector
+
+@profiled('featurize')
 def parse_request(flow: http.HTTPFlow):
     request = flow.request
-    request_url = urllib.parse.unquote(request.pretty_url)  # Decode URL
     request_method = request.method
     request_headers = {k: v for k, v in request.headers.items()}
-    request_body = request.get_text()
-    
-    # Extracting UID value if present
-    uid_value = None
-    if request_body:
-        for param in request_body.split('&'):
-            if param.startswith('uid='):
-                uid_value = param.split('=')[1]
-                break
-    
-    # Extracting features
-    features = {
-        'method': request_method,
-        'path': request_url,
-        'headers': str(request_headers),
-        'body': uid_value if uid_value else '',
-        'body_length': len(uid_value) if uid_value else 0,
-        'num_commas': uid_value.count(',') if uid_value else 0,
-        'num_hyphens': uid_value.count('-') if uid_value else 0,
-        'num_brackets': uid_value.count('(') + uid_value.count(')') if uid_value else 0,
-        'num_quotes': uid_value.count("'") if uid_value else 0,
-        'num_double_quotes': uid_value.count('"') if uid_value else 0,
-        'num_slashes': uid_value.count('/') if uid_value else 0,
-        'num_braces': uid_value.count('{') + uid_value.count('}') if uid_value else 0,
-        'num_spaces': uid_value.count(' ') if uid_value else 0,
-        'has_sql_keywords': int(any(keyword.lower() in uid_value.lower() for keyword in sql_keywords)) if uid_value else 0,
-        'has_xss_payload': int(any(re.search(pattern, request_url.lower()) or re.search(pattern, str(request_headers).lower()) for pattern in xss_patterns)),
-        'has_csrf_token': int(any('csrf_token' in k.lower() or 'anti_csrf_token' in k.lower() or 'xsrf_token' in k.lower() for k in request_headers)),
-        'response_status': 0,  # This will be updated later
-        'response_time': 0  # This will be updated later
-    }
+    content_type = request.headers.get('content-type', '')
+
+    # Streamed bodies were inspected on the way through, only their first bytes are kept
+    inspector = flow.metadata.get('body_inspector')
+    if inspector:
+        request_body = inspector.text
+    elif is_text_content(content_type):
+        request_body = request.get_text()
+    else:
+        request_body = ''
+
+    features, params = extract_features(request_method, request.pretty_url, request_headers, request_body, content_type)
+    if profiles is not None:
+        # Kept on the flow, the profile is only updated once the verdict is known. pretty_host is the Host header's
+        # hostname without the port, the host of the captured URLs the profiles are built from (not the upstream in reverse mode)
+        key = endpoint_key(request.pretty_host, request_method, request.path)
+        flow.metadata['endpoint'] = (key, params)
+        features.update(profiles.score(key, params))
+    features.update(inspector.features() if inspector else dict.fromkeys(STREAM_FEATURE_COLUMNS, 0))
+    if KEEP_RAW_HEADERS:
+        features['headers'] = str(request_headers)
     
     return features
 
-def response(flow: http.HTTPFlow):
-    # Updating the response details
-    response = flow.response
+def preprocess(request_df):
+    '''
+    Imputes and scales the request features into the vector the K-Means centroids live in.
+    '''
+    return model.transform(request_df)[0]
+
+@profiled('classify')
+def classify_online(request_df, weight=1.0):
+    '''
+    Scores the request against the live centroids and folds it into the online model (not with weight None).
+    Returns the request's cluster, the dominant cluster and whether the request is an intrusion.
+    '''
+    vector = preprocess(request_df)
+    cluster = online_model.predict(vector)
+    if weight is not None:
+        online_model.partial_fit(vector, weight)
+    return f"Cluster {cluster}", f"Cluster {online_model.weights.argmax()}", bool(online_model.is_minority(cluster))
+
+@profiled('classify')
+def classify_offline(request_df, weight=1.0):
+    '''
+    Scores the request with the fixed model against the cluster counts of the clustered CSV.
+    The counts are read once and kept in memory; scored requests are persisted in the event store.
+    A shadow-scored clean flow is counted with its weight, for the prefilter-clean flows it stands in for;
+    with weight None the request is scored without being counted.
+    '''
+    global cluster_counts
+    if cluster_counts is None:
+        # Deduplicated training rows count for their whole group (weight column)
+        clustered = pd.read_csv(CLUSTERED_PATH, usecols=lambda column: column in ('Cluster', 'weight'))
+        counts = clustered['weight'] if 'weight' in clustered else pd.Series(1.0, index=clustered.index)
+        cluster_counts = counts.groupby(clustered['Cluster']).sum().to_dict()
+
+    # Predicting the cluster for the new request and counting it in
+    new_cluster = f"Cluster {model.predict(model.transform(request_df))[0]}"
+    if weight is not None:
+        cluster_counts[new_cluster] = cluster_counts.get(new_cluster, 0) + weight
+
+    # Checking if the new cluster has the highest number of requests
+    normal_cluster = max(cluster_counts, key=cluster_counts.get)
+    return new_cluster, normal_cluster, cluster_counts[new_cluster] < cluster_counts[normal_cluster]
+
+def raw_request_bytes(flow: http.HTTPFlow):
+    '''
+    Returns the raw path+query, body and header value bytes the prefilter scans, without decoding anything.
+    '''
+    request = flow.request
+    inspector = flow.metadata.get('body_inspector')
+    if inspector:
+        body = bytes(inspector.head)
+    elif is_text_content(request.headers.get('content-type', '')):
+        body = request.content or b''
+    else:
+        body = b''
+    return request.data.path, body, [value for _, value in request.headers.fields]
+
+def elapsed_ms(since):
+    return (time.perf_counter() - since) * 1000
+
+async def response(flow: http.HTTPFlow):
+    started = time.perf_counter()
+    timings = {}
+
+    level = overload_level()
+
+    # Tier 1: cheap literal prefilter, clean flows get a benign verdict without featurization
+    # (under overload the prefilter runs even when PREFILTER is off, to sort out the benign-looking flows)
+    weight = 1.0
+    shadow = False
+    if PREFILTER or level >= SAMPLE_BENIGN:
+        with stage('prefilter'):
+            inspector = flow.metadata.get('body_inspector')
+            suspicious = bool(prefilter.is_suspicious(*raw_request_bytes(flow)) or (inspector and inspector.hits))
+        flow.metadata['prefilter_suspicious'] = suspicious
+        timings['prefilter'] = elapsed_ms(started)
+        if suspicious:
+            metrics.incr('prefilter_escalated')
+        else:
+            metrics.incr('prefilter_clean')
+            sample = clean_sample_rate(level)
+            if random.random() >= sample:
+                finish_flow(flow, 'clean', started, timings)
+                return
+            # Shadow-scored clean flow, it stands in for 1/sample clean flows in the online model (or the offline cluster counts)
+            shadow = True
+            weight = 1.0 / sample
+
+        if level >= PREFILTER_ONLY:
+            # Overloaded: the prefilter verdict is final. Flagged flows are logged and let through, or with
+            # OVERLOAD_SHED_BLOCK handled like a missed latency budget
+            action = fallback(flow) if OVERLOAD_SHED_BLOCK else 'allowed'
+            log.warning(f"Suspicious request (prefilter only, overloaded)! {flow.request.method} {flow.request.pretty_url} {action}.")
+            finish_flow(flow, 'suspicious', started, timings)
+            return
+
+    if level >= SAMPLE_BENIGN:
+        # Degraded: the classified flows are a sample skewed towards suspicious ones, they are scored but the
+        # online model, the offline counts and the profiles learn nothing from them until the load is gone
+        weight = None
+
+    # Tier 2: full featurization and the K-Means model, within the latency budget
+    # Reading the response details now, the fallback may replace the response while the classifier still runs
+    response_status = flow.response.status_code
+    response_time = flow.response.timestamp_end - flow.request.timestamp_start
+    flow.metadata['stage'] = 'queued'
+    if overload is not None:
+        overload.enter()
+    if not LATENCY_BUDGET_MS:
+        run_classifier(flow, started, timings, weight, shadow, response_status, response_time)
+        return
+
+    task = asyncio.get_running_loop().run_in_executor(classifier, run_classifier, flow, started, timings, weight, shadow, response_status, response_time)
+    try:
+        # The shield keeps the classification running past the deadline, its verdict is still recorded
+        await asyncio.wait_for(asyncio.shield(task), max(0.0, LATENCY_BUDGET_MS - elapsed_ms(started)) / 1000)
+    except asyncio.TimeoutError:
+        apply_fallback(flow, started)
+
+def run_classifier(*args):
+    '''
+    Runs classify_flow and reports the time it took to the overload controller.
+    '''
+    begun = time.perf_counter()
+    try:
+        classify_flow(*args)
+    finally:
+        if overload is not None:
+            overload.leave(elapsed_ms(begun))
+
+def classify_flow(flow: http.HTTPFlow, started, timings, weight, shadow, response_status, response_time):
+    flow.metadata['stage'] = 'featurize'
+    stage = time.perf_counter()
     features = parse_request(flow)
-    features['response_status'] = response.status_code
-    features['response_time'] = flow.response.timestamp_end - flow.request.timestamp_start
+    features['response_status'] = response_status
+    features['response_time'] = response_time
     
     # Creating a DataFrame with the new request
     new_request_df = pd.DataFrame([features])
     new_request_df['nature'] = 'new request'
-    
-    # Loading the existing clustered data
-    clustered_data = pd.read_csv('data/clustered_results_with_features.csv')
-    
-    # Predicting the cluster for the new request
-    prediction = predict_model(model, data=new_request_df)
-    new_request_df['Cluster'] = prediction['Cluster'].values[0]
-    
-    # Appending the new request to the existing clustered data
-    updated_data = clustered_data.append(new_request_df, ignore_index=True)
-    
-    # Checking if the new cluster has the highest number of requests
-    cluster_counts = updated_data['Cluster'].value_counts()
-    new_cluster = new_request_df['Cluster'].values[0]
-    if cluster_counts[new_cluster] < cluster_counts.max():
-        print(f"Intrusion detected! New request added to cluster {new_cluster} but cluster {cluster_counts.idxmax()} has more requests.")
-    
-    # Save the updated data
-    updated_data.to_csv('data/clustered_results_with_features.csv', index=False)
+    timings['featurize'] = elapsed_ms(stage)
+
+    flow.metadata['stage'] = 'classify'
+    stage = time.perf_counter()
+    with model_lock:
+        if ONLINE_LEARNING:
+            new_cluster, normal_cluster, is_intrusion = classify_online(new_request_df, weight)
+        else:
+            new_cluster, normal_cluster, is_intrusion = classify_offline(new_request_df, weight)
+    timings['classify'] = elapsed_ms(stage)
+
+    if is_intrusion:
+        log.warning(f"Intrusion detected! New request added to cluster {new_cluster} but cluster {normal_cluster} has more requests.")
+        if shadow:
+            metrics.incr('prefilter_misses')
+            log.warning(f"Prefilter miss! {flow.request.method} {flow.request.pretty_url} passed the prefilter but was flagged by the model.")
+
+    is_anomaly = False
+    if profiles is not None:
+        flow.metadata['stage'] = 'profile'
+        key, params = flow.metadata['endpoint']
+        is_anomaly = features['profile_score'] >= PROFILE_THRESHOLD
+        if is_anomaly:
+            metrics.incr('profile_anomalies')
+            log.warning(f"Endpoint anomaly! {flow.request.method} {flow.request.pretty_url} deviates from the profile of {key} (score {features['profile_score']}).")
+        elif not is_intrusion and weight is not None:
+            profiles.update(key, params, weight)
+        metrics.set('profile_endpoints', len(profiles))
+
+    verdict = 'intrusion' if is_intrusion else 'anomaly' if is_anomaly else 'normal'
+    if verdict == 'normal' and reloader is not None:
+        canary.append(features)
+    flow.metadata['stage'] = 'finish'
+    finish_flow(flow, verdict, started, timings, new_cluster, features)
+
+def fallback(flow: http.HTTPFlow):
+    '''
+    Answers a flow that is not classified in time according to LATENCY_FALLBACK; returns the action taken.
+    '''
+    if LATENCY_FALLBACK == 'prefilter':
+        block = flow.metadata.get('prefilter_suspicious')
+        if block is None:
+            block = prefilter.is_suspicious(*raw_request_bytes(flow))
+    else:
+        block = LATENCY_FALLBACK == 'block'
+    if not block:
+        return 'allowed'
+    flow.response = http.Response.make(403, b'Request blocked by the WAF', {'Content-Type': 'text/plain'})
+    metrics.incr('fallback_blocked')
+    return 'blocked'
+
+def event_detail(flow: http.HTTPFlow, detail=None):
+    '''
+    Detail column of a flow's event, with the replay label of the load test appended.
+    '''
+    label = flow.metadata.get('replay_label')
+    if label is None:
+        return detail
+    return f"{detail} label={label}" if detail else f"label={label}"
+
+def apply_fallback(flow: http.HTTPFlow, started):
+    '''
+    Handles a flow whose classification overran LATENCY_BUDGET_MS, and records the overrun with the
+    stage the classifier was in.
+    '''
+    stage = flow.metadata.get('stage', 'queued')
+    metrics.incr('latency_overruns')
+    metrics.incr(f'latency_overruns_{stage}')
+    action = fallback(flow)
+
+    duration = elapsed_ms(started)
+    log.warning(f"Latency budget exceeded! {flow.request.method} {flow.request.pretty_url} was still in stage {stage} after {duration:.0f} ms, {action} ({LATENCY_FALLBACK} fallback).")
+    if store is not None:
+        store.record(source='proxy_interceptor', host=flow.request.host, method=flow.request.method, path=flow.request.path,
+                     verdict='overrun', duration_ms=duration, detail=event_detail(flow, f"stage={stage} action={action}"))
+
+def clean_sample_rate(level):
+    '''
+    Fraction of prefilter-clean flows still classified at this overload level.
+    '''
+    if level >= PREFILTER_ONLY:
+        return 0.0
+    sample = PREFILTER_SHADOW_SAMPLE if PREFILTER else 1.0
+    if level >= SAMPLE_BENIGN:
+        sample = min(sample, OVERLOAD_BENIGN_SAMPLE)
+    return sample
+
+def overload_level():
+    '''
+    Re-evaluates the overload level for a new flow and publishes it in the metrics.
+    '''
+    if overload is None:
+        return NORMAL
+    change = overload.update()
+    if change:
+        metrics.incr('overload_escalations' if change > 0 else 'overload_recoveries')
+        log.warning(f"Overload level {overload.level} ({overload.name}): classifier backlog {overload.queue_depth}, stage latency {overload.latency_ms:.0f} ms.")
+    metrics.set('overload_level', overload.level)
+    metrics.set('overload_mode', overload.name)
+    metrics.set('overload_queue_depth', overload.queue_depth)
+    metrics.set('overload_stage_latency_ms', overload.latency_ms)
+    if overload.level:
+        metrics.incr(f'overload_flows_{overload.name}')
+    return overload.level
+
+def finish_flow(flow: http.HTTPFlow, verdict, started, timings, cluster=None, features=None):
+    duration = elapsed_ms(started)
+    metrics.incr('flows')
+    metrics.ratio('prefilter_escalation_rate', 'prefilter_escalated', 'flows')
+    # Under overload (skip_persistence and above) only the incidents are stored
+    if store is not None and (overload is None or overload.level < SKIP_PERSISTENCE or verdict not in ('clean', 'normal')):
+        request = flow.request
+        store.record(source='proxy_interceptor', host=request.host, method=request.method, path=request.path,
+                     verdict=verdict, cluster=cluster, score=features.get('profile_score') if features else None,
+                     duration_ms=duration, features=features, timings=timings, detail=event_detail(flow))
+        metrics.set('event_store_pending', store.pending())
+        metrics.set('event_store_dropped', store.dropped)
+    metrics.flow_done()
+
+def validate_model(candidate):
+    '''
+    Canary check of a new model before it goes live: it may only use features the interceptor extracts,
+    and has to score the recent normal flows to finite values and flag at most MODEL_CANARY_MAX_FLAGGED of
+    them as intrusions. The swap is deferred until MODEL_CANARY_MIN normal flows have been seen.
+    '''
+    known = set(FEATURE_COLUMNS + STREAM_FEATURE_COLUMNS + (PROFILE_FEATURE_COLUMNS if profiles is not None else []))
+    missing = [name for name in candidate.feature_names if name not in known]
+    if missing:
+        raise ArtifactError(f"model {candidate.version} expects features the interceptor does not extract: {', '.join(missing)}")
+    rows = list(canary)
+    if len(rows) < MODEL_CANARY_MIN:
+        raise ReloadDeferred(f"only {len(rows)} of the {MODEL_CANARY_MIN} normal flows needed to validate model {candidate.version}")
+    X = candidate.transform(rows)
+    if not np.isfinite(X).all():
+        raise ArtifactError(f"model {candidate.version} turns the canary batch into non-finite values")
+    weights = candidate.weights[candidate.predict(X)]
+    flagged = float((weights < candidate.weights.max()).mean())
+    if flagged > MODEL_CANARY_MAX_FLAGGED:
+        raise ArtifactError(f"model {candidate.version} flags {flagged:.0%} of {len(rows)} recent normal flows as intrusions")
+
+def swap_model(candidate):
+    '''
+    Installs a validated model, between two classifications.
+    '''
+    global model, online_model, cluster_counts
+    with model_lock:
+        previous = model.version
+        model = candidate
+        if ONLINE_LEARNING:
+            # The live centroids belong to the old model, the online model starts over from the new one
+            online_model = OnlineKMeans(model.centroids, model.weights, base_version=model.version, **online_options)
+            online_model.save()
+        cluster_counts = None
+    canary.clear()
+    metrics.set('model_version', model.version)
+    log.warning(f"[model] Swapped model {previous} for {model.version}.")
+
+def report_reload(ok, elapsed, error):
+    metrics.incr('model_reloads' if ok else 'model_reload_failures')
+    metrics.set('model_reload_ms', elapsed)
+
+reloader = None
+if MODEL_RELOAD:
+    reloader = ModelReloader(MODEL_PATH, CompactModel, validate_model, swap_model, MODEL_RELOAD_CHECK, report_reload)
+    try:
+        # kill -HUP <mitmdump pid> reloads at once
+        signal.signal(signal.SIGHUP, lambda signum, frame: reloader.request())
+    except (AttributeError, ValueError):
+        # No SIGHUP on Windows, and no signal handlers outside the main thread
+        pass
+
+def done():
+    # mitmproxy shutdown hook: letting running classifications finish, then writing out the queued events
+    if reloader is not None:
+        reloader.stop()
+    classifier.shutdown(wait=True)
+    if store is not None:
+        store.close()
 
 # To run this script with mitmproxy, use the following command:
 # mitmdump -s scripts/proxy_interceptor.py
@@ -0,0 +1,80 @@
+'''
+Request features of the interceptor, independent of mitmproxy: proxy_interceptor.py calls
+extract_features() on live flows and score_logs.py on captured traffic, so both score exactly the same vector.
+'''
+import re
+from header_features import HEADER_FEATURE_COLUMNS, header_features
+from char_histogram import CHAR_CLASSES, CharHistogram
+from normalize import CanonicalRequest
+from param_scanner import PARAM_FEATURE_COLUMNS, ParamScanner, extract_params, stream_tokens
+
+# Defining SQL keywords and XSS patterns globally
+sql_keywords = [
+    'SELECT', 'INSERT', 'UPDATE', 'DELETE', 'DROP', 'CREATE', 'ALTER', 'TRUNCATE',
+    'UNION', 'FROM', 'WHERE', 'AND', 'OR', 'LIKE', 'BETWEEN', 'IN', 'JOIN', 'ON', 'GROUP BY', 'ORDER BY', 'HAVING', 'LIMIT'
+]
+
+xss_patterns = [
+    r'<script', r'alert\(', r'\(alert\(', r'</script>', r'document\.cookie',
+    r'eval\(', r'window\.location', r'setTimeout\(', r'setInterval\(',
+    r'execCommand', r'innerHTML', r'outerHTML', r'document\.write',
+    r'XMLHttpRequest\.open', r'FormData\.append', r'document\.getElementById',
+    r'document\.createElement', r'document\.execCommand', r'window\.open',
+    r'window\.eval', r'window\.setTimeout', r'window\.setInterval',
+    r'document\.URL', r'location\.href', r'location\.search',
+    r'document\.referrer', r'navigator\.sendBeacon', r'importScripts', r'`'
+]
+
+# Every feature extract_features() returns
+FEATURE_COLUMNS = ['method', 'path', 'body', 'body_length'] + list(CHAR_CLASSES) + \
+    ['has_sql_keywords', 'has_xss_payload', 'has_csrf_token', 'response_status', 'response_time'] + \
+    PARAM_FEATURE_COLUMNS + HEADER_FEATURE_COLUMNS
+
+# Single-pass scanner over every query and body parameter, bounded per request (see param_scanner.py)
+param_scanner = ParamScanner(sql_keywords, xss_patterns)
+
+# The canonical views are already lowercased, so the patterns are too and no case-insensitive matching is needed
+xss_pattern = re.compile('|'.join(xss_patterns).lower())
+
+# Pattern the streamed bodies are inspected with (see body_stream.py), the same tokens minus the bare quotes
+stream_pattern = ParamScanner(sql_keywords, xss_patterns, stream_tokens).pattern
+
+# Character counts of the UID value (num_commas, num_quotes, ...) in one pass, see char_histogram.py
+char_histogram = CharHistogram(CHAR_CLASSES)
+
+def uid_param(body):
+    '''
+    Returns the value of the uid form field of a body (None without one), the value the count features are taken from.
+    '''
+    if body:
+        for param in body.split('&'):
+            if param.startswith('uid='):
+                return param.split('=')[1]
+    return None
+
+def extract_features(method, url, headers, body, content_type=''):
+    '''
+    Extracts the request features from the full URL, the headers (a dict) and the decoded text body.
+    Returns the features and the (name, value) parameters of the request, for the endpoint profiles.
+    '''
+    uid_value = uid_param(body)
+
+    # Building the canonical (decoded) views once, every check below reads from them
+    canonical = CanonicalRequest(url, uid_value, headers)
+
+    features = {
+        'method': method,
+        'path': canonical.url.decoded,
+        'body': uid_value if uid_value else '',
+        'body_length': len(uid_value) if uid_value else 0,
+        **char_histogram.count(uid_value),
+        'has_sql_keywords': int(any(keyword.lower() in canonical.body.lower for keyword in sql_keywords)) if uid_value else 0,
+        'has_xss_payload': int(bool(xss_pattern.search(canonical.url.lower) or xss_pattern.search(canonical.header_text.lower))),
+        'has_csrf_token': int(any('csrf_token' in k or 'anti_csrf_token' in k or 'xsrf_token' in k for k in canonical.header_names)),
+        'response_status': 0,  # This will be updated later
+        'response_time': 0  # This will be updated later
+    }
+    params = list(extract_params(url.partition('?')[2].partition('#')[0], body, content_type))
+    features.update(param_scanner.scan(params, canonical))
+    features.update(header_features(headers))
+    return features, params
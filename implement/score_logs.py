@@ -0,0 +1,213 @@
+'''
+Offline scoring of captured traffic with a model artifact: HAR captures and Burp XML exports are
+featurized with the interceptor's extractor (request_features.py) on all cores, then the whole batch is
+scored in one vectorized transform/predict. Every request gets its cluster and the model verdict: intrusion
+when its cluster is smaller than the dominant one, as in the interceptor's offline mode. The interceptor's
+other tiers are not applied: every request is scored by the model, whatever the prefilter would say, and
+the endpoint profiles (anomaly verdicts) are left out.
+
+Usage:
+    python implement/score_logs.py request_logs/*.har request_logs/pokemon.log --model models/kmeans_model.wafm --out data/scored.csv
+'''
+import argparse
+import base64
+import csv
+import io
+import json
+import os
+import urllib.parse
+import xml.etree.ElementTree as ET
+from concurrent.futures import ProcessPoolExecutor
+from collections import Counter, deque
+
+import numpy as np
+import pandas as pd
+
+from model_artifact import CompactModel
+from request_features import extract_features
+from body_stream import is_text_content
+from diagnostics import PROFILE_MODES, enable_profiling, stage
+
+CHUNK_SIZE = 1000  # Requests per featurization task
+PREDICT_ROWS = 65536  # Rows per predict() call, bounds the distance matrix
+
+OUTPUT_COLUMNS = ['source', 'entry', 'method', 'url', 'cluster', 'normal_cluster', 'verdict']
+
+def read_har(path):
+    '''
+    Yields (method, url, headers, body, content_type, status, time) for every entry of a HAR capture.
+    '''
+    with open(path, 'r', encoding='utf-8') as f:
+        har_data = json.load(f)
+    for entry in har_data['log']['entries']:
+        request = entry['request']
+        headers = {header['name']: header['value'] for header in request['headers']}
+        post_data = request.get('postData', {})
+        content_type = next((value for name, value in headers.items() if name.lower() == 'content-type'), post_data.get('mimeType', ''))
+        body = post_data.get('text', '')
+        if not body and post_data.get('params'):
+            # Form bodies are often captured as decoded params only, rebuilt here as they went over the wire
+            body = urllib.parse.urlencode([(param['name'], param.get('value', '')) for param in post_data['params']])
+        body = body if is_text_content(content_type) else ''
+        # HAR times are in milliseconds, the interceptor's response_time in seconds
+        yield (request['method'], request['url'], headers, body, content_type,
+               entry['response']['status'], entry.get('time', 0) / 1000)
+
+def split_raw_request(raw):
+    '''
+    Splits a raw HTTP request into its request line, headers (a dict) and body.
+    '''
+    head, sep, body = raw.partition('\r\n\r\n')
+    if not sep:
+        head, _, body = raw.partition('\n\n')
+    lines = head.splitlines()
+    headers = {}
+    for line in lines[1:]:
+        name, sep, value = line.partition(':')
+        if sep:
+            headers[name.strip()] = value.strip()
+    return (lines[0] if lines else ''), headers, body
+
+def iter_documents(path):
+    '''
+    Yields the XML documents of a Burp log one at a time; saving more items into an existing log appends
+    a whole new export (XML declaration and all) to the file.
+    '''
+    lines = []
+    with open(path, 'rb') as f:
+        for line in f:
+            if line.startswith(b'<?xml') and lines:
+                yield b''.join(lines)
+                lines = []
+            lines.append(line)
+    if lines:
+        yield b''.join(lines)
+
+def read_burp(path):
+    '''
+    Yields (method, url, headers, body, content_type, status, time) for every item of a Burp XML export.
+    '''
+    for document in iter_documents(path):
+        yield from read_burp_items(io.BytesIO(document))
+
+def read_burp_items(source):
+    for _, item in ET.iterparse(source):
+        if item.tag != 'item':
+            continue
+        request = item.find('request')
+        raw = request.text or ''
+        raw = base64.b64decode(raw) if request.get('base64') == 'true' else raw.encode('utf-8')
+        request_line, headers, body = split_raw_request(raw.decode('utf-8', 'replace'))
+        content_type = next((value for name, value in headers.items() if name.lower() == 'content-type'), '')
+        method = item.findtext('method') or request_line.split(' ', 1)[0]
+        status = item.findtext('status') or '0'
+        yield (method, item.findtext('url') or '', headers, body if is_text_content(content_type) else '',
+               content_type, int(status) if status.isdigit() else 0, 0)
+        item.clear()
+
+def read_log(path):
+    '''
+    Picks the reader by content: HAR captures are JSON, Burp exports XML.
+    '''
+    with open(path, 'rb') as f:
+        start = f.read(64).lstrip()
+    return read_har(path) if start.startswith(b'{') else read_burp(path)
+
+def featurize(chunk, feature_names):
+    '''
+    Featurizes a chunk of requests; returns the model features as a float64 matrix (one row per request).
+    Runs in the worker processes.
+    '''
+    X = np.empty((len(chunk), len(feature_names)))
+    for i, (method, url, headers, body, content_type, status, time) in enumerate(chunk):
+        features, _ = extract_features(method, url, headers, body, content_type)
+        features['response_status'] = status
+        features['response_time'] = time
+        X[i] = [features.get(name, np.nan) for name in feature_names]
+    return X
+
+def iter_chunks(paths):
+    '''
+    Yields (meta, requests) chunks of at most CHUNK_SIZE requests over all logs; meta holds the output
+    columns known before scoring.
+    '''
+    meta, requests = [], []
+    for path in paths:
+        for entry, request in enumerate(read_log(path)):
+            meta.append((path, entry, request[0], request[1]))
+            requests.append(request)
+            if len(requests) == CHUNK_SIZE:
+                yield meta, requests
+                meta, requests = [], []
+    if requests:
+        yield meta, requests
+
+def featurize_logs(paths, feature_names, jobs):
+    '''
+    Featurizes all logs with jobs worker processes, in order. Returns the output metadata and the feature matrix.
+    '''
+    meta, blocks = [], []
+    if jobs == 1:
+        for chunk_meta, requests in iter_chunks(paths):
+            meta.extend(chunk_meta)
+            blocks.append(featurize(requests, feature_names))
+    else:
+        with ProcessPoolExecutor(max_workers=jobs) as executor:
+            # A bounded number of chunks in flight, so the logs are read while the workers featurize
+            pending = deque()
+            for chunk_meta, requests in iter_chunks(paths):
+                meta.extend(chunk_meta)
+                pending.append(executor.submit(featurize, requests, feature_names))
+                if len(pending) >= 2 * jobs:
+                    blocks.append(pending.popleft().result())
+            blocks.extend(future.result() for future in pending)
+    X = np.vstack(blocks) if blocks else np.empty((0, len(feature_names)))
+    return meta, X
+
+def score(model, X):
+    '''
+    Returns the cluster of every row of raw features and whether it is an intrusion for this model.
+    '''
+    Z = model.transform(pd.DataFrame(X, columns=model.feature_names))
+    clusters = np.concatenate([model.predict(Z[i:i + PREDICT_ROWS]) for i in range(0, len(Z), PREDICT_ROWS)]) if len(Z) else np.empty(0, dtype=np.int64)
+    return clusters, model.weights[clusters] < model.weights.max()
+
+def write_scores(path, meta, clusters, intrusions, normal_cluster):
+    tmp_path = path + '.tmp'
+    with open(tmp_path, 'w', newline='', encoding='utf-8') as f:
+        writer = csv.writer(f)
+        writer.writerow(OUTPUT_COLUMNS)
+        for (source, entry, method, url), cluster, intrusion in zip(meta, clusters, intrusions):
+            writer.writerow([source, entry, method, url, f"Cluster {cluster}", normal_cluster, 'intrusion' if intrusion else 'normal'])
+    os.replace(tmp_path, path)
+
+def main():
+    parser = argparse.ArgumentParser(description='Score HAR captures and Burp XML exports with a model artifact.')
+    parser.add_argument('logs', nargs='+', help='HAR captures and Burp XML exports')
+    parser.add_argument('--model', default='models/kmeans_model.wafm', help='Model artifact (see model_artifact.py)')
+    parser.add_argument('--out', default='data/scored.csv', help='Output CSV, one row per request')
+    parser.add_argument('--jobs', type=int, default=os.cpu_count() or 1, help='Featurization worker processes')
+    parser.add_argument('--profile', choices=PROFILE_MODES, help='Write per-stage cpu, sample or memory profiles to profiles/')
+    opts = parser.parse_args()
+    enable_profiling(opts.profile)
+
+    model = CompactModel(opts.model)
+    with stage('featurize'):
+        meta, X = featurize_logs(opts.logs, model.feature_names, max(1, opts.jobs))
+    with stage('classify'):
+        clusters, intrusions = score(model, X)
+    normal_cluster = f"Cluster {model.weights.argmax()}"
+    with stage('write'):
+        write_scores(opts.out, meta, clusters, intrusions, normal_cluster)
+
+    totals = Counter()
+    flagged = Counter()
+    for (source, *_), intrusion in zip(meta, intrusions):
+        totals[source] += 1
+        flagged[source] += int(intrusion)
+    for source in opts.logs:
+        print(f"[+] {source}: {totals[source]} requests, {flagged[source]} intrusions")
+    print(f"[+] {len(meta)} requests scored with model {model.version} -> {opts.out}")
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,184 @@
+'''
+Token-stream matcher for the SQLi pattern set of the HAR parsers.
+
+The old detector ran one regex per pattern over the URL and the body, and the gap patterns
+(SELECT ... FROM, UNION ... SELECT, OR ... = and so on) are lazy wildcards. re.search restarts such a
+pattern at every occurrence of its first keyword and scans to the end of the text each time, so a payload
+repeating the first keyword without its partner ('or or or ...') costs O(n^2).
+
+Here the text is tokenized once into words and word-adjacent '=' signs, and all rules are matched in
+a single pass over the tokens, remembering which first keywords have been seen so far. Every character
+is read a constant number of times, whatever the input: the cost is O(n) in the text length.
+The verdicts are the same as those of the regex set (LEGACY_PATTERNS, kept for the benchmark below).
+
+Benchmark against the regexes with adversarial inputs (exits non-zero if the linear bound is broken):
+    python implement/sql_tokens.py --benchmark
+Check that both agree on a dataset:
+    python implement/sql_tokens.py --verify csv_files/http_log_with_security_analysis.csv
+'''
+import argparse
+import re
+import time
+
+# Words, and '=' signs with a word character on both sides (the regexes' \b=\b)
+token_pattern = re.compile(r'\w+|(?<=\w)=(?=\w)')
+
+EQUALS = '='
+
+# Rules. A gap rule matches when its second token appears anywhere after its first one, a phrase rule
+# when both words are separated by exactly one space, a keyword rule on the word alone.
+GAP_RULES = [('select', 'from'), ('update', 'set'), ('union', 'select'), ('where', EQUALS), ('and', EQUALS), ('or', EQUALS)]
+PHRASE_RULES = [('insert', 'into'), ('delete', 'from'), ('drop', 'table'), ('truncate', 'table'), ('create', 'table'),
+                ('alter', 'table'), ('group', 'by'), ('order', 'by')]
+KEYWORD_RULES = ['like', 'between', 'in', 'join', 'having', 'limit']
+
+# The regex set the matcher replaces
+LEGACY_PATTERNS = [
+    r'\bSELECT\b.*?\bFROM\b',       # SELECT ... FROM ...
+    r'\bINSERT INTO\b',             # INSERT INTO ...
+    r'\bUPDATE\b.*?\bSET\b',        # UPDATE ... SET ...
+    r'\bDELETE FROM\b',             # DELETE FROM ...
+    r'\bDROP TABLE\b',              # DROP TABLE ...
+    r'\bTRUNCATE TABLE\b',          # TRUNCATE TABLE ...
+    r'\bCREATE TABLE\b',            # CREATE TABLE ...
+    r'\bALTER TABLE\b',             # ALTER TABLE ...
+    r'\bUNION\b.*?\bSELECT\b',      # UNION ... SELECT ...
+    r'\bWHERE\b.*?\b=\b',           # WHERE ... =
+    r'\bAND\b.*?\b=\b',             # AND ... =
+    r'\bOR\b.*?\b=\b',              # OR ... =
+    r'\bLIKE\b',                    # LIKE ...
+    r'\bBETWEEN\b',                 # BETWEEN ...
+    r'\bIN\b',                      # IN ...
+    r'\bJOIN\b',                    # JOIN ...
+    r'\bGROUP BY\b',                # GROUP BY ...
+    r'\bORDER BY\b',                # ORDER BY ...
+    r'\bHAVING\b',                  # HAVING ...
+    r'\bLIMIT\b',                   # LIMIT ...
+]
+
+class SqliMatcher:
+    '''
+    Matches GAP_RULES, PHRASE_RULES and KEYWORD_RULES in one pass over the token stream of a text.
+    '''
+
+    def __init__(self, gap_rules=GAP_RULES, phrase_rules=PHRASE_RULES, keyword_rules=KEYWORD_RULES):
+        self.keywords = set(keyword_rules)
+        self.phrases = set(phrase_rules)
+        # second token -> the first tokens it completes a gap rule with
+        self.gaps = {}
+        for first, second in gap_rules:
+            self.gaps.setdefault(second, set()).add(first)
+        self.openers = {first for first, _ in gap_rules}
+        self.vocabulary = self.keywords | self.openers | set(self.gaps) | {word for phrase in phrase_rules for word in phrase}
+        self.longest = max(len(word) for word in self.vocabulary)
+
+    def search(self, text):
+        '''
+        Returns the first rule matched in text (a keyword, or a (first, second) pair), or None.
+        '''
+        seen = set()
+        previous, previous_end = None, -2
+        for match in token_pattern.finditer(text):
+            token = match.group()
+            # Long words cannot be keywords, skip folding them
+            token = token.casefold() if len(token) <= self.longest else None
+            if token not in self.vocabulary:
+                previous = None
+                continue
+            start = match.start()
+            if token in self.keywords:
+                return token
+            if previous and start == previous_end + 1 and text[previous_end] == ' ' and (previous, token) in self.phrases:
+                return (previous, token)
+            for first in self.gaps.get(token, ()):
+                if first in seen:
+                    return (first, token)
+            if token in self.openers:
+                seen.add(token)
+            previous, previous_end = token, match.end()
+        return None
+
+    def matches(self, *texts):
+        return int(any(self.search(text) for text in texts))
+
+def legacy_search(text, patterns=LEGACY_PATTERNS):
+    for pattern in patterns:
+        if re.search(pattern, text, re.IGNORECASE):
+            return True
+    return False
+
+# Adversarial inputs: one opener repeated without its partner makes the lazy gap regexes quadratic
+ADVERSARIAL = {
+    'select-without-from': 'select ',
+    'or-without-equals': 'or ',
+    'union-without-select': 'union ',
+    'openers-without-partners': 'where and update union ',
+}
+
+def timed(func, text, repeat):
+    best = float('inf')
+    for _ in range(repeat):
+        start = time.perf_counter()
+        func(text)
+        best = min(best, time.perf_counter() - start)
+    return best
+
+def benchmark(sizes, repeat, legacy_limit, tolerance):
+    '''
+    Times both detectors on growing adversarial inputs. The matcher's time per KB may not grow by more
+    than tolerance between the smallest and the largest size; returns False if it does.
+    '''
+    matcher = SqliMatcher()
+    bounded = True
+    print('{:<26} {:>10} {:>14} {:>14} {:>12}'.format('input', 'bytes', 'regex ms', 'tokens ms', 'tokens us/KB'))
+    for name, unit in ADVERSARIAL.items():
+        per_kb = []
+        for size in sizes:
+            text = unit * (size // len(unit))
+            tokens = timed(matcher.search, text, repeat)
+            legacy = '{:14.2f}'.format(timed(legacy_search, text, 1) * 1e3) if len(text) <= legacy_limit else '{:>14}'.format('skipped')
+            per_kb.append(tokens * 1e6 / (len(text) / 1024))
+            print('{:<26} {:>10} {} {:14.2f} {:12.1f}'.format(name, len(text), legacy, tokens * 1e3, per_kb[-1]))
+        growth = per_kb[-1] / per_kb[0]
+        if growth > tolerance:
+            print('{}: time per KB grew {:.1f}x, over the {:.1f}x bound'.format(name, growth, tolerance))
+            bounded = False
+    return bounded
+
+def verify(csv_path, columns):
+    '''
+    Runs both detectors over the text columns of a CSV and returns the rows where they disagree.
+    '''
+    import pandas as pd
+
+    matcher = SqliMatcher()
+    data = pd.read_csv(csv_path, usecols=lambda column: column in columns, dtype=str).fillna('')
+    mismatches = []
+    for index, row in data.iterrows():
+        for column in data.columns:
+            text = re.sub(r'\s+', ' ', row[column].lower()).strip()
+            if bool(matcher.search(text)) != legacy_search(text):
+                mismatches.append((index, column, text[:120]))
+    return len(data), mismatches
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Benchmark or verify the token-stream SQLi matcher')
+    parser.add_argument('--benchmark', action='store_true', help='Time both detectors on adversarial inputs')
+    parser.add_argument('--sizes', default='4096,16384,65536,262144', help='Adversarial input sizes in bytes')
+    parser.add_argument('--repeat', type=int, default=3, help='Runs per measurement, the best one is kept')
+    parser.add_argument('--legacy-limit', type=int, default=16384, help='Largest input the regexes are timed on')
+    parser.add_argument('--tolerance', type=float, default=3.0, help='Allowed growth of the time per KB')
+    parser.add_argument('--verify', metavar='CSV', help='Compare both detectors on the path and body columns of a CSV')
+    args = parser.parse_args()
+
+    if args.verify:
+        rows, mismatches = verify(args.verify, ['path', 'body'])
+        for index, column, text in mismatches:
+            print('row {} {}: {}'.format(index, column, text))
+        print('{} rows checked, {} mismatches'.format(rows, len(mismatches)))
+    if args.benchmark:
+        sizes = [int(size) for size in args.sizes.split(',')]
+        if not benchmark(sizes, args.repeat, args.legacy_limit, args.tolerance):
+            exit(1)
+    if args.verify and mismatches:
+        exit(1)
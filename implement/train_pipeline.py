@@ -0,0 +1,187 @@
+'''
+Training pipeline: HAR logs -> features -> merged dataset -> near-duplicate removal -> K-Means model.
+
+Every stage output is stored under the cache directory, named after the hash of its inputs and of the
+extractor source code. A rerun only re-parses logs that changed (or all of them when the extractor changed),
+so retraining after adding one capture costs one parse plus the K-Means fit.
+
+Usage:
+    python implement/train_pipeline.py --logs request_logs --model models/kmeans_model --data data
+'''
+import argparse
+import copy
+import csv
+import glob
+import hashlib
+import os
+import sys
+
+import pandas as pd
+
+here = os.path.dirname(os.path.abspath(__file__))
+sys.path.append(os.path.join(here, '..', 'log_parsers'))
+import log_parser_for_har4 as har_parser
+from dedup import deduplicate
+from model_artifact import export_pipeline
+from endpoint_profiles import build_index
+from diagnostics import PROFILE_MODES, enable_profiling, stage
+
+# Source files whose content defines the extracted features; editing any of them invalidates the cache
+EXTRACTOR_FILES = [
+    os.path.join(here, '..', 'log_parsers', 'log_parser_for_har4.py'),
+    os.path.join(here, 'normalize.py'),
+    os.path.join(here, 'param_scanner.py'),
+    os.path.join(here, 'header_features.py'),
+    os.path.join(here, 'char_histogram.py'),
+]
+
+# Features the K-Means model is trained on
+MODEL_FEATURES = ['num_commas', 'num_hyphens', 'num_brackets', 'num_quotes', 'num_double_quotes', 'num_slashes',
+                  'num_braces', 'num_spaces', 'has_sql_keywords', 'has_xss_payload', 'has_csrf_token'] + \
+                 har_parser.PARAM_FEATURE_COLUMNS + har_parser.HEADER_FEATURE_COLUMNS
+
+# Quoting every text field, pandas leaves lone carriage returns in payloads unquoted otherwise
+CSV_QUOTING = csv.QUOTE_NONNUMERIC
+
+# Label ('nature') of the requests in each capture, by file name; anything else is crawled (safe) traffic
+LOG_NATURE = {
+    'sql_attack.har': 'sqli',
+    'xss_attack.har': 'xss',
+}
+DEFAULT_NATURE = 'crawl_req'
+
+def file_hash(path):
+    sha = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for block in iter(lambda: f.read(1 << 20), b''):
+            sha.update(block)
+    return sha.hexdigest()
+
+def extractor_version():
+    '''
+    Hash of the feature extraction source code.
+    '''
+    sha = hashlib.sha256()
+    for path in EXTRACTOR_FILES:
+        sha.update(file_hash(path).encode())
+    return sha.hexdigest()
+
+def featurize_log(har_file, cache_dir, version):
+    '''
+    Parses and featurizes one HAR capture, reusing the cached CSV when neither the log nor the extractor changed.
+    '''
+    key = hashlib.sha256((version + file_hash(har_file)).encode()).hexdigest()
+    cached = os.path.join(cache_dir, 'features-{}.csv'.format(key[:16]))
+    if os.path.exists(cached):
+        print(f"[cached]  {har_file}")
+        return cached
+
+    print(f"[parsing] {har_file}")
+    tmp_path = cached + '.tmp'
+    with open(tmp_path, 'w', newline='', encoding='utf-8') as f:
+        writer = csv.DictWriter(f, fieldnames=har_parser.fieldnames)
+        writer.writeheader()
+        for request_method, request_url, request_headers, request_body_params, response_status, response_time, response_body, response_headers, request_query, request_post_data in har_parser.parse_har(har_file):
+            features = har_parser.analyze_request_har(request_method, request_url, request_headers, request_body_params, response_status, response_time, har_parser.sql_keywords, request_query, request_post_data)
+            writer.writerow(features)
+    os.replace(tmp_path, cached)
+    return cached
+
+def merge(feature_files, cache_dir):
+    '''
+    Concatenates the per-capture feature CSVs into one labelled dataset (the all_req_1.csv of the notebook).
+    '''
+    key = hashlib.sha256(''.join(sorted(path + nature for path, nature in feature_files)).encode()).hexdigest()
+    cached = os.path.join(cache_dir, 'merged-{}.csv'.format(key[:16]))
+    if os.path.exists(cached):
+        return pd.read_csv(cached), cached
+
+    frames = []
+    for path, nature in feature_files:
+        frame = pd.read_csv(path)
+        frame['nature'] = nature
+        frames.append(frame)
+    merged = pd.concat(frames, ignore_index=True)
+    merged.to_csv(cached, index=False, quoting=CSV_QUOTING)
+    return merged, cached
+
+def train(merged, num_clusters, session_id):
+    '''
+    Fits the K-Means model with pycaret. Returns the model, the fitted preprocessing + K-Means pipeline
+    (what export_pipeline reads) and the training rows with the cluster assigned to each.
+    A 'weight' column (see dedup.py) is used as the sample weight of the fit.
+    '''
+    from pycaret.clustering import setup, create_model, assign_model, get_config
+
+    setup(data=merged[MODEL_FEATURES], normalize=True, session_id=session_id, verbose=False)
+    model = create_model('kmeans', num_clusters=num_clusters, verbose=False)
+    clustered = merged.copy()
+    if 'weight' in merged:
+        # pycaret cannot pass sample weights to the estimator: the configured KMeans is refitted on the
+        # preprocessed rows, so every deduplicated representative counts for its whole group
+        X = get_config('pipeline').transform(merged[MODEL_FEATURES]).astype('float64')
+        model.fit(X, sample_weight=merged['weight'].to_numpy(dtype='float64'))
+        clustered['Cluster'] = [f"Cluster {label}" for label in model.labels_]
+    else:
+        clustered['Cluster'] = assign_model(model)['Cluster'].values
+    # create_model returns the bare estimator, the fitted imputers and scaler are in the experiment's pipeline
+    pipeline = copy.deepcopy(get_config('pipeline'))
+    pipeline.steps.append(('trained_model', model))
+    return model, pipeline, clustered
+
+def main():
+    parser = argparse.ArgumentParser(description='Train the WAF K-Means model from HAR captures.')
+    parser.add_argument('--logs', default='request_logs', help='Directory holding the HAR captures')
+    parser.add_argument('--model', default='models/kmeans_model', help='Output model path (without .pkl)')
+    parser.add_argument('--data', default='data', help='Directory for all_req_1.csv and clustered_results_with_features.csv')
+    parser.add_argument('--cache', default='.cache/train', help='Directory for the content-addressed intermediate files')
+    parser.add_argument('--clusters', type=int, default=7, help='Number of K-Means clusters')
+    parser.add_argument('--session-id', type=int, default=123, help='pycaret session id (random seed)')
+    parser.add_argument('--no-dedup', action='store_true', help='Keep near-duplicate requests instead of collapsing them')
+    parser.add_argument('--profile', choices=PROFILE_MODES, help='Write per-stage cpu, sample or memory profiles to profiles/')
+    opts = parser.parse_args()
+    enable_profiling(opts.profile)
+
+    os.makedirs(opts.cache, exist_ok=True)
+    os.makedirs(opts.data, exist_ok=True)
+    os.makedirs(os.path.dirname(opts.model) or '.', exist_ok=True)
+    version = extractor_version()
+
+    # parse + featurize, only for captures not already in the cache
+    feature_files = []
+    har_files = sorted(glob.glob(os.path.join(opts.logs, '*.har')))
+    for har_file in har_files:
+        nature = LOG_NATURE.get(os.path.basename(har_file), DEFAULT_NATURE)
+        feature_files.append((featurize_log(har_file, opts.cache, version), nature))
+    if not feature_files:
+        print(f"[+] Error!!! No HAR files found in {opts.logs}")
+        sys.exit(1)
+
+    # merge
+    with stage('merge'):
+        merged, merged_path = merge(feature_files, opts.cache)
+    print(f"[merged]  {len(merged)} requests from {len(feature_files)} captures")
+
+    # dedup, one weighted representative per near-duplicate group
+    if not opts.no_dedup:
+        with stage('dedup'):
+            merged = deduplicate(merged)
+        print(f"[dedup]   {len(merged)} representatives left")
+    merged.to_csv(os.path.join(opts.data, 'all_req_1.csv'), index=False, quoting=CSV_QUOTING)
+
+    # endpoint profiles, from the raw requests of the normal (crawled) captures
+    profiles = build_index(har_file for har_file in har_files if LOG_NATURE.get(os.path.basename(har_file), DEFAULT_NATURE) == DEFAULT_NATURE)
+    profiles.save(os.path.join(os.path.dirname(opts.model) or '.', 'endpoint_profiles.json'))
+    print(f"[profile] {len(profiles)} endpoint profiles")
+
+    # train + export
+    from pycaret.clustering import save_model
+    with stage('train'):
+        model, pipeline, clustered = train(merged, opts.clusters, opts.session_id)
+    save_model(model, opts.model, verbose=False)
+    export_pipeline(pipeline, opts.model + '.wafm', merged['weight'] if 'weight' in merged else None)
+    clustered.to_csv(os.path.join(opts.data, 'clustered_results_with_features.csv'), index=False, quoting=CSV_QUOTING)
+    print(f"[trained] {opts.model}.pkl and {opts.model}.wafm with {opts.clusters} clusters")
+
+if __name__ == '__main__':
+    main()
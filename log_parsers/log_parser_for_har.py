@@ -1,9 +1,19 @@
 import json
 import csv
+import os
 import re
+import sys
 import base64
 
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'implement'))
+from header_features import HEADER_FEATURE_COLUMNS, header_features
+from header_table import Headers, StringTable
+from char_histogram import CHAR_CLASSES, CharHistogram
+
 har_file = 'tester_of.har'  # Replace with your HAR file path
+header_table = StringTable()  # Header names and values, shared by all parsed requests
+keep_raw_headers = False  # Set to True to keep the raw headers as an audit column in the CSV
+char_histogram = CharHistogram({name: CHAR_CLASSES[name] for name in ('num_commas', 'num_hyphens', 'num_brackets')})
 
 def parse_har(har_file):
     '''
@@ -17,7 +27,7 @@ def parse_har(har_file):
             response = entry['response']
             request_url = request['url']
             request_method = request['method']
-            request_headers = {header['name']: header['value'] for header in request['headers']}
+            request_headers = Headers.from_har(header_table, request['headers'])
             request_body = request.get('postData', {}).get('text', '')
             response_body = response.get('content', {}).get('text', '')
 
@@ -33,18 +43,18 @@ def analyze_request_har(request_method, request_url, request_headers, request_bo
     features = {
         'method': request_method,
         'path': request_url,
-        'headers': str(request_headers),
         'body': request_body if request_body else '',  # Set default value for request_body
         'body_length': len(request_body) if request_body else 0,
-        'num_commas': request_body.count(',') if request_body else 0,
-        'num_hyphens': request_body.count('-') if request_body else 0,
-        'num_brackets': request_body.count('(') + request_body.count(')') if request_body else 0,
+        **char_histogram.count(request_body),
         'has_sql_keywords': 0,
         'has_xss_payload': 0,
         'has_csrf_token': 0,
         'has_double_quotes': 0,
         # Add more features as needed based on your specific WAF requirements
     }
+    features.update(header_features(request_headers))
+    if keep_raw_headers:
+        features['headers'] = str(request_headers)
 
     # Checking if request_body is not None or empty
     if request_body:
@@ -65,7 +75,9 @@ result_har = parse_har(har_file)
 # Opening the CSV file for writing
 csv_file = 'http_log_from_har.csv'
 with open(csv_file, "w", newline='', encoding='utf-8') as f:
-    fieldnames = ['method', 'path', 'headers', 'body', 'body_length', 'num_commas', 'num_hyphens', 'num_brackets', 'has_sql_keywords', 'has_xss_payload', 'has_csrf_token', 'has_double_quotes']
+    fieldnames = ['method', 'path', 'body', 'body_length', 'num_commas', 'num_hyphens', 'num_brackets', 'has_sql_keywords', 'has_xss_payload', 'has_csrf_token', 'has_double_quotes'] + HEADER_FEATURE_COLUMNS
+    if keep_raw_headers:
+        fieldnames.insert(2, 'headers')
     writer = csv.DictWriter(f, fieldnames=fieldnames)
     writer.writeheader()
 
@@ -1,9 +1,23 @@
 import json
 import csv
+import os
 import re
+import sys
 import urllib.parse
 
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'implement'))
+from normalize import CanonicalRequest
+from sql_tokens import SqliMatcher
+from header_features import HEADER_FEATURE_COLUMNS, header_features
+from header_table import Headers, StringTable
+from char_histogram import CHAR_CLASSES, CharHistogram
+
 har_file = 'tester_of.har'  # Replace with your HAR file path in your system
+header_table = StringTable()  # Header names and values, shared by all parsed requests
+keep_raw_headers = False  # Set to True to keep the raw headers as an audit column in the CSV
+char_histogram = CharHistogram({name: CHAR_CLASSES[name] for name in ('num_commas', 'num_hyphens', 'num_brackets')})
+
+sqli_matcher = SqliMatcher()
 
 def parse_har(har_file):
     '''
@@ -17,7 +31,7 @@ def parse_har(har_file):
             response = entry['response']
             request_url = urllib.parse.unquote(request['url'])  # Decode URL
             request_method = request['method']
-            request_headers = {header['name']: header['value'] for header in request['headers']}
+            request_headers = Headers.from_har(header_table, request['headers'])
             request_body = request.get('postData', {}).get('text', '')
             response_body = response.get('content', {}).get('text', '')
 
@@ -33,18 +47,21 @@ def analyze_request_har(request_method, request_url, request_headers, request_bo
     features = {
         'method': request_method,
         'path': request_url,
-        'headers': str(request_headers),
         'body': request_body if request_body else '',  # Set default value for request_body
         'body_length': len(request_body) if request_body else 0,
-        'num_commas': request_body.count(',') if request_body else 0,
-        'num_hyphens': request_body.count('-') if request_body else 0,
-        'num_brackets': request_body.count('(') + request_body.count(')') if request_body else 0,
+        **char_histogram.count(request_body),
         'has_sql_keywords': 0,
         'has_xss_payload': 0,
         'has_csrf_token': 0,
         'has_double_quotes': 0,
         # Add more features as needed based on your specific WAF requirements
     }
+    features.update(header_features(request_headers))
+    if keep_raw_headers:
+        features['headers'] = str(request_headers)
+
+    # Building the canonical views once, every check below reads from them
+    canonical = CanonicalRequest(request_url, request_body, request_headers)
 
     # Checking for SQL keywords
     if request_body:
@@ -53,7 +70,7 @@ def analyze_request_har(request_method, request_url, request_headers, request_bo
             'UNION', 'FROM', 'WHERE', 'AND', 'OR', 'LIKE', 'BETWEEN', 'IN', 'JOIN', 'ON', 'GROUP BY', 'ORDER BY', 'HAVING', 'LIMIT'
         ]
         features['has_sql_keywords'] = int(any(re.search(r'\b({})\b'.format('|'.join(sql_keywords)), request_body, re.IGNORECASE)))
-        features['has_sql_keywords'] |= detect_sqli_payload(request_url, request_body)
+        features['has_sql_keywords'] |= detect_sqli_payload(canonical)
 
     # Checking for XSS payload in both URL and body
     xss_patterns = [
@@ -87,7 +104,7 @@ def analyze_request_har(request_method, request_url, request_headers, request_bo
         r'importScripts',             # importScripts
         r'`',                         # `
     ]
-    features['has_xss_payload'] = detect_xss_payload(request_url.lower(), request_body.lower(), xss_patterns)
+    features['has_xss_payload'] = detect_xss_payload(canonical, xss_patterns)
 
     # Checking for CSRF token presence
     csrf_keywords = ['csrf_token', 'anti_csrf_token', 'xsrf_token']  # Add other CSRF token keywords as needed
@@ -99,57 +116,22 @@ def analyze_request_har(request_method, request_url, request_headers, request_bo
 
     return features
 
-def detect_xss_payload(request_url, request_body, xss_patterns):
+def detect_xss_payload(canonical, xss_patterns):
     '''
-    Detects XSS payloads in the request URL and body using specified patterns.
+    Detects XSS payloads in the canonical (decoded) request URL and body using specified patterns.
     '''
-    # Decode URL-encoded payloads in the request URL and body
-    decoded_url = urllib.parse.unquote(request_url)
-    decoded_body = urllib.parse.unquote(request_body)
-
     # Check XSS patterns in both URL and body
     for pattern in xss_patterns:
-        if re.search(pattern, decoded_url, re.IGNORECASE) or re.search(pattern, decoded_body, re.IGNORECASE):
+        if re.search(pattern, canonical.url.lower, re.IGNORECASE) or re.search(pattern, canonical.body.lower, re.IGNORECASE):
             return 1
     return 0
 
-def detect_sqli_payload(request_url, request_body):
+def detect_sqli_payload(canonical):
     '''
-    Detects SQLi payloads in the request URL and body using specified patterns.
+    Detects SQLi payloads in the canonical (decoded) request URL and body with the token-stream matcher:
+    each text is tokenized once and all patterns are matched in linear time (see implement/sql_tokens.py).
     '''
-    # Decoding URL-encoded payloads in the request URL and body
-    decoded_url = urllib.parse.unquote(request_url)
-    decoded_body = urllib.parse.unquote(request_body)
-
-    # SQL injection patterns
-    sqli_patterns = [
-        r'\bSELECT\b.*?\bFROM\b',       # SELECT ... FROM ...
-        r'\bINSERT INTO\b',             # INSERT INTO ...
-        r'\bUPDATE\b.*?\bSET\b',        # UPDATE ... SET ...
-        r'\bDELETE FROM\b',             # DELETE FROM ...
-        r'\bDROP TABLE\b',              # DROP TABLE ...
-        r'\bTRUNCATE TABLE\b',          # TRUNCATE TABLE ...
-        r'\bCREATE TABLE\b',            # CREATE TABLE ...
-        r'\bALTER TABLE\b',             # ALTER TABLE ...
-        r'\bUNION\b.*?\bSELECT\b',      # UNION ... SELECT ...
-        r'\bWHERE\b.*?\b=\b',           # WHERE ... =
-        r'\bAND\b.*?\b=\b',             # AND ... =
-        r'\bOR\b.*?\b=\b',              # OR ... =
-        r'\bLIKE\b',                    # LIKE ...
-        r'\bBETWEEN\b',                 # BETWEEN ...
-        r'\bIN\b',                      # IN ...
-        r'\bJOIN\b',                    # JOIN ...
-        r'\bGROUP BY\b',                # GROUP BY ...
-        r'\bORDER BY\b',                # ORDER BY ...
-        r'\bHAVING\b',                  # HAVING ...
-        r'\bLIMIT\b',                   # LIMIT ...
-    ]
-
-    # Checking SQLi patterns in decoded URL and body
-    for pattern in sqli_patterns:
-        if re.search(pattern, decoded_url, re.IGNORECASE) or re.search(pattern, decoded_body, re.IGNORECASE):
-            return 1
-    return 0
+    return sqli_matcher.matches(canonical.url.collapsed, canonical.body.collapsed)
 
 # Parsing HAR file and extract requests/responses
 result_har = parse_har(har_file)
@@ -157,7 +139,9 @@ result_har = parse_har(har_file)
 # Opening the CSV file for writing
 csv_file = 'http_log_with_security_analysis.csv'
 with open(csv_file, "w", newline='', encoding='utf-8') as f:
-    fieldnames = ['method', 'path', 'headers', 'body', 'body_length', 'num_commas', 'num_hyphens', 'num_brackets', 'has_sql_keywords', 'has_xss_payload', 'has_csrf_token', 'has_double_quotes']
+    fieldnames = ['method', 'path', 'body', 'body_length', 'num_commas', 'num_hyphens', 'num_brackets', 'has_sql_keywords', 'has_xss_payload', 'has_csrf_token', 'has_double_quotes'] + HEADER_FEATURE_COLUMNS
+    if keep_raw_headers:
+        fieldnames.insert(2, 'headers')
     writer = csv.DictWriter(f, fieldnames=fieldnames)
     writer.writeheader()
 
@@ -1,9 +1,22 @@
 import json
 import csv
 import re
+import os
+import sys
 import urllib.parse
 
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'implement'))
+from diagnostics import get_logger
+from header_features import HEADER_FEATURE_COLUMNS, header_features
+from header_table import Headers, StringTable
+from char_histogram import CHAR_CLASSES, CharHistogram
+
+log = get_logger(__name__)
+
 har_file = 'tester_of.har'  # Replace with your HAR file path
+header_table = StringTable()  # Header names and values, shared by all parsed requests
+keep_raw_headers = False  # Set to True to keep the raw headers as an audit column in the CSV
+char_histogram = CharHistogram(CHAR_CLASSES)  # All count features in one pass over the UID value
 
 def parse_har(har_file):
     '''
@@ -17,7 +30,7 @@ def parse_har(har_file):
             response = entry['response']
             request_url = urllib.parse.unquote(request['url'])  # Decode URL
             request_method = request['method']
-            request_headers = {header['name']: header['value'] for header in request['headers']}
+            request_headers = Headers.from_har(header_table, request['headers'])
             request_body_params = request.get('postData', {}).get('params', [])
             response_body = response.get('content', {}).get('text', '')
 
@@ -33,7 +46,6 @@ def analyze_request_har(request_method, request_url, request_headers, request_bo
     features = {
         'method': request_method,
         'path': request_url,
-        'headers': str(request_headers),
         'body': '',  # Initialize empty, since we will concatenate if there's any content
         'body_length': 0,
         'num_commas': 0,
@@ -48,6 +60,9 @@ def analyze_request_har(request_method, request_url, request_headers, request_bo
         'has_xss_payload': 0,
         'has_csrf_token': 0,
     }
+    features.update(header_features(request_headers))
+    if keep_raw_headers:
+        features['headers'] = str(request_headers)
 
     # Extracting UID value from request_body_params
     uid_value = None
@@ -57,29 +72,22 @@ def analyze_request_har(request_method, request_url, request_headers, request_bo
                 uid_value = param.get('value')
                 break
 
-    # Adding debugging output to trace where the issue is occuring
-    print(f"Analyzing request: {request_method} {request_url}")
-    print(f"Request headers: {request_headers}")
-    print(f"Request body params: {request_body_params}")
-    print(f"Extracted UID value: {uid_value}")
+    # Debugging output to trace where the issue is occuring (WAF_LOG_LEVEL=DEBUG, rate-limited)
+    log.debug('Analyzing request: %s %s', request_method, request_url)
+    log.debug('Request headers: %s', request_headers)
+    log.debug('Request body params: %s', request_body_params)
+    log.debug('Extracted UID value: %s', uid_value)
 
     if uid_value is None:
-        print(f"UID value is None, skipping SQL keyword analysis for request: {request_method} {request_url}")
+        log.debug('UID value is None, skipping SQL keyword analysis for request: %s %s', request_method, request_url)
     else:
-        print(f"UID value is '{uid_value}'")
+        log.debug("UID value is '%s'", uid_value)
 
     # Counting characters in UID value
     if uid_value:
         features['body'] = uid_value
         features['body_length'] = len(uid_value)
-        features['num_commas'] = uid_value.count(',')
-        features['num_hyphens'] = uid_value.count('-')
-        features['num_brackets'] = uid_value.count('(') + uid_value.count(')')
-        features['num_quotes'] = uid_value.count("'")
-        features['num_double_quotes'] = uid_value.count('"')
-        features['num_slashes'] = uid_value.count('/')
-        features['num_braces'] = uid_value.count('{') + uid_value.count('}')
-        features['num_spaces'] = uid_value.count(' ')
+        features.update(char_histogram.count(uid_value))
 
         # Checking for SQL keywords in the UID value
         sql_keywords = [
@@ -89,7 +97,7 @@ def analyze_request_har(request_method, request_url, request_headers, request_bo
         try:
             features['has_sql_keywords'] = int(any(re.search(r'\b({})\b'.format('|'.join(sql_keywords)), uid_value, re.IGNORECASE)))
         except TypeError as e:
-            print(f"Error during SQL keyword search: {e}")
+            log.warning('Error during SQL keyword search: %s', e)
             features['has_sql_keywords'] = 0
 
     # Checking for XSS payload in URL and headers (not in the body, as per your request)
@@ -152,9 +160,11 @@ result_har = parse_har(har_file)
 # Opening the CSV file for writing
 csv_file = 'http_log_with_security_analysis.csv'
 with open(csv_file, "w", newline='', encoding='utf-8') as f:
-    fieldnames = ['method', 'path', 'headers', 'body', 'body_length', 'num_commas', 'num_hyphens', 'num_brackets',
+    fieldnames = ['method', 'path', 'body', 'body_length', 'num_commas', 'num_hyphens', 'num_brackets',
                   'num_quotes', 'num_double_quotes', 'num_slashes', 'num_braces', 'num_spaces', 'has_sql_keywords',
-                  'has_xss_payload', 'has_csrf_token']
+                  'has_xss_payload', 'has_csrf_token'] + HEADER_FEATURE_COLUMNS
+    if keep_raw_headers:
+        fieldnames.insert(2, 'headers')
     writer = csv.DictWriter(f, fieldnames=fieldnames)
     writer.writeheader()
 
@@ -162,6 +172,6 @@ with open(csv_file, "w", newline='', encoding='utf-8') as f:
         features = analyze_request_har(request_method, request_url, request_headers, request_body_params)
         writer.writerow(features)
 
-print(f"CSV file '{csv_file}' has been successfully created with analyzed HTTP request data from HAR file including security analysis for XSS, SQLi, and CSRF.")
+log.info(f"CSV file '{csv_file}' has been successfully created with analyzed HTTP request data from HAR file including security analysis for XSS, SQLi, and CSRF.")
 
 
@@ -1,16 +1,69 @@
 import json
 import csv
+import os
 import re
+import sys
 import urllib.parse
 
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'implement'))
+from header_features import HEADER_FEATURE_COLUMNS, header_features
+from normalize import CanonicalRequest
+from param_scanner import PARAM_FEATURE_COLUMNS, ParamScanner, iter_body_params
+from diagnostics import get_logger, profiled, stage
+from header_table import Headers, StringTable
+from char_histogram import CHAR_CLASSES, CharHistogram
+
+log = get_logger(__name__)
+
 # Defining SQL keywords globally
 sql_keywords = [
     'SELECT', 'INSERT', 'UPDATE', 'DELETE', 'DROP', 'CREATE', 'ALTER', 'TRUNCATE',
     'UNION', 'FROM', 'WHERE', 'AND', 'OR', 'LIKE', 'BETWEEN', 'IN', 'JOIN', 'ON', 'GROUP BY', 'ORDER BY', 'HAVING', 'LIMIT'
 ]
 
+# Defining XSS patterns globally
+xss_patterns = [
+    r'<script',                # <script
+    r'alert\(',                # alert(
+    r'\(alert\(',              # (alert(
+    r'</script>',              # </script>
+    r'document\.cookie',       # document.cookie
+    r'eval\(',                 # eval(
+    r'window\.location',       # window.location
+    r'setTimeout\(',           # setTimeout(
+    r'setInterval\(',          # setInterval(
+    r'execCommand',            # execCommand
+    r'innerHTML',              # innerHTML
+    r'outerHTML',              # outerHTML
+    r'document\.write',        # document.write
+    r'XMLHttpRequest\.open',   # XMLHttpRequest.open
+    r'FormData\.append',       # FormData.append
+    r'document\.getElementById',  # document.getElementById
+    r'document\.createElement',   # document.createElement
+    r'document\.execCommand',     # document.execCommand
+    r'window\.open',              # window.open
+    r'window\.eval',              # window.eval
+    r'window\.setTimeout',        # window.setTimeout
+    r'window\.setInterval',       # window.setInterval
+    r'document\.URL',             # document.URL
+    r'location\.href',            # location.href
+    r'location\.search',          # location.search
+    r'document\.referrer',        # document.referrer
+    r'navigator\.sendBeacon',     # navigator.sendBeacon
+    r'importScripts',             # importScripts
+    r'`',                         # `
+]
+
 har_file = 'tester_of.har'  # Replace with your HAR file path
+header_table = StringTable()  # Header names and values, shared by all parsed requests
+char_histogram = CharHistogram(CHAR_CLASSES)  # All count features in one pass over the UID value
+keep_raw_headers = False  # Set to True to keep the raw headers as an audit column in the CSV
 
+param_scanner = ParamScanner(sql_keywords, xss_patterns)
+# The canonical views are already lowercased, so the patterns are too and no case-insensitive matching is needed
+xss_pattern = re.compile('|'.join(xss_patterns).lower())
+
+@profiled('parse')
 def parse_har(har_file):
     '''
     Parses a HAR file and returns a list of HTTP request/response pairs.
@@ -23,16 +76,19 @@ def parse_har(har_file):
             response = entry['response']
             request_url = urllib.parse.unquote(request['url'])  # Decode URL once
             request_method = request['method']
-            request_headers = {header['name']: header['value'] for header in request['headers']}
-            request_body_params = request.get('postData', {}).get('params', [])
+            request_headers = Headers.from_har(header_table, request['headers'])
+            request_query = request.get('queryString', [])
+            request_post_data = request.get('postData', {})
+            request_body_params = request_post_data.get('params', [])
             response_status = response['status']
             response_time = entry['time']
             response_body = response.get('content', {}).get('text', '')
-            response_headers = {header['name']: header['value'] for header in response.get('headers', [])}
-            result.append((request_method, request_url, request_headers, request_body_params, response_status, response_time, response_body, response_headers))
+            response_headers = Headers.from_har(header_table, response.get('headers', []))
+            result.append((request_method, request_url, request_headers, request_body_params, response_status, response_time, response_body, response_headers, request_query, request_post_data))
     return result
 
-def analyze_request_har(request_method, request_url, request_headers, request_body_params, response_status, response_time, sql_keywords):
+@profiled('analyze')
+def analyze_request_har(request_method, request_url, request_headers, request_body_params, response_status, response_time, sql_keywords, request_query=None, request_post_data=None):
     '''
     Analyzes the HTTP request from HAR file and extracts features related to common attacks.
     '''
@@ -40,7 +96,6 @@ def analyze_request_har(request_method, request_url, request_headers, request_bo
     features = {
         'method': request_method,
         'path': request_url,
-        'headers': str(request_headers),
         'body': '',  # Initialize empty, since we will concatenate if there's any content
         'body_length': 0,
         'num_commas': 0,
@@ -57,6 +112,9 @@ def analyze_request_har(request_method, request_url, request_headers, request_bo
         'response_status': response_status,
         'response_time': response_time
     }
+    features.update(header_features(request_headers))
+    if keep_raw_headers:
+        features['headers'] = str(request_headers)
 
     # Extracting UID value from request_body_params
     uid_value = None
@@ -66,101 +124,72 @@ def analyze_request_har(request_method, request_url, request_headers, request_bo
                 uid_value = param.get('value')
                 break
 
-    # Adding debugging output to trace where the issue is occuring
-    print(f"Analyzing request: {request_method} {request_url}")
-    print(f"Request headers: {request_headers}")
-    print(f"Request body params: {request_body_params}")
-    print(f"Extracted UID value: {uid_value}")
+    # Debugging output to trace where the issue is occuring (WAF_LOG_LEVEL=DEBUG, rate-limited)
+    log.debug('Analyzing request: %s %s', request_method, request_url)
+    log.debug('Request headers: %s', request_headers)
+    log.debug('Request body params: %s', request_body_params)
+    log.debug('Extracted UID value: %s', uid_value)
+
+    # Building the canonical views once, every check below reads from them
+    canonical = CanonicalRequest(request_url, uid_value, request_headers)
+
+    # Scoring every query and body parameter, not just the UID, within the per-request budget
+    params = [(param.get('name', ''), param.get('value', '')) for param in request_query or []]
+    if request_body_params:
+        params += [(param.get('name', ''), param.get('value', '')) for param in request_body_params]
+    elif request_post_data:
+        params += iter_body_params(request_post_data.get('text', ''), request_post_data.get('mimeType', ''))
+    features.update(param_scanner.scan(params, canonical))
 
     if uid_value is None:
-        print(f"UID value is None, skipping SQL keyword analysis for request: {request_method} {request_url}")
+        log.debug('UID value is None, skipping SQL keyword analysis for request: %s %s', request_method, request_url)
     else:
-        print(f"UID value is '{uid_value}'")
+        log.debug("UID value is '%s'", uid_value)
 
         # Counting characters in UID value
         features['body'] = uid_value
         features['body_length'] = len(uid_value)
-        features['num_commas'] = uid_value.count(',')
-        features['num_hyphens'] = uid_value.count('-')
-        features['num_brackets'] = uid_value.count('(') + uid_value.count(')')
-        features['num_quotes'] = uid_value.count("'")
-        features['num_double_quotes'] = uid_value.count('"')
-        features['num_slashes'] = uid_value.count('/')
-        features['num_braces'] = uid_value.count('{') + uid_value.count('}')
-        features['num_spaces'] = uid_value.count(' ')
+        features.update(char_histogram.count(uid_value))
 
         # Checking for SQL keywords in the UID value 
-        uid_value_lower = uid_value.lower()
-        features['has_sql_keywords'] = int(any(keyword.lower() in uid_value_lower for keyword in sql_keywords))
+        features['has_sql_keywords'] = int(any(keyword.lower() in canonical.body.lower for keyword in sql_keywords))
 
     # Checking for XSS payload in URL and headers 
-    xss_patterns = [
-        r'<script',                # <script
-        r'alert\(',                # alert(
-        r'\(alert\(',              # (alert(
-        r'</script>',              # </script>
-        r'document\.cookie',       # document.cookie
-        r'eval\(',                 # eval(
-        r'window\.location',       # window.location
-        r'setTimeout\(',           # setTimeout(
-        r'setInterval\(',          # setInterval(
-        r'execCommand',            # execCommand
-        r'innerHTML',              # innerHTML
-        r'outerHTML',              # outerHTML
-        r'document\.write',        # document.write
-        r'XMLHttpRequest\.open',   # XMLHttpRequest.open
-        r'FormData\.append',       # FormData.append
-        r'document\.getElementById',  # document.getElementById
-        r'document\.createElement',   # document.createElement
-        r'document\.execCommand',     # document.execCommand
-        r'window\.open',              # window.open
-        r'window\.eval',              # window.eval
-        r'window\.setTimeout',        # window.setTimeout
-        r'window\.setInterval',       # window.setInterval
-        r'document\.URL',             # document.URL
-        r'location\.href',            # location.href
-        r'location\.search',          # location.search
-        r'document\.referrer',        # document.referrer
-        r'navigator\.sendBeacon',     # navigator.sendBeacon
-        r'importScripts',             # importScripts
-        r'`',                         # `
-    ]
-    features['has_xss_payload'] = detect_xss_payload(request_url.lower(), str(request_headers), xss_patterns)
+    features['has_xss_payload'] = detect_xss_payload(canonical)
 
     # Checking for CSRF token presence in headers
     csrf_keywords = ['csrf_token', 'anti_csrf_token', 'xsrf_token']  # Add other CSRF token keywords as needed
     csrf_pattern = r'\b({})\b'.format('|'.join(csrf_keywords))
-    features['has_csrf_token'] = int(any(re.search(csrf_pattern, str(request_headers).lower()) for key in csrf_keywords))
+    features['has_csrf_token'] = int(bool(re.search(csrf_pattern, canonical.header_text.lower)))
 
     return features
 
-def detect_xss_payload(request_url, request_headers, xss_patterns):
+def detect_xss_payload(canonical):
     '''
-    Detects XSS payloads in the request URL and headers using specified patterns.
+    Detects XSS payloads in the canonical (decoded) request URL and headers with the combined XSS pattern.
     '''
-    # Decoding URL-encoded payloads in the request URL
-    decoded_url = urllib.parse.unquote(urllib.parse.unquote(request_url))  # Double decode
-
-    # Checking XSS patterns in URL and headers
-    for pattern in xss_patterns:
-        if re.search(pattern, decoded_url, re.IGNORECASE) or re.search(pattern, request_headers, re.IGNORECASE):
-            return 1
-    return 0
-
-# Parsing HAR file and extract requests/responses
-result_har = parse_har(har_file)
-
-# Opening the CSV file for writing
-csv_file = 'http_log_with_security_analysis.csv'
-with open(csv_file, "w", newline='', encoding='utf-8') as f:
-    fieldnames = ['method', 'path', 'headers', 'body', 'body_length', 'num_commas', 'num_hyphens', 'num_brackets',
-                  'num_quotes', 'num_double_quotes', 'num_slashes', 'num_braces', 'num_spaces', 'has_sql_keywords',
-                  'has_xss_payload', 'has_csrf_token', 'response_status', 'response_time']
-    writer = csv.DictWriter(f, fieldnames=fieldnames)
-    writer.writeheader()
-
-    for request_method, request_url, request_headers, request_body_params, response_status, response_time, response_body, response_headers in result_har:
-        features = analyze_request_har(request_method, request_url, request_headers, request_body_params, response_status, response_time, sql_keywords)
-        writer.writerow(features)
-
-print(f"CSV file '{csv_file}' has been successfully created with analyzed HTTP request data from HAR file including security analysis for XSS, SQLi, and CSRF.")
+    return int(bool(xss_pattern.search(canonical.url.lower) or xss_pattern.search(canonical.header_text.lower)))
+
+# Columns of the CSV written by this parser
+fieldnames = ['method', 'path', 'body', 'body_length', 'num_commas', 'num_hyphens', 'num_brackets',
+              'num_quotes', 'num_double_quotes', 'num_slashes', 'num_braces', 'num_spaces', 'has_sql_keywords',
+              'has_xss_payload', 'has_csrf_token', 'response_status', 'response_time'] + PARAM_FEATURE_COLUMNS + HEADER_FEATURE_COLUMNS
+if keep_raw_headers:
+    fieldnames.insert(2, 'headers')
+
+if __name__ == '__main__':
+    # Parsing HAR file and extract requests/responses
+    result_har = parse_har(har_file)
+
+    # Opening the CSV file for writing
+    csv_file = 'http_log_with_security_analysis.csv'
+    with open(csv_file, "w", newline='', encoding='utf-8') as f:
+        writer = csv.DictWriter(f, fieldnames=fieldnames)
+        writer.writeheader()
+
+        for request_method, request_url, request_headers, request_body_params, response_status, response_time, response_body, response_headers, request_query, request_post_data in result_har:
+            features = analyze_request_har(request_method, request_url, request_headers, request_body_params, response_status, response_time, sql_keywords, request_query, request_post_data)
+            with stage('write'):
+                writer.writerow(features)
+
+    log.info(f"CSV file '{csv_file}' has been successfully created with analyzed HTTP request data from HAR file including security analysis for XSS, SQLi, and CSRF.")
@@ -2,9 +2,19 @@ from xml.etree import ElementTree as ET
 import urllib.parse as urlparse
 import base64
 import csv
+import os
 import re
+import sys
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'implement'))
+from header_features import HEADER_FEATURE_COLUMNS, header_features
+from header_table import Headers, StringTable
+from char_histogram import CHAR_CLASSES, CharHistogram
 
 log_path = 'demo_burp.log'
+keep_raw_headers = False  # Set to True to keep the raw headers as an audit column in the CSV
+header_table = StringTable()  # Header names and values, shared by all parsed requests
+char_histogram = CharHistogram({name: CHAR_CLASSES[name] for name in ('num_commas', 'num_hyphens', 'num_brackets')})
 
 def parse_log(log_path):
    
@@ -25,7 +35,7 @@ def parse_log(log_path):
 
 def extract_headers(rawreq):
    
-    headers = {}
+    header_lines = []
     body = ""
     try:
         raw = rawreq.decode('utf-8')
@@ -46,8 +56,8 @@ def extract_headers(rawreq):
 
     for line in lines[1:]:
         if ': ' in line:
-            key, value = line.split(': ', 1)
-            headers[key] = value
+            header_lines.append(line.split(': ', 1))
+    headers = Headers(header_table, header_lines)
 
     return headers, method, body, path
 
@@ -59,18 +69,18 @@ def analyze_request(rawreq):
     features = {
         'method': method,
         'path': path,
-        'headers': str(headers),
         'body': body,  # Include the body in the features
         'body_length': len(body),
-        'num_commas': body.count(','),
-        'num_hyphens': body.count('-'),
-        'num_brackets': body.count('(') + body.count(')'),
+        **char_histogram.count(body),
         'has_sql_keywords': int(any(re.search(r'\b({})\b'.format('|'.join(['SELECT', 'INSERT', 'UPDATE', 'DELETE', 'DROP', 'CREATE', 'ALTER', 'TRUNCATE'])), body, re.IGNORECASE))),
         'has_xss_payload': int(any(re.search(r'<script[\s>]', body, re.IGNORECASE))),
         'has_csrf_token': int('csrf_token' in body.lower()),
         'has_double_quotes': int('"' in body),
         # Add more features as needed based on your specific WAF requirements
     }
+    features.update(header_features(headers))
+    if keep_raw_headers:
+        features['headers'] = str(headers)
 
     return features
 
@@ -80,7 +90,9 @@ result = parse_log(log_path)
 # Opening the CSV file for writing
 csv_file = 'http_log1.csv'
 with open(csv_file, "w", newline='', encoding='utf-8') as f:
-    fieldnames = ['method', 'path', 'headers', 'body', 'body_length', 'num_commas', 'num_hyphens', 'num_brackets', 'has_sql_keywords', 'has_xss_payload', 'has_csrf_token', 'has_double_quotes']
+    fieldnames = ['method', 'path', 'body', 'body_length', 'num_commas', 'num_hyphens', 'num_brackets', 'has_sql_keywords', 'has_xss_payload', 'has_csrf_token', 'has_double_quotes'] + HEADER_FEATURE_COLUMNS
+    if keep_raw_headers:
+        fieldnames.insert(2, 'headers')
     writer = csv.DictWriter(f, fieldnames=fieldnames)
     writer.writeheader()
 
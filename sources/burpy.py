@@ -1,4 +1,12 @@
+import os
+import sys
+# Shared diagnostics and the event store of the interceptor live in implement/, next to sources/
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'implement'))
 import core
+from diagnostics import get_logger, stage
+from event_store import EventStore
+
+log = get_logger('burpy')
 
 def initiate(dict_req_resp):
 	'''
@@ -7,15 +15,31 @@ def initiate(dict_req_resp):
 	print '[+] Found '+str(len(dict_req_resp))+" request from Porvided Burp Log..."
 	raw_input('[+] Press Enter to start Test___')
 	print '[+] Starting Test..'
-	report_head = core.part1.replace('{number}',str(len(dict_req_resp))).replace('{target}',core.target_domain)
-	report = open('Report.html','w')
-	report.write(report_head)
-	report.close()
+	if core.resume and os.path.exists('Report.html'):
+		# Appending to the report of the interrupted scan, reopened if that scan had completed
+		report = open('Report.html','r')
+		written = report.read()
+		report.close()
+		if written.endswith(core.part3):
+			report = open('Report.html','w')
+			report.write(written[:-len(core.part3)])
+			report.close()
+		print '[+] Resuming: '+str(len(journal.done))+' tests already done, '+str(journal.findings())+' findings in Report.html'
+	else:
+		report_head = core.part1.replace('{number}',str(len(dict_req_resp))).replace('{target}',core.target_domain)
+		report = open('Report.html','w')
+		report.write(report_head)
+		report.close()
 	# Iterate through all req/response
 	for item in dict_req_resp:
-		if base.gerequestinfo(item,"Host") == core.target_domain:# Check whether request in in test scope
+		if item.header("Host") == core.target_domain:# Check whether request in in test scope (item is a rawweb.Request parsed by parse_log)
+			request_key = journal.request_key(item)
 			for testcase in moduledict:#execute all modules test Case
-				result = moduledict[testcase](item,core.ssl)
+				if journal.is_done(request_key,testcase):
+					log.debug('[+] Skipping %s, done before the interruption', testcase)
+					continue
+				with stage('testcase'):
+					result = moduledict[testcase](item,core.ssl)
 				#if +ve then
 				#result[0] => Test Title
 				#result[1] => Final Crafted Resposne
@@ -25,17 +49,24 @@ def initiate(dict_req_resp):
 				#result[5] => Response body
 				if len(result) > 5:
 					# Test case true
-					print '[+] Test Result Positive'
-					base.write_report(result[0],result[2],result[3],item,result[1],result[4],result[5])
+					log.info('[+] Test Result Positive')
+					with stage('report'):
+						base.write_report(result[0],result[2],result[3],item,result[1],result[4],result[5])
+					store.record(source='burpy',host=core.target_domain,method=item.method,path=item.path,verdict='finding',features={'response_code':result[3]},detail=result[0][0]+': '+result[0][1])
 					#def write_report(self,title,res_reason,res_code,base_request,crafted_request,res_head_dict,latest_response):
+					journal.record(request_key,testcase,result[0][0]+': '+result[0][1])
 				else:
-					print '[+] Test Result Negative'
+					log.debug('[+] Test Result Negative')
+					journal.record(request_key,testcase)
 		else:
-			print '[+] Skipping....Request not associated with ',core.target_domain
+			log.debug('[+] Skipping....Request not associated with %s', core.target_domain)
 	print '[+] Test Completed...Report.html Generated'
 	report = open('Report.html','a')# When test done, Close the report.
 	report.write(core.part3)
 	report.close()
+	journal.close()
+	store.close()
+	print '[+] Findings recorded in burpy_events.db'
 
 if __name__ == '__main__':
 	base = core.Core()
@@ -45,4 +76,6 @@ if __name__ == '__main__':
 	global target
 	target = core.target_domain
 	moduledict = base.loadallmodules()
+	store = EventStore('burpy_events.db')
+	journal = core.Journal(resume=core.resume)
 	initiate(result)
@@ -8,12 +8,55 @@ import optparse
 import cgi
 import glob
 import imp
+import hashlib
+import json
+import os
+from rawweb import Request
+from diagnostics import PROFILE_MODES, enable_profiling, profiled
 ########################################
 global part1
 global part3
 part1 = '''<!DOCTYPE html><html><head><meta charset="utf-8" /><title>Burpy Version - 0.1 Test Report</title><link href="http://www.w3resource.com/twitter-bootstrap/twitter-bootstrap-v2/docs/assets/css/bootstrap.css" rel="stylesheet" type="text/css" /></head><body><div class="well span12 offset1"><h1>Burpy v0.1 Report</h1></br><p><b>Author </b>: <a href="http://www.debasish.in/">Debasish Mandal</a></p><p><b>Total Number of Request(s) Tested </b>: {number}</br><b>Scan Scope : </b>{target}</br></div><div class="well span12 offset1"><div class="container-fluid"><div class="accordion" id="accordion2"></div>'''
 part2 = '''<div class="accordion-group"><div class="accordion-heading"><a class="accordion-toggle" data-toggle="collapse" data-parent="#accordion2" href="#{col_id}">{title}</a></div><div id="{col_id}" class="accordion-body collapse" style="height: 0px; "><div class="accordion-inner">{response}</div></div></div>'''
 part3 = '''</div></div></div><script type="text/javascript" src="http://www.w3resource.com/twitter-bootstrap/twitter-bootstrap-v2/docs/assets/js/jquery.js"></script><script type="text/javascript" src="http://www.w3resource.com/twitter-bootstrap/twitter-bootstrap-v2/docs/assets/js/bootstrap-collapse.js"></script></body></html>'''
+JOURNAL_PATH = 'burpy_journal.log'
+class Journal:
+	'''
+	Scan progress: one line per finished (request, module) test with its finding, if any.
+	Every line is flushed to disk before the next test starts, so after a crash or Ctrl-C only the
+	test that was running is repeated by a resumed scan.
+	'''
+	def __init__(self,path=JOURNAL_PATH,resume=False):
+		self.path = path
+		self.done = {}
+		if resume and os.path.exists(path):
+			with open(path) as f:
+				for line in f:
+					if not line.strip():
+						continue
+					try:
+						entry = json.loads(line)
+					except ValueError:
+						continue# Line cut short by the interruption
+					self.done[(entry['request'],entry['module'])] = entry.get('finding')
+		appending = resume and os.path.exists(path) and os.path.getsize(path) > 0
+		self.f = open(path,'a' if resume else 'w')
+		if appending:
+			self.f.write('\n')# Ends a line cut short by the interruption, blank lines are skipped
+	def request_key(self,raw_request):
+		return hashlib.sha1(raw_request.encode('utf8')).hexdigest()
+	def is_done(self,request_key,module):
+		return (request_key,module) in self.done
+	def findings(self):
+		return len([finding for finding in self.done.values() if finding])
+	def record(self,request_key,module,finding=None):
+		entry = {'request':request_key,'module':module,'finding':finding}
+		self.f.write(json.dumps(entry)+'\n')
+		self.f.flush()
+		os.fsync(self.f.fileno())
+		self.done[(request_key,module)] = finding
+	def close(self):
+		self.f.close()
 class Core:
 	'''
 	This class holds the core components of Burpy
@@ -41,14 +84,19 @@ class Core:
 		global target_domain
 		global burp_suite_log
 		global ssl
+		global resume
 		parser = optparse.OptionParser()
 		parser.add_option('-t', type="string",help='Target/Scan Scope domain - Its mandatory option', dest='target_domain')
 		parser.add_option('-l', type="string",help='Full path to burp suite log - Its mandatory option', dest='burp_suite_log')
 		parser.add_option('-s', type="string",help='Use of SSL on or off - Its mandatory option', dest='SSL')
+		parser.add_option('-p', type="choice",choices=list(PROFILE_MODES),help='Profiling mode (cpu, sample or memory), reports go to profiles/ - Optional', dest='profile')
+		parser.add_option('-r', '--resume', action="store_true",default=False,help='Resume an interrupted scan: skip the tests done in '+JOURNAL_PATH+' and append to Report.html - Optional', dest='resume')
 		(opts, args) = parser.parse_args()
+		enable_profiling(opts.profile)
 		burp_suite_log = opts.burp_suite_log
 		target_domain = opts.target_domain
 		ssl = opts.SSL
+		resume = opts.resume
 		mandatories = ['target_domain','burp_suite_log','SSL']
 		for m in mandatories:
 			if not opts.__dict__[m]:
@@ -67,10 +115,10 @@ class Core:
 		When any test result is positive, Use this routine to write the raw request to html report.Cud not make it more simple.
 		'''
 		latest_response = cgi.escape(latest_response)
+		url = self.gerequestinfo(base_request,"path")
 		base_request = base_request.replace('\n','</br>')
 		crafted_request = crafted_request.replace('\n','</br>')
 		HOST = target_domain
-		url = self.gerequestinfo(base_request,"path")
 		if len(url) > 50:
 			path_u = url[:50]+"..."
 		else:
@@ -97,11 +145,13 @@ class Core:
 		m = SequenceMatcher(None, cont1, cont2)
 		return m.ratio()*100
 
+	@profiled('parse')
 	def parse_log(self,log_path):
 		'''
 		This fucntion accepts burp log file path.
 		and returns a dict. of request and response
 		result = {'GET /page.php...':'200 OK HTTP / 1.1....','':'',.....}
+		The keys are Request objects: the raw request, parsed once here for the scope check, the modules and the report.
 		'''
 		result = {}
 		try:
@@ -119,27 +169,18 @@ class Core:
 			raw_req = reqs.find('request').text
 			raw_req = urllib.unquote(raw_req).decode('utf8')
 			raw_resp = reqs.find('response').text
-			result[raw_req] = raw_resp
+			result[Request(raw_req)] = raw_resp
 		return result
 	def gerequestinfo(self,raw_stream,query):
-		headers = {}
-		sp = raw_stream.split('\n\n',1)
-		if len(sp) > 1:
-			head = sp[0]
-			body = sp[1]
-		else :
-			head = sp[0]
-			body = ""
-		c1 = head.split('\n',head.count('\n'))
-		method = c1[0].split(' ',2)[0]
-		path = c1[0].split(' ',2)[1]
+		'''
+		Returns the path, or the value of the header named query (None when it is missing), of a raw request.
+		Requests from parse_log are already parsed, anything else is parsed here.
+		'''
+		if not isinstance(raw_stream,Request):
+			raw_stream = Request(raw_stream)
 		if query == "path":
-			return path
-		for i in range(1, head.count('\n')+1):
-			slice1 = c1[i].split(': ',1)
-			if slice1[0] != "":
-				headers[slice1[0]] = slice1[1]
-		return headers[query]
+			return raw_stream.path
+		return raw_stream.header(query)
 	def loadallmodules(self):
 		avlbl_mods = {}
 		mods = glob.glob("modules/*.py")
@@ -147,7 +188,7 @@ class Core:
 			print '[+] \t\tLoaded...',mod
 			try:
 				modl = imp.load_source('main', mod)
-				avlbl_mods[self.id_generator()] = modl.main
+				avlbl_mods[os.path.basename(mod)] = modl.main# Keyed by file name, which the journal records
 			except Exception,e:
 				print '[+] Error!! Could not import ',mod
 		return avlbl_mods
@@ -0,0 +1,111 @@
+'''
+Response body decoding for rawweb: incremental gzip, deflate and br decoders whose output per call is capped,
+and read_body(), which reads and decodes a response up to a byte limit.
+
+Kept Python 2 and 3 compatible, so the decompression caps are tested with the rest of the repo.
+'''
+import zlib
+try:
+	import brotli
+except ImportError:
+	brotli = None# br responses are kept undecoded without the brotli module
+
+MAX_BODY_BYTES = 8 * 1024 * 1024# Decoded bytes kept per response; longer bodies (and decompression bombs) are cut here
+READ_CHUNK = 16384# Raw body bytes read from the socket at a time
+BROTLI_CHUNK = 16# Compressed bytes handed to brotli before 1.2 at a time; it cannot cap the output of a call, and a few bytes of a bomb expand to megabytes
+
+def brotli_output_limit():
+	'''
+	Whether Decompressor.process takes output_buffer_limit (brotli 1.2 and later), which caps the output of a call.
+	'''
+	try:
+		brotli.Decompressor().process(b'',output_buffer_limit=1)
+	except TypeError:
+		return False
+	return True
+
+BROTLI_OUTPUT_LIMIT = brotli is not None and brotli_output_limit()
+
+class Inflater(object):
+	'''
+	Incremental gzip/deflate decoder whose output per call is capped. Some servers send raw deflate
+	streams instead of zlib-wrapped ones, both are accepted.
+	'''
+	def __init__(self,encoding):
+		self.encoding = encoding
+		self.started = False
+		self.d = zlib.decompressobj(16 + zlib.MAX_WBITS if encoding == 'gzip' else zlib.MAX_WBITS)
+	def decompress(self,data,limit):
+		if not self.started and self.encoding == 'deflate':
+			self.started = True
+			try:
+				return self.d.decompress(data,limit)
+			except zlib.error:
+				self.d = zlib.decompressobj(-zlib.MAX_WBITS)
+		return self.d.decompress(data,limit)
+	def flush(self):
+		return self.d.flush()
+
+class Unbrotli(object):
+	'''
+	Incremental br decoder whose output per call is capped. With brotli 1.2 and later the decompressor
+	stops at limit (rounded up to its output block, 32 KB); older versions get the input in BROTLI_CHUNK
+	pieces and the output is checked after each.
+	'''
+	def __init__(self):
+		self.d = brotli.Decompressor()
+	def decompress(self,data,limit):
+		if BROTLI_OUTPUT_LIMIT:
+			return self.d.process(data,output_buffer_limit=limit)
+		parts = []
+		size = 0
+		for i in range(0,len(data),BROTLI_CHUNK):
+			out = self.d.process(data[i:i+BROTLI_CHUNK])
+			parts.append(out)
+			size += len(out)
+			if size >= limit:
+				break
+		return b''.join(parts)
+	def flush(self):
+		return b''
+
+def body_decoder(encoding):
+	'''
+	Decoder for a Content-Encoding header value, None if the body is sent as is or cannot be decoded here.
+	'''
+	codings = [coding.strip().lower() for coding in encoding.split(',') if coding.strip().lower() not in ('','identity')]
+	if len(codings) != 1:
+		return None# Stacked codings are not decoded
+	if codings[0] in ('gzip','x-gzip'):
+		return Inflater('gzip')
+	if codings[0] == 'deflate':
+		return Inflater('deflate')
+	if codings[0] == 'br' and brotli is not None:
+		return Unbrotli()
+	return None
+
+def read_body(res,limit=MAX_BODY_BYTES):
+	'''
+	Reads a response body (anything with read(size) and getheader(name, default), like an httplib response)
+	chunk by chunk and decodes it on the fly. Reading stops once more than limit decoded bytes have arrived,
+	so a huge or hostile body never sits in memory whole. Returns the body (at most limit bytes), whether
+	it was cut, and the error that stopped the decoding (None if it did not fail).
+	'''
+	decoder = body_decoder(res.getheader('content-encoding',''))
+	parts = []
+	size = 0
+	error = None
+	try:
+		while size <= limit:
+			data = res.read(READ_CHUNK)
+			if not data:
+				if decoder is not None:
+					parts.append(decoder.flush())
+				break
+			if decoder is not None:
+				data = decoder.decompress(data,limit - size + 1)
+			parts.append(data)
+			size += len(data)
+	except Exception as e:# zlib, brotli and httplib errors of a broken or cut stream
+		error = e
+	return b''.join(parts)[:limit],size > limit,error
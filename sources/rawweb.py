@@ -1,30 +1,81 @@
 import httplib
 import re
-import StringIO
-import gzip
+from decoders import MAX_BODY_BYTES, Inflater, read_body
+
+DIFF_BODY_BYTES = 65536# Body bytes modules need to compare two responses (Core.difference); what they pass to fire() as limit
+
+class Request(unicode):
+	'''
+	One raw request of the burp log, parsed once by Core.parse_log.
+	It is still the raw text (modules and the report use it as a string), and also holds the parsed parts:
+	method and path from the request line, the body, and a case-insensitive header map that is only
+	built on the first lookup.
+	'''
+	def __new__(cls,raw):
+		self = unicode.__new__(cls,raw)
+		end = self.find('\n\n')
+		if end == -1:
+			self.head_end = self.body_start = len(self)
+		else:
+			self.head_end, self.body_start = end, end + 2
+		line_end = self.find('\n',0,self.head_end)
+		request_line = self[:self.head_end if line_end == -1 else line_end].split(' ',2)
+		self.method = unicode(request_line[0])
+		self.path = unicode(request_line[1]) if len(request_line) > 1 else u''
+		self._headers = None
+		self._body = None
+		return self
+	def parse_headers(self):
+		headers = {}
+		index = {}
+		for line in self[:self.head_end].split('\n')[1:]:
+			name, sep, value = line.partition(': ')
+			if name != "" and sep:
+				headers[unicode(name)] = unicode(value)
+				index[name.lower()] = unicode(value)
+		self._headers = (headers,index)
+	@property
+	def headers(self):
+		'''
+		Header dict with the names as sent. Callers that change headers work on a copy.
+		'''
+		if self._headers is None:
+			self.parse_headers()
+		return self._headers[0]
+	def header(self,name,default=None):
+		'''
+		Case-insensitive header lookup.
+		'''
+		if self._headers is None:
+			self.parse_headers()
+		return self._headers[1].get(name.lower(),default)
+	@property
+	def body(self):
+		if self._body is None:
+			self._body = unicode(self[self.body_start:])
+		return self._body
 
 class RawWeb:
 	def __init__(self,raw):
-		try:
-			raw = raw.decode('utf8')
-		except Exception,e:
-			raw = raw
 		global headers,method,body,path
-		headers = {}
-		sp = raw.split('\n\n',1)
-		if len(sp) > 1:
-			head = sp[0]
-			body = sp[1]
-		else :
-			head = sp[0]
-			body = ""
-		c1 = head.split('\n',head.count('\n'))
-		method = c1[0].split(' ',2)[0]
-		path = c1[0].split(' ',2)[1]
-		for i in range(1, head.count('\n')+1):
-			slice1 = c1[i].split(': ',1)
-			if slice1[0] != "":
-				headers[slice1[0]] = slice1[1]
+		if isinstance(raw,Request):
+			# Already parsed by the log loader
+			headers = dict(raw.headers)
+			method = raw.method
+			path = raw.path
+			body = raw.body
+			return
+		if isinstance(raw,str):
+			# Byte strings are decoded here, unicode requests are parsed as they are
+			try:
+				raw = raw.decode('utf8')
+			except UnicodeDecodeError:
+				raw = raw.decode('latin-1')# Maps every byte to one character
+		request = Request(raw)
+		headers = dict(request.headers)
+		method = request.method
+		path = request.path
+		body = request.body
 	def rebuild(self,method,path,code,headers,body):
 		raw_stream = method+" "+path+" "+code+"\n"
 		# start adding header
@@ -81,23 +132,30 @@ class RawWeb:
 			path = url
 			body = a[1]
 			return self.rebuild("POST",url,"HTTP/1.1",headers,body)
-	def craft_res(self,res_head,res_body):
+	def craft_res(self,res,limit=None):
 		'''
-		if response data is gzip encoded this function detectes that and decode that compressed data
+		Reads the response body and decodes it on the fly (gzip, deflate and, with the brotli module, br; see
+		decoders.py). At most MAX_BODY_BYTES decoded bytes are kept, or limit if the caller only needs the
+		start of the body (DIFF_BODY_BYTES to diff responses); reading stops there.
 		'''
-		for i in range(0,len(res_head)):
-			e1 =  res_head[i]
-			if e1[1] == "gzip":
-				res_body = self.decode_gzip(res_body)
-		return res_body	# Return the respionse body
+		limit = min(limit or MAX_BODY_BYTES,MAX_BODY_BYTES)
+		body,cut,error = read_body(res,limit)
+		if error is not None:
+			print '[+] Could not decode the',res.getheader('content-encoding',''),'response body:',error
+		if cut and limit == MAX_BODY_BYTES:
+			print '[+] Response body cut at',MAX_BODY_BYTES,'bytes'
+		return body	# Return the response body
 	def decode_gzip(self,compresseddata):
 		'''
-		Accepts gzip compressde data and returns clear text data.
+		Accepts gzip compressed data and returns clear text data (at most MAX_BODY_BYTES).
+		'''
+		decoder = Inflater('gzip')
+		return decoder.decompress(compresseddata,MAX_BODY_BYTES)
+	def fire(self,ssl,limit=None):
+		'''
+		Sends the request and returns status, reason, response headers and the decoded body (see craft_res).
+		Modules that only compare the start of the body pass limit (e.g. DIFF_BODY_BYTES), the rest is not read.
 		'''
-		compressedstream = StringIO.StringIO(compresseddata)
-		gzipper = gzip.GzipFile(fileobj = compressedstream)
-		return gzipper.read()
-	def fire(self,ssl):
 		if len(path) > 70:
 			print '[+]',method,path[:100]+"..."
 		else:
@@ -116,4 +174,6 @@ class RawWeb:
 		res_headers = {}
 		for i in range(0,len(res.getheaders())):
 			res_headers[res.getheaders()[i][0]] = res.getheaders()[i][1]
-		return res.status,res.reason,res_headers,self.craft_res(res.getheaders(),res.read())
+		res_body = self.craft_res(res,limit)
+		con.close()# Drops whatever is left of a body cut short
+		return res.status,res.reason,res_headers,res_body
@@ -0,0 +1,37 @@
+import body_stream
+from body_stream import STREAM_INSPECT_LIMIT, StreamInspector
+from request_features import stream_pattern
+
+def inspect(*chunks):
+    inspector = StreamInspector(stream_pattern, 'text/plain')
+    for chunk in chunks:
+        inspector(chunk)
+    return inspector
+
+def test_body_up_to_the_limit_is_not_truncated():
+    inspector = inspect(b'a' * (STREAM_INSPECT_LIMIT - 1), b'a')
+    assert inspector.inspected == STREAM_INSPECT_LIMIT and not inspector.truncated
+
+def test_chunk_crossing_the_limit_is_truncated():
+    # The last chunk is cut at the limit, no later chunk arrives
+    inspector = inspect(b'a' * (STREAM_INSPECT_LIMIT - 1), b'ab')
+    assert inspector.inspected == STREAM_INSPECT_LIMIT and inspector.truncated
+
+def test_single_oversized_chunk_is_truncated():
+    assert inspect(b'a' * (STREAM_INSPECT_LIMIT + 1)).truncated
+
+def test_matches_across_chunks_are_counted_once(monkeypatch):
+    monkeypatch.setattr(body_stream, 'STREAM_INSPECT_LIMIT', 1024)
+    inspector = inspect(b'x=1 UNI', b'ON SELECT 2', b' and more')
+    assert inspector.hits == inspector.count('x=1 UNION SELECT 2 and more')
+
+def test_match_completed_by_the_next_chunk_is_counted():
+    # "OR" ends the first chunk, "ORDER BY" is only complete with the second: both are hits
+    assert inspect(b'x=1 OR', b'DER BY 2').hits == 2
+
+def test_escape_split_across_chunks_is_counted():
+    # The first chunk ends inside %3C, the second one completes it
+    assert inspect(b'q=%3', b'Cscript%3E').hits == inspect(b'q=%3Cscript%3E').hits == 2
+
+def test_json_quotes_are_not_hits():
+    assert inspect(b'{"name": "value", ', b'"other": "it\'s"}').hits == 0
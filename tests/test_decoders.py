@@ -0,0 +1,81 @@
+import gzip
+import os
+import sys
+import zlib
+
+import pytest
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'sources'))
+import decoders
+from decoders import READ_CHUNK, read_body
+
+PAGE = b'<html>' + b'ok ' * 20000 + b'</html>'
+
+class Response(object):
+    '''
+    Stands in for an httplib response: an encoded body read in pieces.
+    '''
+
+    def __init__(self, body, encoding=''):
+        self.body = body
+        self.encoding = encoding
+        self.offset = 0
+        self.reads = 0
+
+    def getheader(self, name, default=None):
+        return self.encoding if name.lower() == 'content-encoding' else default
+
+    def read(self, size):
+        self.reads += 1
+        chunk = self.body[self.offset:self.offset + size]
+        self.offset += size
+        return chunk
+
+def raw_deflate(data):
+    compressor = zlib.compressobj(9, zlib.DEFLATED, -zlib.MAX_WBITS)
+    return compressor.compress(data) + compressor.flush()
+
+@pytest.mark.parametrize('encoding, encode', [
+    ('', lambda data: data),
+    ('gzip', gzip.compress),
+    ('deflate', zlib.compress),
+    ('deflate', raw_deflate),
+])
+def test_body_is_decoded(encoding, encode):
+    assert read_body(Response(encode(PAGE), encoding)) == (PAGE, False, None)
+
+def test_limit_stops_reading():
+    response = Response(PAGE * 10)
+    body, cut, error = read_body(response, 100)
+    assert body == PAGE[:100] and cut and error is None
+    assert response.reads == 1
+
+def test_gzip_bomb_is_cut():
+    bomb = gzip.compress(b'\0' * (64 * 2 ** 20))
+    body, cut, error = read_body(Response(bomb, 'gzip'), 2 ** 20)
+    assert body == b'\0' * 2 ** 20 and cut
+
+class BrokenResponse(Response):
+    '''
+    A connection that fails after the first chunk.
+    '''
+
+    def read(self, size):
+        if self.reads:
+            raise IOError('connection reset')
+        return Response.read(self, size)
+
+def test_broken_stream_returns_what_was_decoded():
+    body, cut, error = read_body(BrokenResponse(PAGE))
+    assert body == PAGE[:READ_CHUNK] and not cut and isinstance(error, IOError)
+
+@pytest.mark.parametrize('output_limit', [False, True])
+def test_br_body_and_bomb(monkeypatch, output_limit):
+    brotli = pytest.importorskip('brotli')
+    if output_limit and not decoders.brotli_output_limit():
+        pytest.skip('brotli < 1.2 has no output_buffer_limit')
+    monkeypatch.setattr(decoders, 'BROTLI_OUTPUT_LIMIT', output_limit)
+    assert read_body(Response(brotli.compress(PAGE), 'br')) == (PAGE, False, None)
+    bomb = brotli.compress(b'\0' * (64 * 2 ** 20), quality=11)
+    body, cut, error = read_body(Response(bomb, 'br'), 2 ** 20)
+    assert body == b'\0' * 2 ** 20 and cut and error is None
@@ -0,0 +1,19 @@
+import os
+
+from endpoint_profiles import build_index, endpoint_key, url_endpoint_key
+from request_features import extract_features
+from score_logs import read_har
+
+logs = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'request_logs')
+
+def test_url_key_matches_interceptor_key():
+    # The interceptor keys on the hostname without the port
+    assert url_endpoint_key('get', 'http://Example.com:8080/item/17?q=1') == endpoint_key('example.com', 'GET', '/item/17?q=1')
+
+def test_profiles_hold_the_interceptor_params():
+    path = os.path.join(logs, 'safe_req2.har')
+    index = build_index([path])
+    for method, url, headers, body, content_type, status, time in read_har(path):
+        features, params = extract_features(method, url, headers, body, content_type)
+        profile = index.profiles[url_endpoint_key(method, url)]
+        assert {name for name, value in params} <= profile.names
@@ -0,0 +1,16 @@
+from header_table import Headers, StringTable
+
+def test_headers_read_like_a_dict():
+    items = [('Host', 'example.com'), ('Accept', '*/*'), ('Host', 'other.com')]
+    headers = Headers(StringTable(), items)
+    expected = dict(items)
+    assert len(headers) == len(expected) == 2
+    assert headers['Host'] == 'other.com'
+    assert dict(headers.items()) == expected and list(headers) == list(expected)
+    assert str(headers) == str(expected)
+
+def test_dict_is_built_once():
+    headers = Headers(StringTable(), [('Host', 'example.com')])
+    len(headers)
+    assert headers._dict is None
+    assert headers.as_dict() is headers.as_dict()
@@ -0,0 +1,24 @@
+import os
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from model_artifact import CompactModel, export_pipeline
+
+pipeline_path = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'implement', 'kmeans_model.pkl')
+
+def test_export_shipped_pipeline(tmp_path):
+    # The pickle needs pycaret's wrappers to load
+    pytest.importorskip('pycaret')
+    import joblib
+    pipeline = joblib.load(pipeline_path)
+    path = str(tmp_path / 'kmeans_model.wafm')
+    export_pipeline(pipeline, path)
+    model = CompactModel(path)
+    assert model.feature_names == [str(name) for name in pipeline.feature_names_in_]
+
+    rng = np.random.default_rng(0)
+    data = pd.DataFrame(rng.integers(0, 5, size=(200, len(model.feature_names))).astype(float), columns=model.feature_names)
+    data.iloc[::7, 0] = np.nan
+    assert (model.predict(model.transform(data)) == pipeline.predict(data)).all()
@@ -0,0 +1,31 @@
+import time
+
+from model_reload import ModelReloader, ReloadDeferred
+
+def wait_for(condition, timeout=2.0):
+    deadline = time.time() + timeout
+    while not condition() and time.time() < deadline:
+        time.sleep(0.01)
+    return condition()
+
+def test_deferred_reload_is_retried(tmp_path):
+    path = tmp_path / 'model.wafm'
+    path.write_text('1')
+    ready = []
+    checked = []
+    swapped = []
+
+    def validate(candidate):
+        checked.append(candidate)
+        if not ready:
+            raise ReloadDeferred('canary not filled yet')
+
+    reloader = ModelReloader(str(path), lambda p: open(p).read(), validate, swapped.append, check_every=0.02)
+    try:
+        path.write_text('22')
+        assert wait_for(lambda: len(checked) >= 3)
+        assert not swapped and reloader.failures == 0
+        ready.append(True)
+        assert wait_for(lambda: swapped == ['22'])
+    finally:
+        reloader.stop()
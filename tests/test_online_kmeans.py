@@ -0,0 +1,37 @@
+import numpy as np
+
+from online_kmeans import OnlineKMeans
+
+def test_partial_fit_updates_once_per_batch():
+    model = OnlineKMeans([[0.0, 0.0], [10.0, 10.0]], [1.0, 1.0], decay=1.0, batch_size=2)
+    model.partial_fit(np.array([2.0, 0.0]))
+    assert model.n_batches == 0 and model.centroids[0].tolist() == [0.0, 0.0]
+    model.partial_fit(np.array([2.0, 0.0]))
+    assert model.n_batches == 1
+    # Two unit-weight points at 2.0 against one unit of history at 0.0
+    assert np.allclose(model.centroids[0], [4.0 / 3, 0.0])
+    assert model.weights.tolist() == [3.0, 1.0]
+    assert model.centroids[1].tolist() == [10.0, 10.0]
+
+def test_weights_decay_every_batch():
+    model = OnlineKMeans([[0.0], [10.0]], [100.0, 100.0], decay=0.5, batch_size=1)
+    model.partial_fit(np.array([10.0]), weight=2.0)
+    assert model.weights.tolist() == [50.0, 52.0]
+    assert model.predict(np.array([1.0])) == 0
+    assert model.is_minority(0) and not model.is_minority(1)
+
+def test_checkpoint_round_trip(tmp_path):
+    path = str(tmp_path / 'online.npz')
+    model = OnlineKMeans([[0.0, 1.0], [5.0, 5.0]], [3.0, 7.0], batch_size=1, base_version='abc123')
+    model.partial_fit(np.array([1.0, 1.0]))
+    model.save(path)
+    restored = OnlineKMeans.load(path, batch_size=1)
+    assert np.array_equal(restored.centroids, model.centroids)
+    assert np.array_equal(restored.weights, model.weights)
+    assert restored.n_batches == 1 and restored.base_version == 'abc123'
+
+def test_checkpoint_without_version_loads(tmp_path):
+    path = str(tmp_path / 'online.npz')
+    np.savez(path, centroids=np.zeros((2, 3)), weights=np.ones(2), n_batches=4)
+    restored = OnlineKMeans.load(path)
+    assert restored.base_version is None and restored.n_batches == 4
@@ -0,0 +1,24 @@
+from param_scanner import iter_body_params
+from request_features import extract_features
+
+def test_deeply_nested_json_is_scored_raw():
+    body = '[' * 5000
+    assert list(iter_body_params(body, 'application/json')) == [('', body)]
+
+def test_deeply_nested_json_does_not_break_featurization():
+    body = '[' * 5000 + "'" + ']' * 5000
+    features, params = extract_features('POST', 'http://example.com/api', {'Content-Type': 'application/json'}, body, 'application/json')
+    assert params == [('', body)]
+    assert features['param_count'] == 1
+
+def test_json_body_is_flattened():
+    params = list(iter_body_params('{"user": {"name": "x", "ids": [1, 2]}}', 'application/json'))
+    assert params == [('user.name', 'x'), ('user.ids[0]', '1'), ('user.ids[1]', '2')]
+
+def test_values_are_decoded_once_per_request():
+    from normalize import CanonicalRequest
+    from request_features import param_scanner
+    canonical = CanonicalRequest('http://example.com/?a=1', "x' OR 1=1")
+    features = param_scanner.scan([('a', "x' OR 1=1"), ('b', "x' OR 1=1")], canonical)
+    assert features['param_sum_score'] == 2 * param_scanner.score(canonical.body)
+    assert canonical.text("x' OR 1=1") is canonical.body and len(canonical.texts) == 2
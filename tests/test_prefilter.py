@@ -0,0 +1,44 @@
+import pytest
+
+from prefilter import Prefilter
+from request_features import sql_keywords, xss_patterns
+
+prefilter = Prefilter(sql_keywords, xss_patterns)
+
+@pytest.mark.parametrize('url', [
+    b'/a?q=&ltscript&gt',        # <script>
+    b'/a?q=documen%74.cookie',   # document.cookie
+    b'/a?uid=1%20%4fR%201=1',    # 1 OR 1=1
+    b"/a?q=%27",
+])
+def test_encoded_payloads_are_escalated(url):
+    assert prefilter.is_suspicious(url)
+
+def test_encoded_payload_in_body_is_escalated():
+    assert prefilter.is_suspicious(b'/login', b'uid=admin%27%20%6fr%20%271%27=%271')
+
+@pytest.mark.parametrize('url', [
+    b'/index.jsp?content=page1.htm',
+    b'/a?x=1&b=2',
+    b'/a?q=hello%20world',
+])
+def test_plain_requests_stay_clean(url):
+    assert not prefilter.is_suspicious(url)
+
+@pytest.mark.parametrize('value', [
+    b'<script>alert(1)</script>',                      # User-Agent
+    b'http://example.com/?q=%3Cscript%3E',              # Referer
+    b'session=abc; x=documen%74.cookie',               # Cookie
+])
+def test_payload_in_header_value_is_escalated(value):
+    assert prefilter.is_suspicious(b'/index.jsp', b'', [b'text/html', value])
+
+def test_ordinary_header_values_stay_clean():
+    header_values = [
+        b'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/118.0 Safari/537.36',
+        b'text/html,application/xhtml+xml,application/xml;q=0.9,*/*;q=0.8',
+        b'"Chromium";v="118", "Google Chrome";v="118"',
+        b'multipart/form-data; boundary=----WebKitFormBoundary7MA4YWxkTrZu0gW',
+        b'JSESSIONID=0A1B2C; lang=en-US',
+    ]
+    assert not prefilter.is_suspicious(b'/index.jsp', b'', header_values)
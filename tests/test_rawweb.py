@@ -0,0 +1,33 @@
+import os
+import sys
+
+import pytest
+
+if sys.version_info[0] > 2:
+    pytest.skip('rawweb (burpy) is Python 2 only, its decoding is tested in test_decoders.py', allow_module_level=True)
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'sources'))
+import rawweb
+
+class Response(object):
+    def __init__(self, body):
+        self.body = body
+        self.offset = 0
+
+    def getheader(self, name, default=None):
+        return default
+
+    def read(self, size):
+        chunk = self.body[self.offset:self.offset + size]
+        self.offset += size
+        return chunk
+
+def craft_res(body, limit=None):
+    return rawweb.RawWeb(u'GET / HTTP/1.1\nHost: example.com\n\n').craft_res(Response(body), limit)
+
+def test_limit_keeps_the_start_of_the_body():
+    assert craft_res(b'x' * (2 * rawweb.DIFF_BODY_BYTES), rawweb.DIFF_BODY_BYTES) == b'x' * rawweb.DIFF_BODY_BYTES
+
+def test_limit_is_capped_at_max_body_bytes(monkeypatch):
+    monkeypatch.setattr(rawweb, 'MAX_BODY_BYTES', 1000)
+    assert len(craft_res(b'x' * 5000, 10 ** 9)) == 1000
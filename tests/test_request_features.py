@@ -0,0 +1,7 @@
+from request_features import FEATURE_COLUMNS, extract_features
+
+def test_feature_columns_match_extracted_features():
+    features, params = extract_features('POST', 'http://example.com/login?next=/', {'Cookie': 'a=1'}, 'uid=1%27&pw=x',
+                                        'application/x-www-form-urlencoded')
+    assert list(features) == FEATURE_COLUMNS
+    assert params == [('next', '/'), ('uid', "1'"), ('pw', 'x')]
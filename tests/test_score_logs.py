@@ -0,0 +1,17 @@
+import os
+
+from request_features import extract_features
+from score_logs import read_har
+
+logs = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'request_logs')
+
+def test_form_bodies_are_rebuilt_from_params():
+    requests = list(read_har(os.path.join(logs, 'sql_attack.har')))
+    posts = [request for request in requests if request[0] == 'POST']
+    assert posts and all(body for method, url, headers, body, *_ in posts)
+
+def test_sql_attack_capture_has_sqli_features():
+    features = [extract_features(method, url, headers, body, content_type)[0]
+                for method, url, headers, body, content_type, status, time in read_har(os.path.join(logs, 'sql_attack.har'))]
+    assert sum(row['has_sql_keywords'] for row in features) > 0
+    assert sum(row['param_max_score'] for row in features) > 0
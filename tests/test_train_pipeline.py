@@ -0,0 +1,42 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+from model_artifact import CompactModel, export_pipeline
+
+def test_train_export_predicts_like_the_model(tmp_path, monkeypatch):
+    pytest.importorskip('pycaret')
+    # pycaret writes logs.log to the working directory
+    monkeypatch.chdir(tmp_path)
+    import train_pipeline
+
+    rng = np.random.default_rng(0)
+    merged = pd.DataFrame(rng.integers(0, 6, size=(300, len(train_pipeline.MODEL_FEATURES))).astype(float),
+                          columns=train_pipeline.MODEL_FEATURES)
+    model, pipeline, clustered = train_pipeline.train(merged, 4, 123)
+    path = str(tmp_path / 'kmeans_model.wafm')
+    export_pipeline(pipeline, path)
+
+    artifact = CompactModel(path)
+    assert artifact.feature_names == train_pipeline.MODEL_FEATURES
+    assert (artifact.predict(artifact.transform(merged)) == model.labels_).all()
+    assert artifact.weights.tolist() == np.bincount(model.labels_, minlength=4).tolist()
+
+def test_dedup_weights_carry_into_the_fit(tmp_path, monkeypatch):
+    pytest.importorskip('pycaret')
+    monkeypatch.chdir(tmp_path)
+    import train_pipeline
+
+    rng = np.random.default_rng(1)
+    merged = pd.DataFrame(rng.integers(0, 6, size=(200, len(train_pipeline.MODEL_FEATURES))).astype(float),
+                          columns=train_pipeline.MODEL_FEATURES)
+    merged['weight'] = rng.integers(1, 20, size=len(merged))
+    model, pipeline, clustered = train_pipeline.train(merged, 3, 123)
+    path = str(tmp_path / 'kmeans_model.wafm')
+    export_pipeline(pipeline, path, merged['weight'])
+
+    artifact = CompactModel(path)
+    labels = artifact.predict(artifact.transform(merged[train_pipeline.MODEL_FEATURES]))
+    assert (labels == model.labels_).all()
+    assert clustered['Cluster'].tolist() == [f"Cluster {label}" for label in labels]
+    assert artifact.weights.tolist() == np.bincount(labels, weights=merged['weight'], minlength=3).tolist()